@@ -0,0 +1,264 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the limit is then enforced per process only.
+    fcntl = None
+
+# Turns allowed to run at once on this instance, across all gunicorn workers.
+MAX_CONCURRENT_TURNS = int(os.environ.get("ADMISSION_MAX_CONCURRENT_TURNS", "8"))
+# Turns allowed to wait in the queue of one worker, and per user.
+MAX_QUEUED_TURNS = int(os.environ.get("ADMISSION_MAX_QUEUED_TURNS", "32"))
+MAX_QUEUED_TURNS_PER_USER = int(os.environ.get("ADMISSION_MAX_QUEUED_TURNS_PER_USER", "2"))
+# Longest a turn waits for a slot before it is answered with 429. Well below gunicorn's --timeout.
+MAX_QUEUE_WAIT_SECONDS = float(os.environ.get("ADMISSION_MAX_QUEUE_WAIT_SECONDS", "60"))
+# Messages up to this length, and replies to a clarification question, are queued with priority.
+SHORT_MESSAGE_CHARS = int(os.environ.get("ADMISSION_SHORT_MESSAGE_CHARS", "80"))
+SLOT_DIR = os.environ.get("ADMISSION_SLOT_DIR", "/tmp/data_agent_admission")
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+# How often the head of the queue retries for a slot freed by another worker.
+_SLOT_POLL_SECONDS = 0.25
+_MAX_TRACKED_SESSIONS = 10000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a turn cannot be admitted; answered with 429 and Retry-After."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionCancelled(Exception):
+    """Raised when a turn is cancelled (or times out) while it waits in the queue."""
+
+
+class _SlotPool:
+    """
+    A counting semaphore shared by the worker processes of an instance.
+
+    Each slot is a lock file held with a non-blocking flock() while a turn runs, so a
+    slot is freed automatically if its worker dies. Slots held by this process are
+    also tracked in memory, since flock() does not exclude threads sharing a file.
+    """
+
+    def __init__(self, slot_dir: str, size: int):
+        self.size = size
+        self._files = []
+        self._held: set[int] = set()
+        self._paths = []
+        if fcntl is not None:
+            os.makedirs(slot_dir, exist_ok=True)
+            self._paths = [os.path.join(slot_dir, f"slot-{i}.lock") for i in range(size)]
+        self._pid = None
+
+    def _ensure_files(self) -> None:
+        # Files are opened per process: descriptors inherited over fork would share locks.
+        if self._pid != os.getpid():
+            self._files = [open(path, "a") for path in self._paths]
+            self._held = set()
+            self._pid = os.getpid()
+
+    def try_acquire(self) -> int | None:
+        """Returns a held slot number, or None if all slots are busy. Caller holds the controller lock."""
+        if fcntl is None:
+            for i in range(self.size):
+                if i not in self._held:
+                    self._held.add(i)
+                    return i
+            return None
+        self._ensure_files()
+        for i, lock_file in enumerate(self._files):
+            if i in self._held:
+                continue
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue
+            self._held.add(i)
+            return i
+        return None
+
+    def release(self, slot: int) -> None:
+        if fcntl is not None and self._pid == os.getpid():
+            fcntl.flock(self._files[slot], fcntl.LOCK_UN)
+        self._held.discard(slot)
+
+
+class _Ticket:
+    __slots__ = ("user_id", "priority", "enqueued_at", "started_at", "slot")
+
+    def __init__(self, user_id: str, priority: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.slot = None
+
+
+class AdmissionController:
+    """
+    Admits chat turns under a global concurrency limit with per-user fair queueing.
+
+    Turns that cannot start immediately wait in this worker's queue. Waiting turns
+    are ordered by priority (short messages and replies to a clarification question
+    first), and within a priority round-robin across users, so one user with many
+    open tabs cannot starve the others. A turn that would overflow the queue, or
+    waits longer than MAX_QUEUE_WAIT_SECONDS, is rejected with a Retry-After hint
+    instead of running into gunicorn's worker timeout.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_TURNS, max_queued: int = MAX_QUEUED_TURNS,
+                 max_queued_per_user: int = MAX_QUEUED_TURNS_PER_USER, max_wait_seconds: float = MAX_QUEUE_WAIT_SECONDS,
+                 slot_dir: str = SLOT_DIR):
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait_seconds = max_wait_seconds
+        self._slots = _SlotPool(slot_dir, max_concurrent)
+        self._cond = threading.Condition()
+        # priority -> user_id -> tickets (FIFO), and priority -> users in round-robin order.
+        self._queues = {p: {} for p in (PRIORITY_HIGH, PRIORITY_NORMAL)}
+        self._rotation = {p: collections.deque() for p in (PRIORITY_HIGH, PRIORITY_NORMAL)}
+        self._queued = 0
+        self._running = 0
+        self._clarification_sessions = collections.OrderedDict()
+        self._counters = {"admitted": 0, "admitted_high_priority": 0, "rejected_queue_full": 0, "rejected_timeout": 0,
+                          "cancelled_waiting": 0}
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+        self._turn_seconds_total = 0.0
+        self._turns_finished = 0
+
+    # --- Priority ---
+
+    def priority_for(self, session_id: str, message_text: str) -> int:
+        """Short messages and answers to a clarification question get priority."""
+        if self._clarification_sessions.get(session_id) or len(message_text or "") <= SHORT_MESSAGE_CHARS:
+            return PRIORITY_HIGH
+        return PRIORITY_NORMAL
+
+    def note_turn_result(self, session_id: str, clarification_asked: bool) -> None:
+        """Remembers whether a session's last turn ended with a clarification question."""
+        with self._cond:
+            self._clarification_sessions.pop(session_id, None)
+            if clarification_asked:
+                self._clarification_sessions[session_id] = True
+                while len(self._clarification_sessions) > _MAX_TRACKED_SESSIONS:
+                    self._clarification_sessions.popitem(last=False)
+
+    # --- Queue ---
+
+    def _head(self) -> _Ticket | None:
+        for priority in (PRIORITY_HIGH, PRIORITY_NORMAL):
+            rotation = self._rotation[priority]
+            if rotation:
+                return self._queues[priority][rotation[0]][0]
+        return None
+
+    def _remove(self, ticket: _Ticket) -> None:
+        queues, rotation = self._queues[ticket.priority], self._rotation[ticket.priority]
+        user_queue = queues[ticket.user_id]
+        user_queue.remove(ticket)
+        rotation.remove(ticket.user_id)
+        if user_queue:
+            rotation.append(ticket.user_id)  # The user's next turn goes to the back of the round.
+        else:
+            del queues[ticket.user_id]
+        self._queued -= 1
+
+    def _retry_after(self) -> int:
+        avg_turn = self._turn_seconds_total / self._turns_finished if self._turns_finished else 30.0
+        return max(1, int(avg_turn * (self._queued + 1) / max(1, self._slots.size)))
+
+    def acquire(self, user_id: str, priority: int = PRIORITY_NORMAL, cancel_event: threading.Event | None = None) -> _Ticket:
+        """
+        Blocks until the turn may run.
+
+        Args:
+            user_id: The user the turn belongs to, for per-user limits and round-robin.
+            priority: PRIORITY_HIGH or PRIORITY_NORMAL (see `priority_for()`).
+            cancel_event: An optional event set when the turn is cancelled or times out
+                (e.g. `TurnContext.cancel_event`); the turn then leaves the queue.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait exceeds MAX_QUEUE_WAIT_SECONDS.
+            AdmissionCancelled: If `cancel_event` was set while the turn waited.
+        """
+        ticket = _Ticket(user_id or "", priority)
+        with self._cond:
+            user_queued = sum(len(q.get(ticket.user_id, ())) for q in self._queues.values())
+            if self._queued >= self.max_queued or user_queued >= self.max_queued_per_user:
+                self._counters["rejected_queue_full"] += 1
+                scope = "The server" if self._queued >= self.max_queued else "You already have turns waiting; the server"
+                raise AdmissionRejected(f"{scope} is busy. Please retry shortly.", self._retry_after())
+
+            self._queues[priority].setdefault(ticket.user_id, collections.deque()).append(ticket)
+            if ticket.user_id not in self._rotation[priority]:
+                self._rotation[priority].append(ticket.user_id)
+            self._queued += 1
+
+            deadline = ticket.enqueued_at + self.max_wait_seconds
+            while True:
+                if self._head() is ticket:
+                    ticket.slot = self._slots.try_acquire()
+                    if ticket.slot is not None:
+                        self._remove(ticket)
+                        break
+                if cancel_event is not None and cancel_event.is_set():
+                    self._remove(ticket)
+                    self._counters["cancelled_waiting"] += 1
+                    self._cond.notify_all()
+                    raise AdmissionCancelled("The turn was cancelled while waiting in the queue.")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._remove(ticket)
+                    self._counters["rejected_timeout"] += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected("The server is busy. Please retry shortly.", self._retry_after())
+                self._cond.wait(timeout=min(remaining, _SLOT_POLL_SECONDS))
+
+            ticket.started_at = time.monotonic()
+            waited = ticket.started_at - ticket.enqueued_at
+            self._running += 1
+            self._counters["admitted"] += 1
+            if priority == PRIORITY_HIGH:
+                self._counters["admitted_high_priority"] += 1
+            self._wait_seconds_total += waited
+            self._wait_seconds_max = max(self._wait_seconds_max, waited)
+            self._cond.notify_all()  # A new head may be able to take another free slot.
+        if waited > 1:
+            logging.info(f"Admitted turn of user '{user_id}' after waiting {waited:.2f} seconds in the queue.")
+        return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        """Frees the ticket's slot and wakes up the queue."""
+        with self._cond:
+            self._slots.release(ticket.slot)
+            self._running -= 1
+            self._turns_finished += 1
+            self._turn_seconds_total += time.monotonic() - ticket.started_at
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Returns queue depth, running turns and wait times of this worker."""
+        with self._cond:
+            admitted = self._counters["admitted"]
+            return {
+                "max_concurrent_turns": self._slots.size,
+                "running": self._running,
+                "queue_depth": self._queued,
+                "queue_depth_high_priority": sum(len(q) for q in self._queues[PRIORITY_HIGH].values()),
+                **self._counters,
+                "avg_wait_seconds": round(self._wait_seconds_total / admitted, 3) if admitted else 0.0,
+                "max_wait_seconds": round(self._wait_seconds_max, 3),
+                "avg_turn_seconds": round(self._turn_seconds_total / self._turns_finished, 2) if self._turns_finished else None,
+            }
+
+
+ADMISSION = AdmissionController()
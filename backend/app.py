@@ -1,12 +1,15 @@
 import os
 import logging
 import sys
+# Imported first, so that STARTUP_PROFILE=1 times all of the imports below.
+from backend.startup_profile import STARTUP_PROFILER
+import asyncio
 import functools
 import time
 import sqlalchemy
 import collections
 import uuid
-from flask import Flask, send_from_directory, abort, jsonify, request, current_app
+from flask import Flask, send_from_directory, send_file, abort, jsonify, request, current_app
 from dotenv import load_dotenv
 import json
 import pprint
@@ -21,15 +24,31 @@ logging.basicConfig(
 
 # --- Import other modules after logging is set up ---
 from backend.utils import get_table_description, get_table_ddl_strings, get_total_rows, get_total_column_count, fetch_sample_data_for_single_table
+from backend.static_assets import StaticAssetManifest
+from backend.admission import ADMISSION, AdmissionCancelled, AdmissionRejected
+from backend.jobs import JOBS, JobRejected
+from backend.sessions import SESSIONS, KIND_EPHEMERAL, KIND_INTERACTIVE
 try:
-    from data_agent.agent import root_agent
+    from data_agent.constants import DEFAULT_DATASET_ID, DATASET_PROFILES
+    from data_agent.registry import REGISTRY, ACTIVE_DATASET_ID, UnknownDatasetError
+    from data_agent.context_cache import CONTEXT_CACHE
+    from data_agent.budget import BUDGET, BudgetExceededError
+    from data_agent.single_flight import QUERY_COALESCER
+    from data_agent.routing import MODEL_ROUTER
+    from data_agent.turn_context import CURRENT_TURN, TurnContext
+    from data_agent.result_channel import encode_results
     from google.adk.runners import Runner
     from google.adk.sessions.database_session_service import DatabaseSessionService
     from google.adk.sessions.in_memory_session_service import InMemorySessionService
     from google.genai import types as genai_types
 except ImportError as e:
     logging.critical(f"A critical module could not be imported. The app cannot start. Error: {e}")
-    root_agent = Runner = DatabaseSessionService = InMemorySessionService = genai_types = None
+    Runner = DatabaseSessionService = InMemorySessionService = genai_types = None
+    REGISTRY = ACTIVE_DATASET_ID = UnknownDatasetError = DEFAULT_DATASET_ID = DATASET_PROFILES = CONTEXT_CACHE = None
+    BUDGET = BudgetExceededError = CURRENT_TURN = TurnContext = QUERY_COALESCER = MODEL_ROUTER = None
+    encode_results = None
+
+STARTUP_PROFILER.mark("imports")
 
 # Load environment variables from a .env file if it exists
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
@@ -37,7 +56,13 @@ load_dotenv(dotenv_path)
 
 def create_app():
     """Application Factory Function"""
-    app = Flask(__name__, static_folder='../frontend/build', static_url_path='/')
+    # 'manifest' serves the React build from an in-memory manifest with pre-compressed
+    # variants and long-lived caching; 'flask' keeps Flask's default static file handling.
+    static_asset_mode = os.environ.get('STATIC_ASSET_MODE', 'manifest').lower()
+    if static_asset_mode == 'manifest':
+        app = Flask(__name__, static_folder=None)
+    else:
+        app = Flask(__name__, static_folder='../frontend/build', static_url_path='/')
 
     def cache(timeout=3600):
         def decorator(f):
@@ -57,20 +82,29 @@ def create_app():
         return decorator
 
     APP_NAME = "data_agent_chatbot"
+    # The agent of the default dataset (used by the ADK CLI as `root_agent`); building it
+    # fetches the catalog metadata and data profiles and renders the instructions.
+    with STARTUP_PROFILER.phase("agent_build"):
+        root_agent = REGISTRY.get(DEFAULT_DATASET_ID).agent if REGISTRY else None
     if all([Runner, InMemorySessionService, root_agent]):
         try:
-            db_url = "sqlite:///./my_agent_data.db"
-            engine = sqlalchemy.create_engine(db_url)
-            engine.connect()
-            logging.info("Database connection successful.")
-            session_service = DatabaseSessionService(db_url=db_url)
+            with STARTUP_PROFILER.phase("session_setup"):
+                db_url = "sqlite:///./my_agent_data.db"
+                engine = sqlalchemy.create_engine(db_url)
+                engine.connect()
+                logging.info("Database connection successful.")
+                session_service = DatabaseSessionService(db_url=db_url)
+                SESSIONS.configure(session_service, db_url, APP_NAME)
         except Exception as e:
             logging.warning(f"Failed to connect to the database, falling back to in-memory session: {e}")
             session_service = InMemorySessionService()
+            SESSIONS.configure(session_service, None, APP_NAME)
 
         try:
-            runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service)
+            with STARTUP_PROFILER.phase("runner_setup"):
+                runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service)
             app.runner = runner
+            app.runners = {DEFAULT_DATASET_ID: runner}
             app.session_service = session_service
             app.genai_types = genai_types
             logging.info("ADK Runner initialized successfully and attached to app.")
@@ -81,10 +115,34 @@ def create_app():
         logging.critical("ADK Runner could not be initialized due to missing components.")
         app.runner = None
 
+    def get_runner(dataset_id):
+        """Returns the ADK Runner for a dataset; its agent is built on first use by the registry."""
+        resources = REGISTRY.get(dataset_id)
+        runner = app.runners.get(dataset_id)
+        if runner is None or runner.agent is not resources.agent:
+            runner = Runner(app_name=APP_NAME, agent=resources.agent, session_service=app.session_service)
+            app.runners[dataset_id] = runner
+            # Drop runners of datasets the registry has evicted, so their agents can be freed.
+            resident = {r.dataset_id for r in REGISTRY.resident()}
+            for stale_id in [d for d in app.runners if d not in resident]:
+                del app.runners[stale_id]
+        return runner
+
+    @app.before_request
+    def start_metadata_refresh():
+        # Started from the first request of each worker, not while the app is created, so a
+        # gunicorn --preload master process does not poll the catalog for the life of the server.
+        if REGISTRY:
+            REGISTRY.ensure_refresher()
+
     frontend_build_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'build'))
     if not os.path.isdir(frontend_build_path):
         logging.warning(f"React build directory not found at {frontend_build_path}.")
     app.config['FRONTEND_BUILD_DIR'] = frontend_build_path
+    app.config['STATIC_ASSET_MANIFEST'] = None
+    if static_asset_mode == 'manifest' and os.path.isdir(frontend_build_path):
+        with STARTUP_PROFILER.phase("static_assets"):
+            app.config['STATIC_ASSET_MANIFEST'] = StaticAssetManifest(frontend_build_path)
 
     # --- API Routes ---
 
@@ -100,6 +158,7 @@ def create_app():
             return jsonify({"error": "user_id is required"}), 400
         try:
             session = session_service.create_session(app_name=runner.app_name, user_id=user_id)
+            SESSIONS.register(user_id, session.id, KIND_INTERACTIVE)
             logging.info(f"New session created for user '{user_id}' with session_id: {session.id}")
             return jsonify({"session_id": session.id, "user_id": user_id}), 200
         except Exception as e:
@@ -111,44 +170,59 @@ def create_app():
         req_data = request.get_json()
         user_id = req_data.get('user_id')
         session_id = req_data.get('session_id')
+        if user_id and session_id:
+            SESSIONS.end(user_id, session_id)
         logging.info(f"User '{user_id}' logged out of session '{session_id}'.")
         return jsonify({"message": "Logout successful"}), 200
     
 
-    @app.route("/api/chat", methods=["POST"])
-    async def chat_handler():
-        """Handles a chat turn with the ADK agent and logs KPIs."""
-        start_time = time.time()
-        kpi_data = collections.defaultdict(lambda: "N/A")
-
-        runner = current_app.runner
-        session_service = current_app.session_service
-        genai_types = current_app.genai_types
-        if not all([runner, session_service, genai_types]):
-            return jsonify({"error": "Chat components not initialized on the server."}), 500
-        
-        session_id = None
-        user_id = None
-        try:
-            req_data = request.get_json()
-            user_id = req_data.get('user_id')
-            session_id = req_data.get('session_id')
-            message_text = req_data.get('message', {}).get('message')
-            logging.info(f"======> [CHAT_NEW_REQUEST_STARTS] from user '{user_id}' in session '{session_id}': {message_text}")
+    async def process_chat_turn(turn, message_text, kpi_data, on_started=None, result_format=None):
+        """
+        Runs one chat turn: budget and admission checks, the agent run and KPI collection.
+        Used by /api/chat and by asynchronous chat jobs (see backend/jobs.py).
 
-            kpi_data.update({"user_id": user_id, "session_id": session_id, "question": message_text})
+        Returns:
+            The chat response payload. Query results are in 'results', encoded as
+            `result_format` ('json' or 'arrow', see data_agent/result_channel.py); the SQL
+            message of a query carries the 'result_id' of its result.
 
-            if not all([user_id, session_id, message_text]):
-                return jsonify({"error": "user_id, session_id, and message are required"}), 400
+        Raises:
+            UnknownDatasetError, BudgetExceededError, AdmissionRejected.
+        """
+        runner = get_runner(turn.dataset_id)
+        SESSIONS.touch(turn.user_id, turn.session_id)
+        dataset_token = ACTIVE_DATASET_ID.set(turn.dataset_id)
+        turn_token = CURRENT_TURN.set(turn)
+        admission_ticket = None
+        try:
+            await BUDGET.admit(turn)
+            priority = ADMISSION.priority_for(turn.session_id, message_text)
+            try:
+                admission_ticket = ADMISSION.acquire(turn.user_id, priority, cancel_event=turn.cancel_event)
+            except AdmissionCancelled:
+                # Ends an async chat job as cancelled or timed out (see backend/jobs.py).
+                raise asyncio.CancelledError(turn.cancel_reason)
+            kpi_data["queue_wait_seconds"] = round(admission_ticket.started_at - admission_ticket.enqueued_at, 3)
+            if on_started is not None:
+                on_started()
+            # The prompt version the turn starts with, so answers can be linked to the metadata they used.
+            prompt_version = REGISTRY.get(turn.dataset_id).prompt_version
+            kpi_data["prompt_version"] = prompt_version
             
             final_response_parts, llm_response_text = [], ""
             kpi_data["llm_round_trips"] = 0
+            sql_message, linked_results = None, 0
             
             async for event in runner.run_async(
-                user_id=user_id,
-                session_id=session_id,
+                user_id=turn.user_id,
+                session_id=turn.session_id,
                 new_message=genai_types.Content(parts=[genai_types.Part(text=message_text)], role='user')
             ):
+                # Link the result of the query that just ran to the SQL message that shows it.
+                if len(turn.results) > linked_results and sql_message is not None:
+                    sql_message["result_id"] = turn.results[-1].id
+                    linked_results = len(turn.results)
+
                 if event.error_code:
                     final_response_parts.append({"role": "assistant", "content": "I'm sorry, I encountered a technical issue...{event.error_code}"})
                     kpi_data["agent_error"] = event.error_code
@@ -180,15 +254,72 @@ def create_app():
                         if sql_in_this_turn:
                             # If there's SQL, this is a tool-using turn. Display ONLY the SQL.
                             formatted_sql = f"```sql\n{sql_in_this_turn}\n```"
-                            final_response_parts.append({"role": "model", "content": formatted_sql})
+                            sql_message = {"role": "model", "content": formatted_sql}
+                            final_response_parts.append(sql_message)
                         elif text_in_this_turn:
                             # If there is NO SQL in this turn, it must be the final text answer. Display it.
                             final_response_parts.append({"role": "model", "content": text_in_this_turn})
 
             kpi_data["clarification_asked"] = True if kpi_data["generated_sql"] == "N/A" and llm_response_text else False
-            logging.info(f"======> [CHAT_NEW_REQUEST_ENDS] from user '{user_id}' : {final_response_parts}")
-            return jsonify({"session_id": session_id, "messages": final_response_parts}), 200
+            kpi_data.update(turn.usage())
+            kpi_data["model_routing"] = turn.routing
+            ADMISSION.note_turn_result(turn.session_id, kpi_data["clarification_asked"])
+            logging.info(f"======> [CHAT_NEW_REQUEST_ENDS] from user '{turn.user_id}' : {final_response_parts}")
+            kpi_data["result_rows"] = sum(r.total_rows for r in turn.results)
+            return {"session_id": turn.session_id, "messages": final_response_parts, "prompt_version": prompt_version,
+                    "usage": turn.usage(), "results": encode_results(turn.results, result_format)}
+        finally:
+            if admission_ticket is not None:
+                ADMISSION.release(admission_ticket)
+            CURRENT_TURN.reset(turn_token)
+            ACTIVE_DATASET_ID.reset(dataset_token)
+
+    @app.route("/api/chat", methods=["POST"])
+    async def chat_handler():
+        """
+        Handles a chat turn with the ADK agent and logs KPIs.
+        Optional body field "result_format": 'json' (default) or 'arrow', the encoding of the query results.
+        """
+        start_time = time.time()
+        kpi_data = collections.defaultdict(lambda: "N/A")
+
+        runner = current_app.runner
+        session_service = current_app.session_service
+        genai_types = current_app.genai_types
+        if not all([runner, session_service, genai_types]):
+            return jsonify({"error": "Chat components not initialized on the server."}), 500
+        
+        session_id = None
+        user_id = None
+        try:
+            req_data = request.get_json()
+            user_id = req_data.get('user_id')
+            session_id = req_data.get('session_id')
+            dataset_id = req_data.get('dataset_id') or DEFAULT_DATASET_ID
+            message_text = req_data.get('message', {}).get('message')
+            logging.info(f"======> [CHAT_NEW_REQUEST_STARTS] from user '{user_id}' in session '{session_id}' on dataset '{dataset_id}': {message_text}")
+
+            kpi_data.update({"user_id": user_id, "session_id": session_id, "dataset_id": dataset_id, "question": message_text})
+
+            if not all([user_id, session_id, message_text]):
+                return jsonify({"error": "user_id, session_id, and message are required"}), 400
+
+            turn = TurnContext(user_id=user_id, session_id=session_id, dataset_id=dataset_id)
+            return jsonify(await process_chat_turn(turn, message_text, kpi_data, result_format=req_data.get('result_format'))), 200
 
+        except UnknownDatasetError:
+            return jsonify({"error": f"Unknown dataset_id '{dataset_id}'."}), 400
+        except BudgetExceededError as e:
+            logging.warning(f"Chat turn of user '{user_id}' refused by the usage budget: {e}")
+            response = jsonify({"session_id": session_id or "", "messages": [], "error": str(e), "budget_rule": e.rule})
+            if e.retry_after:
+                response.headers["Retry-After"] = str(e.retry_after)
+            return response, 429
+        except AdmissionRejected as e:
+            logging.warning(f"Chat turn of user '{user_id}' not admitted: {e}")
+            response = jsonify({"session_id": session_id or "", "messages": [], "error": str(e)})
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response, 429
         except Exception as e:
             kpi_data["server_error"] = str(e)
             logging.error(f"Error during chat processing: {str(e)}", exc_info=True)
@@ -223,6 +354,81 @@ def create_app():
             logging.info(log_summary)
             """
 
+    @app.route("/api/chat/jobs", methods=["POST"])
+    def submit_chat_job():
+        """
+        Starts a chat turn as an asynchronous job and returns its id at once (202).
+        The body is the same as for /api/chat. Poll GET /api/chat/jobs/<job_id> for the
+        answer, or cancel it with POST /api/chat/jobs/<job_id>/cancel.
+        """
+        if not all([current_app.runner, current_app.session_service, current_app.genai_types]):
+            return jsonify({"error": "Chat components not initialized on the server."}), 500
+        req_data = request.get_json() or {}
+        user_id = req_data.get('user_id')
+        session_id = req_data.get('session_id')
+        dataset_id = req_data.get('dataset_id') or DEFAULT_DATASET_ID
+        message_text = (req_data.get('message') or {}).get('message')
+        if not all([user_id, session_id, message_text]):
+            return jsonify({"error": "user_id, session_id, and message are required"}), 400
+        if dataset_id not in DATASET_PROFILES:
+            return jsonify({"error": f"Unknown dataset_id '{dataset_id}'."}), 400
+
+        kpi_data = collections.defaultdict(lambda: "N/A")
+        kpi_data.update({"user_id": user_id, "session_id": session_id, "dataset_id": dataset_id, "question": message_text})
+
+        async def run_turn(turn, on_started):
+            return await process_chat_turn(turn, message_text, kpi_data, on_started=on_started,
+                                           result_format=req_data.get('result_format'))
+
+        try:
+            turn = TurnContext(user_id=user_id, session_id=session_id, dataset_id=dataset_id)
+            job_id = JOBS.submit(user_id, session_id, dataset_id, turn, run_turn)
+        except JobRejected as e:
+            response = jsonify({"error": str(e)})
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response, 429
+        except Exception as e:
+            logging.error(f"Could not submit a chat job for user '{user_id}': {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+        response = jsonify({"job_id": job_id, "status": "queued", "session_id": session_id})
+        response.headers["Location"] = f"/api/chat/jobs/{job_id}?user_id={user_id}"
+        return response, 202
+
+    @app.route("/api/chat/jobs/<job_id>", methods=["GET"])
+    def get_chat_job(job_id):
+        """
+        Returns the status of a chat job, and its chat response once it succeeded.
+        URL - /api/chat/jobs/<job_id>?user_id=...&wait=20 (optional: wait up to 20 seconds for the job to finish)
+        """
+        user_id = request.args.get("user_id")
+        if not user_id:
+            return jsonify({"error": "user_id is required"}), 400
+        try:
+            job = JOBS.wait(job_id, user_id, float(request.args.get("wait", 0) or 0))
+        except ValueError:
+            return jsonify({"error": "wait must be a number of seconds"}), 400
+        except Exception as e:
+            logging.error(f"Error reading chat job {job_id}: {str(e)}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job), 200
+
+    @app.route("/api/chat/jobs/<job_id>/cancel", methods=["POST"])
+    def cancel_chat_job(job_id):
+        """Cancels a chat job: its agent run stops and its running BigQuery jobs are cancelled."""
+        user_id = (request.get_json(silent=True) or {}).get('user_id') or request.args.get("user_id")
+        if not user_id:
+            return jsonify({"error": "user_id is required"}), 400
+        try:
+            job = JOBS.cancel(job_id, user_id)
+        except Exception as e:
+            logging.error(f"Error cancelling chat job {job_id}: {str(e)}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job), 200
+
     @app.route("/api/tables", methods=["GET"])
     @cache(timeout=3600)
     def list_tables():
@@ -252,6 +458,46 @@ def create_app():
             logging.error(f"Error getting table data for {table_name}: {str(e)}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
 
+    @app.route("/api/metrics", methods=["GET"])
+    def get_metrics():
+        """Returns in-process performance counters of the agent's local helpers."""
+        metrics = {"pid": os.getpid(), "admission": ADMISSION.stats(), "chat_jobs": JOBS.stats(), "sessions": SESSIONS.stats()}
+        if REGISTRY:
+            metrics["agent_registry"] = REGISTRY.stats()
+            metrics["datasets"] = {
+                resources.dataset_id: {
+                    "sql_validator": resources.schema_validator.stats(),
+                    "partition_pruning": resources.pruning_analyzer.stats(),
+                    "join_graph": resources.join_graph.stats(),
+                    "value_index": resources.value_index.stats(),
+                }
+                for resources in REGISTRY.resident()
+            }
+            metrics["context_cache"] = CONTEXT_CACHE.stats()
+            metrics["budget"] = BUDGET.stats()
+            metrics["query_coalescing"] = QUERY_COALESCER.stats()
+            metrics["model_routing"] = MODEL_ROUTER.stats()
+        return jsonify(metrics), 200
+
+    @app.route("/api/usage", methods=["GET"])
+    def get_usage():
+        """
+        Returns token and bytes-billed usage against the budgets.
+        URL - /api/usage?user_id=...&session_id=... (both optional; global budgets are always included)
+        """
+        if not BUDGET:
+            return jsonify({"error": "Usage metering not initialized on the server."}), 500
+        user_id = request.args.get("user_id")
+        session_id = request.args.get("session_id")
+        try:
+            budgets = BUDGET.usage(user_id=user_id, session_id=session_id)
+            decision = BUDGET.evaluate(user_id, session_id)
+            return jsonify({"user_id": user_id, "session_id": session_id, "enabled": BUDGET.enabled,
+                            "status": decision.action, "reasons": decision.reasons, "budgets": budgets}), 200
+        except Exception as e:
+            logging.error(f"Error reading usage: {str(e)}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
     @app.route("/api/code", methods=["GET"])
     def get_code_file():
         filepath = request.args.get("filepath")
@@ -273,6 +519,9 @@ def create_app():
         """
         An unauthenticated endpoint for internal testing.
         URL - http://127.0.0.1:8080/api/test_query?user_id=internal_tester&question=...
+
+        The run is a regular turn of the default dataset: it goes through the usage budget
+        and admission control, and its tokens and bytes billed are metered like a chat turn.
         """
         user_id = request.args.get("user_id")
         question = request.args.get("question")
@@ -280,10 +529,17 @@ def create_app():
         runner, genai_types, session_service = current_app.runner, current_app.genai_types, current_app.session_service
         if not all([runner, genai_types, session_service]): return jsonify({"error": "Chat components not initialized on the server."}), 500
 
-        generated_sql, agent_error, llm_response = None, None, ""
+        generated_sql, agent_error, llm_response, temp_session = None, None, "", None
+        admission_ticket, dataset_token, turn_token = None, None, None
         try:
             temp_session = session_service.create_session(app_name=runner.app_name, user_id=user_id)
+            SESSIONS.register(user_id, temp_session.id, KIND_EPHEMERAL)
             logging.debug(f"[TEST_ENDPOINT] Created temporary session_id: {temp_session.id}")
+            turn = TurnContext(user_id=user_id, session_id=temp_session.id, dataset_id=DEFAULT_DATASET_ID)
+            dataset_token = ACTIVE_DATASET_ID.set(turn.dataset_id)
+            turn_token = CURRENT_TURN.set(turn)
+            await BUDGET.admit(turn)
+            admission_ticket = ADMISSION.acquire(user_id, ADMISSION.priority_for(turn.session_id, question))
             new_message = genai_types.Content(parts=[genai_types.Part(text=question)], role='user')
             async for event in runner.run_async(user_id=user_id, session_id=temp_session.id, new_message=new_message):
                 if event.error_code:
@@ -301,13 +557,43 @@ def create_app():
             if not generated_sql and llm_response:
                 return jsonify({"status": "ClarificationNeeded", "clarification_question": llm_response.strip()}), 200
             return jsonify({"status": "Success", "generated_sql": generated_sql or "No SQL was generated."}), 200
+        except (BudgetExceededError, AdmissionRejected) as e:
+            logging.warning(f"Test query of user '{user_id}' not admitted: {e}")
+            response = jsonify({"error": str(e)})
+            if e.retry_after:
+                response.headers["Retry-After"] = str(e.retry_after)
+            return response, 429
         except Exception as e:
             logging.error(f"Error in test_query endpoint: {e}", exc_info=True)
             return jsonify({"error": f"An internal server error occurred: {str(e)}"}), 500
+        finally:
+            if admission_ticket is not None:
+                ADMISSION.release(admission_ticket)
+            if turn_token is not None:
+                CURRENT_TURN.reset(turn_token)
+            if dataset_token is not None:
+                ACTIVE_DATASET_ID.reset(dataset_token)
+            if temp_session is not None:
+                SESSIONS.end(user_id, temp_session.id, reason="deleted_ephemeral")
 
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve_react_app(path):
+        manifest = current_app.config.get('STATIC_ASSET_MANIFEST')
+        if manifest:
+            status, body, headers, asset = manifest.negotiate(
+                path,
+                accept_encoding=request.headers.get('Accept-Encoding', ''),
+                if_none_match=request.headers.get('If-None-Match', '')
+            )
+            if status == 404: return abort(404, description="React application build not found.")
+            if status == 200 and body is None:
+                # Large files are not held in memory; stream them from disk.
+                response = send_file(asset.file_path, mimetype=asset.mimetype, conditional=False)
+                response.headers.update(headers)
+                return response
+            return current_app.response_class(body, status=status, headers=headers)
+
         build_dir = current_app.config.get('FRONTEND_BUILD_DIR')
         if not build_dir: return abort(404, description="React application build directory not found.")
         if path != "" and os.path.exists(os.path.join(build_dir, path)):
@@ -318,6 +604,7 @@ def create_app():
     return app
 
 app = create_app()
+STARTUP_PROFILER.finish()
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8080))
@@ -0,0 +1,303 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import sqlalchemy
+from data_agent.utils import start_periodic_task
+
+# SQLAlchemy URL of the job table, shared by the gunicorn workers of an instance.
+JOBS_DB_URL = os.environ.get("CHAT_JOBS_DB_URL", "sqlite:///./chat_jobs.db")
+# Longest a job may run (including its wait for an admission slot) before it is cancelled.
+JOB_TIMEOUT_SECONDS = float(os.environ.get("CHAT_JOB_TIMEOUT_SECONDS", "900"))
+# Jobs queued or running at once on this instance; further submissions are answered with 429.
+MAX_ACTIVE_JOBS = int(os.environ.get("CHAT_JOBS_MAX_ACTIVE", "64"))
+# Finished jobs are kept this long for polling, and at most MAX_STORED_JOBS rows overall.
+JOB_RETENTION_SECONDS = float(os.environ.get("CHAT_JOB_RETENTION_SECONDS", str(60 * 60)))
+MAX_STORED_JOBS = int(os.environ.get("CHAT_JOBS_MAX_STORED", "5000"))
+# How often each worker checks its running jobs for cancel requests and timeouts.
+WATCH_INTERVAL_SECONDS = 1.0
+# Longest a GET /api/chat/jobs/<id>?wait=... request blocks. Well below gunicorn's --timeout.
+MAX_POLL_WAIT_SECONDS = 30.0
+_POLL_INTERVAL_SECONDS = 0.5
+_PRUNE_INTERVAL_SECONDS = 60
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+STATUS_TIMED_OUT = "timed_out"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+
+class JobRejected(Exception):
+    """Raised when a job cannot be submitted; answered with 429 and Retry-After."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _LocalJob:
+    """A job running in this worker: its thread's event loop, its task and its turn."""
+
+    __slots__ = ("job_id", "turn", "loop", "task", "deadline", "thread")
+
+    def __init__(self, job_id: str, turn, deadline: float):
+        self.job_id = job_id
+        self.turn = turn
+        self.deadline = deadline
+        self.loop = None
+        self.task = None
+        self.thread = None
+
+
+class ChatJobManager:
+    """
+    Runs chat turns as asynchronous jobs.
+
+    A job is stored in a small SQL table shared by all gunicorn workers, so it can be
+    polled and cancelled through any worker. The turn runs on its own thread and event
+    loop in the worker that accepted it. A watcher thread in each worker cancels its
+    jobs when a cancel request is stored (by any worker) or the job exceeds
+    JOB_TIMEOUT_SECONDS. Cancelling a job cancels its agent run (the asyncio task) and
+    the BigQuery jobs the turn started (see TurnContext.cancel()), so an abandoned
+    question stops billing. Finished jobs are pruned after JOB_RETENTION_SECONDS.
+    """
+
+    def __init__(self, db_url: str = JOBS_DB_URL, timeout_seconds: float = JOB_TIMEOUT_SECONDS,
+                 max_active: int = MAX_ACTIVE_JOBS, max_stored: int = MAX_STORED_JOBS):
+        self.db_url = db_url
+        self.timeout_seconds = timeout_seconds
+        self.max_active = max_active
+        self.max_stored = max_stored
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._local: dict[str, _LocalJob] = {}
+        self._counters = {"submitted": 0, "rejected": 0, STATUS_SUCCEEDED: 0, STATUS_FAILED: 0,
+                          STATUS_CANCELLED: 0, STATUS_TIMED_OUT: 0}
+        self._metadata = sqlalchemy.MetaData()
+        self._jobs = sqlalchemy.Table(
+            "chat_jobs", self._metadata,
+            sqlalchemy.Column("job_id", sqlalchemy.String(64), primary_key=True),
+            sqlalchemy.Column("user_id", sqlalchemy.String(255), nullable=False),
+            sqlalchemy.Column("session_id", sqlalchemy.String(255), nullable=False),
+            sqlalchemy.Column("dataset_id", sqlalchemy.String(255), nullable=False),
+            sqlalchemy.Column("status", sqlalchemy.String(16), nullable=False, index=True),
+            sqlalchemy.Column("cancel_requested", sqlalchemy.Boolean, nullable=False, default=False),
+            sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False, index=True),
+            sqlalchemy.Column("started_at", sqlalchemy.Float),
+            sqlalchemy.Column("finished_at", sqlalchemy.Float),
+            sqlalchemy.Column("result", sqlalchemy.Text),
+            sqlalchemy.Column("error", sqlalchemy.Text),
+        )
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    engine = sqlalchemy.create_engine(self.db_url)
+                    self._metadata.create_all(engine)
+                    self._engine = engine
+        start_periodic_task("chat-jobs-watch", WATCH_INTERVAL_SECONDS, self.watch)
+        start_periodic_task("chat-jobs-prune", _PRUNE_INTERVAL_SECONDS, self.prune)
+        return self._engine
+
+    # --- Submission and execution ---
+
+    def submit(self, user_id: str, session_id: str, dataset_id: str, turn, run_turn) -> str:
+        """
+        Stores a new job and starts it on a background thread of this worker.
+
+        Args:
+            user_id, session_id, dataset_id: The owner and target of the turn.
+            turn: The TurnContext of the job (cancelled together with the job).
+            run_turn: A coroutine function `(turn, on_started) -> dict` running the
+                turn and returning its chat response; it calls `on_started()` once the
+                turn was admitted.
+
+        Returns:
+            The job id.
+
+        Raises:
+            JobRejected: If MAX_ACTIVE_JOBS jobs are already queued or running.
+        """
+        c = self._jobs.c
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self.engine.begin() as conn:
+            active = conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(self._jobs)
+                                  .where(c.status.in_(ACTIVE_STATUSES))).scalar()
+            if active >= self.max_active:
+                with self._lock:
+                    self._counters["rejected"] += 1
+                raise JobRejected("Too many questions are being answered right now. Please retry shortly.", 30)
+            conn.execute(self._jobs.insert().values(
+                job_id=job_id, user_id=user_id, session_id=session_id, dataset_id=dataset_id,
+                status=STATUS_QUEUED, cancel_requested=False, created_at=now))
+
+        local = _LocalJob(job_id, turn, deadline=time.monotonic() + self.timeout_seconds)
+        local.thread = threading.Thread(target=self._run, args=(local, run_turn), name=f"chat-job-{job_id[:8]}", daemon=True)
+        with self._lock:
+            self._local[job_id] = local
+            self._counters["submitted"] += 1
+        local.thread.start()
+        logging.info(f"Submitted chat job {job_id} for user '{user_id}' in session '{session_id}'.")
+        return job_id
+
+    def _run(self, local: _LocalJob, run_turn) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        def on_started():
+            self._update(local.job_id, status=STATUS_RUNNING, started_at=time.time())
+
+        status, result, error = STATUS_FAILED, None, None
+        try:
+            with self._lock:
+                local.loop = loop
+                local.task = loop.create_task(run_turn(local.turn, on_started))
+                cancelled_early = local.turn.cancelled
+            if cancelled_early:
+                local.task.cancel()
+            result = loop.run_until_complete(local.task)
+            status = STATUS_SUCCEEDED
+        except asyncio.CancelledError:
+            status = STATUS_TIMED_OUT if local.turn.cancel_reason == STATUS_TIMED_OUT else STATUS_CANCELLED
+            error = f"The question was {'timed out' if status == STATUS_TIMED_OUT else 'cancelled'}."
+        except Exception as e:
+            logging.error(f"Chat job {local.job_id} failed: {e}", exc_info=True)
+            error = str(e)
+        finally:
+            with self._lock:
+                self._local.pop(local.job_id, None)
+                self._counters[status] += 1
+                local.loop = None
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+        if status == STATUS_SUCCEEDED and local.turn.cancelled:
+            # The turn finished while its cancellation was being delivered.
+            status = STATUS_TIMED_OUT if local.turn.cancel_reason == STATUS_TIMED_OUT else STATUS_CANCELLED
+        self._update(local.job_id, status=status, finished_at=time.time(),
+                     result=json.dumps(result, default=str) if result is not None else None, error=error)
+        logging.info(f"Chat job {local.job_id} finished with status '{status}'.")
+
+    def _update(self, job_id: str, **values) -> None:
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self._jobs.update().where(self._jobs.c.job_id == job_id).values(**values))
+        except Exception:
+            logging.error(f"Could not update chat job {job_id}.", exc_info=True)
+
+    # --- Cancellation and timeouts ---
+
+    def _cancel_local(self, job_id: str, reason: str) -> bool:
+        with self._lock:
+            local = self._local.get(job_id)
+            if local is None:
+                return False
+            loop, task = local.loop, local.task
+        # Stop the BigQuery jobs first: a synchronous tool blocked on a query result
+        # returns as soon as its job is cancelled, and the task is cancelled at its next await.
+        local.turn.cancel(reason)
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # The loop already closed; the job is finishing.
+        return True
+
+    def cancel(self, job_id: str, user_id: str) -> dict | None:
+        """
+        Requests the cancellation of a job. The worker running it stops it within
+        WATCH_INTERVAL_SECONDS (immediately if that is this worker).
+
+        Returns:
+            The job, or None if there is no such job of this user.
+        """
+        c = self._jobs.c
+        with self.engine.begin() as conn:
+            requested = conn.execute(self._jobs.update()
+                                     .where(sqlalchemy.and_(c.job_id == job_id, c.user_id == user_id, c.status.in_(ACTIVE_STATUSES)))
+                                     .values(cancel_requested=True)).rowcount
+        # Only an active job of this user is stopped; another user's job id is left alone.
+        if requested and self._cancel_local(job_id, STATUS_CANCELLED):
+            logging.info(f"Cancelled chat job {job_id} of user '{user_id}'.")
+        return self.get(job_id, user_id)
+
+    def watch(self) -> None:
+        """Cancels this worker's jobs that were asked to stop or ran out of time."""
+        with self._lock:
+            local_jobs = list(self._local.values())
+        if not local_jobs:
+            return
+        now = time.monotonic()
+        for local in local_jobs:
+            if now > local.deadline and not local.turn.cancelled:
+                logging.warning(f"Chat job {local.job_id} exceeded {self.timeout_seconds:.0f} seconds; cancelling it.")
+                self._cancel_local(local.job_id, STATUS_TIMED_OUT)
+        c = self._jobs.c
+        with self.engine.connect() as conn:
+            requested = conn.execute(sqlalchemy.select(c.job_id).where(sqlalchemy.and_(
+                c.job_id.in_([j.job_id for j in local_jobs]), c.cancel_requested.is_(True)))).scalars().all()
+        for job_id in requested:
+            self._cancel_local(job_id, STATUS_CANCELLED)
+
+    def prune(self) -> None:
+        """
+        Deletes finished jobs past their retention (and the oldest ones beyond
+        MAX_STORED_JOBS), and fails jobs whose worker died while running them.
+        """
+        now = time.time()
+        c = self._jobs.c
+        with self.engine.begin() as conn:
+            lost = conn.execute(self._jobs.update().where(sqlalchemy.and_(
+                c.status.in_(ACTIVE_STATUSES), c.created_at < now - self.timeout_seconds - 5 * 60))
+                .values(status=STATUS_FAILED, finished_at=now, error="The job was lost (its worker stopped).")).rowcount
+            expired = conn.execute(self._jobs.delete().where(sqlalchemy.and_(
+                c.status.notin_(ACTIVE_STATUSES), c.finished_at < now - JOB_RETENTION_SECONDS))).rowcount
+            overflow = conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(self._jobs)).scalar() - self.max_stored
+            if overflow > 0:
+                oldest = sqlalchemy.select(c.job_id).where(c.status.notin_(ACTIVE_STATUSES)).order_by(c.created_at).limit(overflow)
+                expired += conn.execute(self._jobs.delete().where(c.job_id.in_(oldest))).rowcount
+        if lost or expired:
+            logging.info(f"Pruned {expired} finished chat jobs; marked {lost} lost jobs as failed.")
+
+    # --- Reading ---
+
+    def get(self, job_id: str, user_id: str) -> dict | None:
+        """Returns a job of a user (with its chat response once it succeeded), or None."""
+        c = self._jobs.c
+        with self.engine.connect() as conn:
+            row = conn.execute(sqlalchemy.select(self._jobs).where(
+                sqlalchemy.and_(c.job_id == job_id, c.user_id == user_id))).mappings().first()
+        if row is None:
+            return None
+        job = {k: row[k] for k in ("job_id", "session_id", "dataset_id", "status", "cancel_requested",
+                                   "created_at", "started_at", "finished_at", "error")}
+        job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+    def wait(self, job_id: str, user_id: str, wait_seconds: float) -> dict | None:
+        """Like `get()`, but waits up to `wait_seconds` (at most MAX_POLL_WAIT_SECONDS) for the job to finish."""
+        deadline = time.monotonic() + min(max(0.0, wait_seconds), MAX_POLL_WAIT_SECONDS)
+        while True:
+            job = self.get(job_id, user_id)
+            if job is None or job["status"] not in ACTIVE_STATUSES or time.monotonic() >= deadline:
+                return job
+            time.sleep(_POLL_INTERVAL_SECONDS)
+
+    def stats(self) -> dict:
+        """Returns job counters of this worker and the number of jobs it is running."""
+        with self._lock:
+            return dict(self._counters, running_in_worker=len(self._local))
+
+
+JOBS = ChatJobManager()
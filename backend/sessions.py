@@ -0,0 +1,271 @@
+import logging
+import os
+import threading
+import time
+import sqlalchemy
+from data_agent.utils import shared_file_lock, start_periodic_task
+
+# Sessions of a kind are deleted once they have not been used for their TTL.
+SESSION_TTL_SECONDS = {
+    # Sessions created by /api/login and used by the chat UI.
+    "interactive": float(os.environ.get("SESSION_TTL_INTERACTIVE_SECONDS", str(7 * 24 * 60 * 60))),
+    # Throwaway sessions, e.g. of /api/test_query. They are also deleted right after use;
+    # the TTL only catches the ones a crashed request left behind.
+    "ephemeral": float(os.environ.get("SESSION_TTL_EPHEMERAL_SECONDS", str(60 * 60))),
+}
+SESSION_GC_INTERVAL_SECONDS = float(os.environ.get("SESSION_GC_INTERVAL_SECONDS", str(10 * 60)))
+# Sessions deleted per transaction, so a large backlog does not hold the database's write lock for long.
+SESSION_GC_BATCH_SIZE = int(os.environ.get("SESSION_GC_BATCH_SIZE", "500"))
+SESSION_GC_LOCK_DIR = os.environ.get("SESSION_GC_LOCK_DIR", "/tmp/data_agent_sessions")
+# A session's last use is written at most this often, not on every turn.
+_TOUCH_INTERVAL_SECONDS = 60
+_MAX_TOUCH_CACHE = 10000
+_BATCH_PAUSE_SECONDS = 0.05
+
+KIND_INTERACTIVE = "interactive"
+KIND_EPHEMERAL = "ephemeral"
+
+# The columns of the ADK DatabaseSessionService tables this module reads and deletes from.
+_adk_metadata = sqlalchemy.MetaData()
+_adk_sessions = sqlalchemy.Table(
+    "sessions", _adk_metadata,
+    sqlalchemy.Column("app_name", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("user_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+)
+_adk_events = sqlalchemy.Table(
+    "events", _adk_metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("app_name", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("user_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("session_id", sqlalchemy.String, primary_key=True),
+)
+# Indexes the batched deletes rely on; the ADK schema only has the primary keys above.
+_ADK_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_events_session ON events (app_name, user_id, session_id)",
+)
+
+
+class SessionLifecycleManager:
+    """
+    Tracks the kind and last use of ADK sessions and deletes expired ones.
+
+    Each session has a row in the `session_lifecycle` table, stored next to the ADK
+    tables: its kind ('interactive' or 'ephemeral') and when it was last used. A
+    periodic task deletes sessions that were not used for the TTL of their kind
+    (SESSION_TTL_SECONDS), with their events, in indexed batches of
+    SESSION_GC_BATCH_SIZE. Sessions created before this table existed are adopted as
+    interactive sessions used "now". Logging out deletes the session right away.
+    """
+
+    def __init__(self, db_url: str | None = None, app_name: str = "", ttl_seconds: dict | None = None,
+                 batch_size: int = SESSION_GC_BATCH_SIZE):
+        self.db_url = db_url
+        self.app_name = app_name
+        self.session_service = None
+        self.ttl_seconds = ttl_seconds or SESSION_TTL_SECONDS
+        self.batch_size = batch_size
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self._touched: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_gc = {}
+        self._counters = {"deleted_expired": 0, "deleted_on_logout": 0, "deleted_ephemeral": 0, "gc_runs": 0}
+        self._metadata = sqlalchemy.MetaData()
+        self._lifecycle = sqlalchemy.Table(
+            "session_lifecycle", self._metadata,
+            sqlalchemy.Column("app_name", sqlalchemy.String(128), primary_key=True),
+            sqlalchemy.Column("user_id", sqlalchemy.String(255), primary_key=True),
+            sqlalchemy.Column("session_id", sqlalchemy.String(128), primary_key=True),
+            sqlalchemy.Column("kind", sqlalchemy.String(16), nullable=False),
+            sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+            sqlalchemy.Column("last_used_at", sqlalchemy.Float, nullable=False),
+            sqlalchemy.Index("ix_session_lifecycle_expiry", "kind", "last_used_at"),
+        )
+
+    def configure(self, session_service, db_url: str | None, app_name: str) -> None:
+        """
+        Points the manager at the ADK session service and its database.
+
+        With db_url None (the in-memory session service) there is nothing to collect;
+        `end()` still deletes sessions through the session service.
+        """
+        self.session_service = session_service
+        self.db_url = db_url
+        self.app_name = app_name
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.db_url)
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    engine = sqlalchemy.create_engine(self.db_url)
+                    self._metadata.create_all(engine)
+                    with engine.begin() as conn:
+                        for statement in _ADK_INDEXES:
+                            conn.execute(sqlalchemy.text(statement))
+                    self._engine = engine
+        start_periodic_task("session-gc", SESSION_GC_INTERVAL_SECONDS, self.collect)
+        return self._engine
+
+    # --- Lifecycle ---
+
+    def register(self, user_id: str, session_id: str, kind: str = KIND_INTERACTIVE) -> None:
+        """Records a new session and its kind."""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            # An update first: a GC run may have adopted the session since it was created.
+            self._upsert(user_id, session_id, now, kind)
+            self._remember_touch(session_id, now)
+        except Exception:
+            logging.warning(f"Could not register session '{session_id}'.", exc_info=True)
+
+    def touch(self, user_id: str, session_id: str) -> None:
+        """Marks a session as used (written at most once per _TOUCH_INTERVAL_SECONDS)."""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(session_id, 0.0) < _TOUCH_INTERVAL_SECONDS:
+                return
+        try:
+            self._upsert(user_id, session_id, now)
+            self._remember_touch(session_id, now)
+        except Exception:
+            logging.warning(f"Could not record the use of session '{session_id}'.", exc_info=True)
+
+    def _upsert(self, user_id: str, session_id: str, now: float, kind: str | None = None) -> None:
+        """Sets a session's last use (and kind, if given); untracked sessions are added as interactive."""
+        c = self._lifecycle.c
+        values = {"last_used_at": now, **({"kind": kind} if kind else {})}
+        with self.engine.begin() as conn:
+            updated = conn.execute(self._lifecycle.update().where(sqlalchemy.and_(
+                c.app_name == self.app_name, c.user_id == user_id, c.session_id == session_id)).values(**values)).rowcount
+            if not updated:
+                conn.execute(self._lifecycle.insert().values(
+                    app_name=self.app_name, user_id=user_id, session_id=session_id, kind=kind or KIND_INTERACTIVE,
+                    created_at=now, last_used_at=now))
+
+    def _remember_touch(self, session_id: str, now: float) -> None:
+        with self._lock:
+            self._touched[session_id] = now
+            if len(self._touched) > _MAX_TOUCH_CACHE:
+                self._touched = {s: t for s, t in self._touched.items() if now - t < _TOUCH_INTERVAL_SECONDS}
+
+    def end(self, user_id: str, session_id: str, reason: str = "deleted_on_logout") -> bool:
+        """Deletes a session and its events now (on logout, or after an ephemeral session's request)."""
+        try:
+            if self.enabled:
+                with self.engine.begin() as conn:
+                    deleted = self._delete(conn, [(user_id, session_id)])
+            elif self.session_service is not None:
+                self.session_service.delete_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+                deleted = 1
+            else:
+                return False
+            with self._lock:
+                self._counters[reason] += deleted
+                self._touched.pop(session_id, None)
+            return bool(deleted)
+        except Exception:
+            logging.warning(f"Could not delete session '{session_id}'.", exc_info=True)
+            return False
+
+    def _delete(self, conn, sessions: list[tuple[str, str]]) -> int:
+        """Deletes sessions (user_id, session_id) with their events and lifecycle rows; returns the sessions deleted."""
+        deleted = 0
+        for user_id, session_id in sessions:
+            conn.execute(_adk_events.delete().where(sqlalchemy.and_(
+                _adk_events.c.app_name == self.app_name, _adk_events.c.user_id == user_id, _adk_events.c.session_id == session_id)))
+            deleted += conn.execute(_adk_sessions.delete().where(sqlalchemy.and_(
+                _adk_sessions.c.app_name == self.app_name, _adk_sessions.c.user_id == user_id, _adk_sessions.c.id == session_id))).rowcount
+            conn.execute(self._lifecycle.delete().where(sqlalchemy.and_(
+                self._lifecycle.c.app_name == self.app_name, self._lifecycle.c.user_id == user_id,
+                self._lifecycle.c.session_id == session_id)))
+        return deleted
+
+    # --- Garbage collection ---
+
+    def _adopt_untracked(self, now: float) -> int:
+        """Gives sessions without a lifecycle row (e.g. created before it existed) a full interactive TTL."""
+        c, s = self._lifecycle.c, _adk_sessions.c
+        untracked = sqlalchemy.select(
+            s.app_name, s.user_id, s.id,
+            sqlalchemy.literal(KIND_INTERACTIVE), sqlalchemy.literal(now), sqlalchemy.literal(now),
+        ).where(s.app_name == self.app_name).where(~sqlalchemy.exists().where(sqlalchemy.and_(
+            c.app_name == s.app_name, c.user_id == s.user_id, c.session_id == s.id)))
+        with self.engine.begin() as conn:
+            return conn.execute(self._lifecycle.insert().from_select(
+                ["app_name", "user_id", "session_id", "kind", "created_at", "last_used_at"], untracked)).rowcount
+
+    def collect(self) -> dict:
+        """Deletes expired sessions in batches. Runs in one worker of the instance at a time."""
+        if not self.enabled:
+            return {}
+        start_time = now = time.time()
+        deleted = {kind: 0 for kind in self.ttl_seconds}
+        c = self._lifecycle.c
+        with shared_file_lock(SESSION_GC_LOCK_DIR, "session-gc"):
+            adopted = self._adopt_untracked(now)
+            for kind, ttl in self.ttl_seconds.items():
+                if not ttl or ttl <= 0:
+                    continue
+                while True:
+                    with self.engine.begin() as conn:
+                        batch = conn.execute(sqlalchemy.select(c.user_id, c.session_id).where(sqlalchemy.and_(
+                            c.app_name == self.app_name, c.kind == kind, c.last_used_at < now - ttl)).limit(self.batch_size)).all()
+                        if not batch:
+                            break
+                        self._delete(conn, [tuple(row) for row in batch])
+                    deleted[kind] += len(batch)
+                    if len(batch) < self.batch_size:
+                        break
+                    time.sleep(_BATCH_PAUSE_SECONDS)  # Let request threads take the write lock between batches.
+        with self._lock:
+            self._counters["gc_runs"] += 1
+            self._counters["deleted_expired"] += sum(deleted.values())
+            self._last_gc = {"at": round(start_time), "seconds": round(time.time() - start_time, 3),
+                             "deleted": deleted, "adopted": adopted}
+        if adopted or any(deleted.values()):
+            logging.info(f"Session GC deleted {deleted} expired sessions and adopted {adopted} untracked ones "
+                         f"in {time.time() - start_time:.2f} seconds.")
+        return deleted
+
+    # --- Reporting ---
+
+    def _db_file(self) -> str | None:
+        url = sqlalchemy.engine.make_url(self.db_url)
+        return url.database if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:") else None
+
+    def stats(self) -> dict:
+        """Returns session counts by kind, the events count, the database size and the last GC run."""
+        with self._lock:
+            stats = {"enabled": self.enabled, **self._counters, "last_gc": dict(self._last_gc),
+                     "ttl_seconds": dict(self.ttl_seconds)}
+        if not self.enabled:
+            return stats
+        c = self._lifecycle.c
+        try:
+            with self.engine.connect() as conn:
+                stats["sessions_by_kind"] = dict(conn.execute(sqlalchemy.select(c.kind, sqlalchemy.func.count())
+                                                              .where(c.app_name == self.app_name).group_by(c.kind)).all())
+                stats["sessions"] = conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(_adk_sessions)).scalar()
+                stats["events"] = conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(_adk_events)).scalar()
+                db_file = self._db_file()
+                if db_file:
+                    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+                    stats["db_free_bytes"] = conn.exec_driver_sql("PRAGMA freelist_count").scalar() * page_size
+            if db_file and os.path.exists(db_file):
+                stats["db_size_bytes"] = os.path.getsize(db_file)
+        except Exception:
+            logging.warning("Could not read session database statistics.", exc_info=True)
+        return stats
+
+
+SESSIONS = SessionLifecycleManager()
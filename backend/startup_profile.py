@@ -0,0 +1,181 @@
+import contextlib
+import importlib.abc
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# Set STARTUP_PROFILE=1 to time module imports and startup phases, and log a report once
+# the app is created. STARTUP_PROFILE_OUTPUT additionally writes the report as JSON.
+ENABLED = os.environ.get("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+OUTPUT_PATH = os.environ.get("STARTUP_PROFILE_OUTPUT", "")
+# Modules and top-level packages listed in the logged report.
+_REPORT_TOP_MODULES = 25
+
+
+def _package_of(module_name: str) -> str:
+    """Groups modules by distribution: `google.cloud.bigquery.table` -> `google.cloud.bigquery`."""
+    parts = module_name.split(".")
+    if parts[0] == "google":
+        return ".".join(parts[:3] if len(parts) > 2 and parts[1] == "cloud" else parts[:2])
+    return parts[0]
+
+
+class _TimingLoader(importlib.abc.Loader):
+    """Wraps a module's loader and records how long executing the module took."""
+
+    def __init__(self, loader, profiler: "StartupProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__)
+
+    def __getattr__(self, name):
+        # get_resource_reader(), get_source(), is_package(), ... of the wrapped loader.
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """A meta path finder that delegates to the other finders and wraps their loaders."""
+
+    def __init__(self, profiler: "StartupProfiler"):
+        self._profiler = profiler
+        self._resolving = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._resolving, "active", False):
+            return None
+        self._resolving.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimingLoader(spec.loader, self._profiler)
+                    return spec
+            return None
+        finally:
+            self._resolving.active = False
+
+
+class StartupProfiler:
+    """
+    Measures where a cold start spends its time.
+
+    * Imports: every module imported while profiling is timed with a meta path hook.
+      Its inclusive time covers the modules it imports; its self time does not.
+    * Phases: named blocks of startup (e.g. imports, agent build, runner setup) timed
+      with `phase()`, or with `mark()` for module-level code.
+
+    The report lists the phases, the slowest modules by self time and the import time
+    per top-level package (e.g. `google.adk`, `pandas`). When disabled, `phase()` costs
+    nothing and no hook is installed.
+    """
+
+    def __init__(self, enabled: bool = ENABLED):
+        self.enabled = enabled
+        self.started_at = self._last_mark = time.perf_counter()
+        self._finder = None
+        self._stack = []   # [module name, start time, child time]
+        self._modules = {}  # name -> (inclusive seconds, self seconds)
+        self._phases = []   # (name, seconds)
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Installs the import hook. Call before the imports to be measured."""
+        if self.enabled and self._finder is None:
+            self._finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def stop(self) -> None:
+        if self._finder is not None:
+            sys.meta_path.remove(self._finder)
+            self._finder = None
+
+    def _enter(self, name: str) -> None:
+        if threading.current_thread() is threading.main_thread():
+            self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self, name: str) -> None:
+        if threading.current_thread() is not threading.main_thread() or not self._stack:
+            return
+        module, start, child = self._stack.pop()
+        inclusive = time.perf_counter() - start
+        self._modules[module] = (inclusive, max(0.0, inclusive - child))
+        if self._stack:
+            self._stack[-1][2] += inclusive
+
+    def mark(self, name: str) -> None:
+        """Ends a phase that started at the previous mark (or at the start of profiling)."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self._phases.append((name, now - self._last_mark))
+            self._last_mark = now
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Times a named block of startup."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._last_mark = time.perf_counter()
+                self._phases.append((name, self._last_mark - start))
+
+    def report(self) -> dict:
+        """Returns the phases, the slowest modules and the import time per top-level package."""
+        packages = {}
+        for name, (_, self_seconds) in self._modules.items():
+            package = _package_of(name)
+            packages[package] = packages.get(package, 0.0) + self_seconds
+        slowest = sorted(self._modules.items(), key=lambda item: item[1][1], reverse=True)[:_REPORT_TOP_MODULES]
+        return {
+            "pid": os.getpid(),
+            "total_seconds": round(time.perf_counter() - self.started_at, 3),
+            "phases": {name: round(seconds, 3) for name, seconds in self._phases},
+            "modules_imported": len(self._modules),
+            "import_seconds_by_package": {
+                package: round(seconds, 3)
+                for package, seconds in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:_REPORT_TOP_MODULES]
+            },
+            "slowest_modules": [
+                {"module": name, "self_seconds": round(self_s, 3), "inclusive_seconds": round(inclusive, 3)}
+                for name, (inclusive, self_s) in slowest
+            ],
+        }
+
+    def finish(self) -> None:
+        """Stops profiling and logs (and optionally writes) the report."""
+        if not self.enabled:
+            return
+        self.stop()
+        report = self.report()
+        logging.info(f"[STARTUP_PROFILE] Cold start report:\n{json.dumps(report, indent=2)}")
+        if OUTPUT_PATH:
+            try:
+                with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2)
+            except OSError:
+                logging.warning(f"[STARTUP_PROFILE] Could not write the report to {OUTPUT_PATH}", exc_info=True)
+
+
+STARTUP_PROFILER = StartupProfiler()
+STARTUP_PROFILER.start()
@@ -0,0 +1,178 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import time
+
+try:
+    import brotli  # Optional: only used to compress assets that have no pre-built .br file.
+except ImportError:
+    brotli = None
+
+# Files emitted by the React build with a content hash in their name
+# (e.g. main.f698b42e.js, 453.7b4e5a59.chunk.js, archi.32e29d28ff18f5f98995.png).
+_HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{8,}\.")
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/manifest+json", "image/svg+xml")
+_MIN_COMPRESS_BYTES = 1024
+# Files larger than this are not held in memory and are streamed from disk instead.
+_MAX_IN_MEMORY_BYTES = 5 * 1024 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class StaticAsset:
+    """One file of the frontend build, with its pre-compressed variants."""
+
+    __slots__ = ("path", "file_path", "mimetype", "cache_control", "etag", "variants")
+
+    def __init__(self, path: str, file_path: str, mimetype: str, cache_control: str, etag: str, variants: dict):
+        self.path = path
+        self.file_path = file_path
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = etag          # ETag of the identity encoding, quoted.
+        self.variants = variants  # encoding ('identity', 'gzip', 'br') -> bytes, or None when streamed from disk
+
+
+def _parse_accept_encoding(header: str) -> set[str]:
+    """Returns the content codings the client accepts (q > 0)."""
+    accepted = set()
+    for item in (header or "").split(","):
+        parts = [p.strip() for p in item.split(";")]
+        coding = parts[0].lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def _variant_etag(etag: str, encoding: str) -> str:
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+
+class StaticAssetManifest:
+    """
+    An in-memory manifest of the frontend build directory.
+
+    The directory is scanned once at startup. Every file is read into memory together
+    with its gzip and brotli variants (pre-generated `.gz`/`.br` siblings are used when
+    present, otherwise gzip is generated here and brotli if the optional `brotli` package
+    is installed). Requests are then answered without touching the filesystem:
+    content-hashed files get an immutable one-year cache lifetime, everything else is
+    revalidated, and a matching `If-None-Match` is answered with 304.
+    """
+
+    def __init__(self, build_dir: str, index_file: str = "index.html"):
+        self.build_dir = build_dir
+        self.index_file = index_file
+        self.assets: dict[str, StaticAsset] = {}
+        self._build()
+
+    def _build(self) -> None:
+        start_time = time.time()
+        total_bytes = 0
+        for root, _, files in os.walk(self.build_dir):
+            for name in files:
+                if name.endswith((".gz", ".br")):
+                    continue  # Picked up as variants of their source file.
+                file_path = os.path.join(root, name)
+                rel_path = os.path.relpath(file_path, self.build_dir).replace(os.sep, "/")
+                try:
+                    asset = self._load_asset(rel_path, file_path)
+                except OSError:
+                    logging.warning(f"Could not load static asset {file_path}", exc_info=True)
+                    continue
+                self.assets[rel_path] = asset
+                total_bytes += sum(len(v) for v in (asset.variants or {}).values())
+        duration = time.time() - start_time
+        logging.info(f"Static asset manifest built: {len(self.assets)} files, "
+                     f"{total_bytes / 1024 / 1024:.1f} MiB in memory (Duration: {duration:.2f} seconds).")
+
+    def _load_asset(self, rel_path: str, file_path: str) -> StaticAsset:
+        mimetype = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        cache_control = IMMUTABLE_CACHE_CONTROL if _HASHED_NAME_RE.search(os.path.basename(rel_path)) else REVALIDATE_CACHE_CONTROL
+
+        size = os.path.getsize(file_path)
+        if size > _MAX_IN_MEMORY_BYTES:
+            stat = os.stat(file_path)
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            return StaticAsset(rel_path, file_path, mimetype, cache_control, etag, variants=None)
+
+        with open(file_path, "rb") as f:
+            body = f.read()
+        variants = {"identity": body}
+        compressible = mimetype.startswith(_COMPRESSIBLE_TYPES) and len(body) >= _MIN_COMPRESS_BYTES
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+            if os.path.exists(file_path + suffix):
+                with open(file_path + suffix, "rb") as f:
+                    variants[encoding] = f.read()
+            elif compressible and encoding == "gzip":
+                variants[encoding] = gzip.compress(body, compresslevel=9, mtime=0)
+            elif compressible and encoding == "br" and brotli is not None:
+                variants[encoding] = brotli.compress(body, quality=11)
+        # Drop variants that do not actually save bytes.
+        variants = {k: v for k, v in variants.items() if k == "identity" or len(v) < len(body)}
+        etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        return StaticAsset(rel_path, file_path, mimetype, cache_control, etag, variants)
+
+    def resolve(self, path: str):
+        """Returns the asset for a request path, falling back to index.html for client-side routes."""
+        path = (path or "").lstrip("/")
+        return self.assets.get(path) or self.assets.get(self.index_file)
+
+    def negotiate(self, path: str, accept_encoding: str = "", if_none_match: str = ""):
+        """
+        Picks the response for a request.
+
+        Args:
+            path: The request path relative to the build directory.
+            accept_encoding: The request's Accept-Encoding header.
+            if_none_match: The request's If-None-Match header.
+
+        Returns:
+            A tuple (status, body, headers, asset). `body` is bytes, or None when the
+            asset must be streamed from `asset.file_path` (status 200) or for a 304.
+            Returns (404, None, {}, None) when nothing matches.
+        """
+        asset = self.resolve(path)
+        if asset is None:
+            return 404, None, {}, None
+
+        encoding = "identity"
+        if asset.variants:
+            accepted = _parse_accept_encoding(accept_encoding)
+            for candidate in ("br", "gzip"):
+                if candidate in asset.variants and candidate in accepted:
+                    encoding = candidate
+                    break
+
+        etag = _variant_etag(asset.etag, encoding)
+        headers = {"Cache-Control": asset.cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+
+        if if_none_match:
+            client_tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+            if "*" in client_tags or etag in client_tags:
+                return 304, None, headers, asset
+
+        content_type = asset.mimetype
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        headers["Content-Type"] = content_type
+        if asset.variants is None:
+            return 200, None, headers, asset
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        body = asset.variants[encoding]
+        headers["Content-Length"] = str(len(body))
+        return 200, body, headers, asset
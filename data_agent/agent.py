@@ -13,18 +13,28 @@
 # limitations under the License.
 
 from google.adk.agents import Agent
-from .constants import MODEL
-from .custom_tools import execute_bigquery_query
-from .instructions import return_instructions_bigquery
+from .constants import MODEL, DEFAULT_DATASET_ID
+from .custom_tools import execute_bigquery_query, lookup_filter_values, find_join_path
+from .llm import DataAgentGemini
 from dotenv import load_dotenv
 
 
 load_dotenv('env')
 
-root_agent = Agent(
-    model=MODEL,
-    name="Data_Agent",
-    description="Converts natural language questions about provided BigQuery data into executable BigQuery SQL queries and runs them.",
-    instruction=return_instructions_bigquery(),
-    tools=[execute_bigquery_query]  #built in tool to execute BigQuery queries
-) 
\ No newline at end of file
+def create_agent(instruction: str) -> Agent:
+    """Creates the data agent for one dataset, given its fully built instructions."""
+    return Agent(
+        model=DataAgentGemini(model=MODEL),
+        name="Data_Agent",
+        description="Converts natural language questions about provided BigQuery data into executable BigQuery SQL queries and runs them.",
+        instruction=instruction,
+        tools=[execute_bigquery_query, lookup_filter_values, find_join_path]  #built in tool to execute BigQuery queries, plus the local filter-value and join-path lookups
+    )
+
+def __getattr__(name):
+    # `root_agent` (the agent of the default dataset, used by the ADK CLI and the backend)
+    # is resolved through the agent registry, which builds it on first access.
+    if name == "root_agent":
+        from .registry import REGISTRY
+        return REGISTRY.get(DEFAULT_DATASET_ID).agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
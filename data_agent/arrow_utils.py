@@ -0,0 +1,184 @@
+import base64
+import logging
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+
+logger = logging.getLogger(__name__)
+
+
+def json_ready_type(data_type: pa.DataType) -> pa.DataType:
+    """
+    Returns the type a column is cast to before it is turned into prompt JSON.
+
+    Decimals become float64, dates, times and timestamps become strings and bytes become
+    base64 strings, also inside lists and structs, so that `table_to_records()` yields
+    only JSON-native Python values.
+    """
+    if pa.types.is_decimal(data_type):
+        return pa.float64()
+    if pa.types.is_timestamp(data_type) or pa.types.is_date(data_type) or pa.types.is_time(data_type):
+        return pa.string()
+    if _is_binary(data_type):
+        return pa.string()
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return pa.list_(json_ready_type(data_type.value_type))
+    if pa.types.is_struct(data_type):
+        return pa.struct([pa.field(f.name, json_ready_type(f.type), f.nullable) for f in data_type])
+    return data_type
+
+def contains_type(data_type: pa.DataType, predicate) -> bool:
+    """Whether `predicate` holds for `data_type` or for a type nested in it (list values, struct fields)."""
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return contains_type(data_type.value_type, predicate)
+    if pa.types.is_struct(data_type):
+        return any(contains_type(f.type, predicate) for f in data_type)
+    return predicate(data_type)
+
+def map_leaf_arrays(column: pa.Array | pa.ChunkedArray, func) -> pa.Array:
+    """
+    Applies `func` to the non-nested arrays of a column, also inside lists and structs,
+    and rebuilds the lists and structs (with their nulls) around the results.
+    """
+    array = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    data_type = array.type
+    if pa.types.is_struct(data_type) and data_type.num_fields:
+        children = [map_leaf_arrays(child, func) for child in array.flatten()]
+        return pa.StructArray.from_arrays(children, names=[f.name for f in data_type],
+                                          mask=array.is_null() if array.null_count else None)
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        # Rebase the offsets of a sliced array, as `from_arrays` does not take offsets and nulls of a slice.
+        start, end = array.offsets[0].as_py(), array.offsets[-1].as_py()
+        offsets = pc.subtract(array.offsets, pa.scalar(start, array.offsets.type))
+        values = map_leaf_arrays(array.values.slice(start, end - start), func)
+        list_class = pa.LargeListArray if pa.types.is_large_list(data_type) else pa.ListArray
+        return list_class.from_arrays(offsets, values, mask=array.is_null() if array.null_count else None)
+    return func(array)
+
+def _is_binary(data_type: pa.DataType) -> bool:
+    return pa.types.is_binary(data_type) or pa.types.is_large_binary(data_type)
+
+def _base64_encode(array: pa.Array) -> pa.Array:
+    """Encodes BYTES as base64 strings, as the BigQuery REST API does; other arrays are returned as they are."""
+    if not _is_binary(array.type):
+        return array
+    return pa.array([None if v is None else base64.b64encode(v).decode("ascii") for v in array.to_pylist()], pa.string())
+
+def to_json_ready(table: pa.Table) -> pa.Table:
+    """
+    Casts all columns of a table to JSON-ready types in one vectorized pass.
+
+    Columns that cannot be cast are replaced by nulls instead of failing the whole table.
+    """
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        target = json_ready_type(field.type)
+        if target.equals(field.type):
+            columns.append(column)
+            continue
+        try:
+            if contains_type(field.type, _is_binary):
+                column = map_leaf_arrays(column, _base64_encode)
+            columns.append(pc.cast(column, target))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            logger.warning(f"Could not cast column '{field.name}' ({field.type}) for the prompt; replacing it with nulls.")
+            columns.append(pa.nulls(len(table), type=target))
+    return pa.table(columns, names=table.column_names)
+
+def _to_python(array: pa.Array) -> list:
+    """
+    Converts an Arrow array to Python values column-wise.
+
+    Primitive columns go through NumPy's C-level `tolist()`, and lists and structs are
+    rebuilt from their flattened children, which is several times faster than
+    `to_pylist()`'s per-value scalar boxing. Columns with nulls in a numeric, list or
+    struct position fall back to `to_pylist()` so nulls stay None.
+    """
+    data_type = array.type
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return array.to_numpy(zero_copy_only=False).tolist()
+    if array.null_count:
+        return array.to_pylist()
+    if pa.types.is_integer(data_type) or pa.types.is_floating(data_type) or pa.types.is_boolean(data_type):
+        return array.to_numpy(zero_copy_only=False).tolist()
+    if pa.types.is_struct(data_type):
+        names = [f.name for f in data_type]
+        children = [_to_python(child) for child in array.flatten()]
+        return [dict(zip(names, values)) for values in zip(*children)] if children else [{} for _ in range(len(array))]
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        offsets = array.offsets.to_numpy()
+        values = _to_python(array.flatten())
+        base = int(offsets[0])
+        return [values[int(start) - base:int(end) - base] for start, end in zip(offsets[:-1], offsets[1:])]
+    return array.to_pylist()
+
+def table_to_records(table: pa.Table) -> list[dict]:
+    """Converts a (JSON-ready) table to a list of row dictionaries; see `_to_python()`."""
+    if table.num_rows == 0:
+        return []
+    columns = [_to_python(column.combine_chunks()) for column in table.columns]
+    names = table.column_names
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+def filter_sparse_profiles(profiles: pa.Table, max_percent_null: float) -> pa.Table:
+    """Drops profile rows of columns that are more than `max_percent_null` percent null."""
+    if "percent_null" not in profiles.column_names or profiles.num_rows == 0:
+        return profiles
+    keep = pc.fill_null(pc.less_equal(profiles["percent_null"], max_percent_null), True)
+    return profiles.filter(keep)
+
+def write_arrow_cache(table: pa.Table, path: str) -> None:
+    """Atomically writes a table as an uncompressed Arrow IPC file, so it can be memory-mapped."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def read_arrow_cache(path: str) -> pa.Table | None:
+    """Memory-maps a table written by `write_arrow_cache()`; the buffers are not copied into memory."""
+    if not os.path.exists(path):
+        return None
+    try:
+        # The map stays open as long as the returned table references its buffers.
+        source = pa.memory_map(path, "r")
+        return pa.ipc.open_file(source).read_all()
+    except Exception:
+        logger.warning(f"Ignoring unreadable Arrow cache file {path}", exc_info=True)
+        return None
+
+def logical_type(data_type: pa.DataType) -> str:
+    """Returns the name clients use to format a column: integer, float, decimal, boolean, string, date, time, timestamp, binary, list or struct."""
+    if pa.types.is_integer(data_type):
+        return "integer"
+    if pa.types.is_floating(data_type):
+        return "float"
+    if pa.types.is_decimal(data_type):
+        return "decimal"
+    if pa.types.is_boolean(data_type):
+        return "boolean"
+    if pa.types.is_timestamp(data_type):
+        return "timestamp"
+    if pa.types.is_date(data_type):
+        return "date"
+    if pa.types.is_time(data_type):
+        return "time"
+    if pa.types.is_binary(data_type) or pa.types.is_large_binary(data_type):
+        return "binary"
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return "list"
+    if pa.types.is_struct(data_type):
+        return "struct"
+    return "string"
+
+def table_to_columns(table: pa.Table) -> list[list]:
+    """Converts a (JSON-ready) table to one list of Python values per column; see `_to_python()`."""
+    return [_to_python(column.combine_chunks()) if table.num_rows else [] for column in table.columns]
+
+def table_to_ipc_stream(table: pa.Table) -> bytes:
+    """Serializes a table in the Arrow IPC streaming format, as read by `pyarrow.ipc.open_stream()` or Arrow JS's `tableFromIPC()`."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import threading
+import time
+import sqlalchemy
+from .constants import (
+    BUDGET_ENABLED,
+    BUDGET_DB_URL,
+    BUDGET_RULES,
+    BUDGET_SOFT_LIMIT_RATIO,
+    BUDGET_DEGRADED_MAX_BYTES_BILLED,
+    BUDGET_QUEUE_MAX_WAIT_SECONDS,
+)
+from .utils import start_periodic_task
+
+logger = logging.getLogger(__name__)
+
+_METRICS = ("input_tokens", "output_tokens", "bytes_billed")
+# Severity of the actions, used to combine the decisions of several rules.
+_ACTION_RANK = {"allow": 0, "degrade": 1, "queue": 2, "reject": 3}
+_GLOBAL_SCOPE_ID = "*"
+_PRUNE_INTERVAL_SECONDS = 60 * 60
+
+
+class BudgetExceededError(Exception):
+    """Raised when a turn may not start or continue because a usage budget is spent."""
+
+    def __init__(self, message: str, retry_after: int | None = None, rule: dict | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.rule = rule
+
+
+class BudgetDecision:
+    """The outcome of checking a turn against all budget rules."""
+
+    def __init__(self, action: str = "allow", reasons: list[str] | None = None, retry_after: int | None = None, rule: dict | None = None):
+        self.action = action
+        self.reasons = reasons or []
+        self.retry_after = retry_after
+        self.rule = rule
+
+
+class BudgetGovernor:
+    """
+    Meters Gemini tokens and BigQuery bytes billed, and enforces the BUDGET_RULES.
+
+    Usage is stored as counters per (scope, scope id, window) in a small SQL table, so
+    all gunicorn workers of an instance enforce the same budgets. Each rule limits one
+    metric for sessions, users or the whole instance over a fixed window, and decides
+    what happens once it is spent: new turns are rejected, queued until the window
+    resets, or run degraded with a lower bytes-billed cap for their queries.
+    """
+
+    def __init__(self, db_url: str = BUDGET_DB_URL, rules: list[dict] | None = None, enabled: bool = BUDGET_ENABLED):
+        self.enabled = enabled
+        self.db_url = db_url
+        self.rules = rules if rules is not None else BUDGET_RULES
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self._metadata = sqlalchemy.MetaData()
+        self._counters = sqlalchemy.Table(
+            "usage_counters", self._metadata,
+            sqlalchemy.Column("scope", sqlalchemy.String(16), primary_key=True),
+            sqlalchemy.Column("scope_id", sqlalchemy.String(255), primary_key=True),
+            sqlalchemy.Column("window_seconds", sqlalchemy.Integer, primary_key=True),
+            sqlalchemy.Column("window_start", sqlalchemy.Integer, primary_key=True),
+            sqlalchemy.Column("input_tokens", sqlalchemy.BigInteger, nullable=False, default=0),
+            sqlalchemy.Column("output_tokens", sqlalchemy.BigInteger, nullable=False, default=0),
+            sqlalchemy.Column("bytes_billed", sqlalchemy.BigInteger, nullable=False, default=0),
+            sqlalchemy.Column("updated_at", sqlalchemy.Float, nullable=False, default=0.0),
+        )
+        # Every (scope, window) pair that needs a counter: the rules' windows plus a
+        # lifetime counter per session and a daily counter per user for reporting.
+        self._windows = sorted({(r["scope"], int(r.get("window_seconds") or 0)) for r in self.rules}
+                               | {("session", 0), ("user", 24 * 60 * 60), ("global", 24 * 60 * 60)})
+        self._lock = threading.Lock()  # Guards the decision counters, updated from request and job threads.
+        self._decisions = {action: 0 for action in _ACTION_RANK}
+        self._queued_seconds = 0.0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    engine = sqlalchemy.create_engine(self.db_url)
+                    self._metadata.create_all(engine)
+                    self._engine = engine
+                    start_periodic_task("budget-prune", _PRUNE_INTERVAL_SECONDS, self.prune)
+        return self._engine
+
+    @staticmethod
+    def _window_start(window_seconds: int, now: float) -> int:
+        return 0 if not window_seconds else int(now // window_seconds * window_seconds)
+
+    @staticmethod
+    def _scope_id(scope: str, user_id: str | None, session_id: str | None) -> str | None:
+        return {"session": session_id, "user": user_id, "global": _GLOBAL_SCOPE_ID}.get(scope)
+
+    # --- Metering ---
+
+    def record(self, user_id: str | None, session_id: str | None, input_tokens: int = 0, output_tokens: int = 0, bytes_billed: int = 0) -> None:
+        """Adds usage to every counter (session, user and global windows) it belongs to."""
+        if not (input_tokens or output_tokens or bytes_billed):
+            return
+        now = time.time()
+        usage = {"input_tokens": int(input_tokens), "output_tokens": int(output_tokens), "bytes_billed": int(bytes_billed)}
+        c = self._counters.c
+        for attempt in range(2):
+            try:
+                with self.engine.begin() as conn:
+                    for scope, window_seconds in self._windows:
+                        scope_id = self._scope_id(scope, user_id, session_id)
+                        if not scope_id:
+                            continue
+                        key = {"scope": scope, "scope_id": scope_id, "window_seconds": window_seconds,
+                               "window_start": self._window_start(window_seconds, now)}
+                        where = sqlalchemy.and_(*(c[k] == v for k, v in key.items()))
+                        result = conn.execute(
+                            self._counters.update().where(where).values(
+                                **{m: c[m] + usage[m] for m in _METRICS}, updated_at=now)
+                        )
+                        if result.rowcount == 0:
+                            conn.execute(self._counters.insert().values(**key, **usage, updated_at=now))
+                return
+            except sqlalchemy.exc.IntegrityError:
+                # Another worker created the same counter row first; the retry updates it.
+                if attempt:
+                    logger.error("[BUDGET] Could not record usage.", exc_info=True)
+            except Exception:
+                logger.error("[BUDGET] Could not record usage.", exc_info=True)
+                return
+
+    def prune(self) -> None:
+        """Deletes counters of windows that have ended."""
+        now = time.time()
+        c = self._counters.c
+        with self.engine.begin() as conn:
+            result = conn.execute(self._counters.delete().where(
+                sqlalchemy.and_(c.window_seconds > 0, c.window_start + c.window_seconds < now)))
+        logger.info(f"[BUDGET] Pruned {result.rowcount} expired usage counters.")
+
+    # --- Enforcement ---
+
+    def _current_counters(self, user_id: str | None, session_id: str | None, now: float) -> dict:
+        """Returns {(scope, window_seconds): {metric: value}} for the current windows."""
+        c = self._counters.c
+        conditions = []
+        for scope, window_seconds in self._windows:
+            scope_id = self._scope_id(scope, user_id, session_id)
+            if scope_id:
+                conditions.append(sqlalchemy.and_(
+                    c.scope == scope, c.scope_id == scope_id, c.window_seconds == window_seconds,
+                    c.window_start == self._window_start(window_seconds, now)))
+        counters = {}
+        if not conditions:
+            return counters
+        with self.engine.connect() as conn:
+            for row in conn.execute(sqlalchemy.select(self._counters).where(sqlalchemy.or_(*conditions))):
+                counters[(row.scope, row.window_seconds)] = {m: getattr(row, m) for m in _METRICS}
+        return counters
+
+    @staticmethod
+    def _metric_value(values: dict, metric: str) -> int:
+        if metric == "tokens":
+            return values.get("input_tokens", 0) + values.get("output_tokens", 0)
+        return values.get(metric, 0)
+
+    def usage(self, user_id: str | None = None, session_id: str | None = None) -> list[dict]:
+        """
+        Returns the state of every budget rule for a user and session.
+
+        Each entry has the rule's scope, metric, window and action plus 'used',
+        'limit', 'remaining' and 'resets_in_seconds' (None for lifetime windows).
+        Rules of a scope whose id is not given are omitted.
+        """
+        now = time.time()
+        counters = self._current_counters(user_id, session_id, now)
+        report = []
+        for rule in self.rules:
+            if not self._scope_id(rule["scope"], user_id, session_id):
+                continue
+            window_seconds = int(rule.get("window_seconds") or 0)
+            used = self._metric_value(counters.get((rule["scope"], window_seconds), {}), rule["metric"])
+            resets_in = None
+            if window_seconds:
+                resets_in = int(self._window_start(window_seconds, now) + window_seconds - now) + 1
+            report.append({
+                "scope": rule["scope"],
+                "metric": rule["metric"],
+                "window_seconds": window_seconds,
+                "action": rule["action"],
+                "used": used,
+                "limit": rule["limit"],
+                "remaining": max(0, rule["limit"] - used),
+                "resets_in_seconds": resets_in,
+            })
+        return report
+
+    def evaluate(self, user_id: str | None, session_id: str | None) -> BudgetDecision:
+        """Checks the current usage of a user and session against all rules."""
+        decision = BudgetDecision()
+        try:
+            report = self.usage(user_id, session_id)
+        except Exception:
+            logger.error("[BUDGET] Could not read usage counters; allowing the turn.", exc_info=True)
+            return decision
+        for entry in report:
+            if entry["used"] >= entry["limit"]:
+                action = entry["action"]
+            elif entry["used"] >= entry["limit"] * BUDGET_SOFT_LIMIT_RATIO:
+                action = "degrade"
+            else:
+                continue
+            window = f"per {entry['window_seconds']}s" if entry["window_seconds"] else "lifetime"
+            decision.reasons.append(f"{entry['scope']} {entry['metric']} budget ({window}): {entry['used']:,} of {entry['limit']:,} used")
+            if _ACTION_RANK[action] > _ACTION_RANK[decision.action]:
+                decision.action = action
+                decision.rule = entry
+                decision.retry_after = entry["resets_in_seconds"]
+        return decision
+
+    def _apply_degrade(self, turn, decision: BudgetDecision) -> None:
+        if not turn.degraded:
+            logger.warning(f"[BUDGET] Turn of user '{turn.user_id}' runs degraded: {'; '.join(decision.reasons)}")
+        turn.degraded = True
+        turn.max_bytes_billed = BUDGET_DEGRADED_MAX_BYTES_BILLED
+        turn.budget_notice = ("The usage budget is nearly spent, so queries in this turn are limited to "
+                              f"{BUDGET_DEGRADED_MAX_BYTES_BILLED / 1024 ** 3:.1f} GiB billed. Keep queries narrow "
+                              "(filter on partition columns and select only the columns you need).")
+
+    def _count(self, action: str, queued_seconds: float = 0.0) -> None:
+        with self._lock:
+            self._decisions[action] += 1
+            self._queued_seconds += queued_seconds
+
+    async def admit(self, turn) -> BudgetDecision:
+        """
+        Decides whether a new turn may start, waiting on 'queue' rules if needed.
+
+        Degrades the turn in place when a soft limit or a 'degrade' rule applies.
+
+        Raises:
+            BudgetExceededError: If a 'reject' rule applies, or a 'queue' rule does not
+                reset within BUDGET_QUEUE_MAX_WAIT_SECONDS.
+        """
+        if not self.enabled:
+            return BudgetDecision()
+        waited = 0.0
+        while True:
+            decision = self.evaluate(turn.user_id, turn.session_id)
+            if decision.action != "queue":
+                break
+            wait = decision.retry_after or 1
+            if waited + wait > BUDGET_QUEUE_MAX_WAIT_SECONDS:
+                self._count("reject", waited)
+                raise BudgetExceededError(
+                    f"The service is over its usage budget. Please retry in {wait} seconds.",
+                    retry_after=wait, rule=decision.rule)
+            logger.info(f"[BUDGET] Queueing turn of user '{turn.user_id}' for {wait}s: {'; '.join(decision.reasons)}")
+            await asyncio.sleep(wait)
+            waited += wait
+
+        if decision.action == "reject":
+            self._count("reject", waited)
+            raise BudgetExceededError(
+                "Usage budget exceeded: " + "; ".join(decision.reasons),
+                retry_after=decision.retry_after, rule=decision.rule)
+        if decision.action == "degrade":
+            self._apply_degrade(turn, decision)
+        self._count("queue" if waited else decision.action, waited)
+        return decision
+
+    def enforce(self, turn) -> None:
+        """
+        Re-checks a running turn before its next model call or query.
+
+        A turn that crosses a 'reject' limit mid-way is stopped, so a looping
+        conversation cannot run past its budget; 'queue' rules only apply to new turns.
+
+        Raises:
+            BudgetExceededError: If a 'reject' rule applies.
+        """
+        if not self.enabled:
+            return
+        decision = self.evaluate(turn.user_id, turn.session_id)
+        if decision.action == "reject":
+            raise BudgetExceededError(
+                "Usage budget exceeded during the turn: " + "; ".join(decision.reasons),
+                retry_after=decision.retry_after, rule=decision.rule)
+        if decision.action == "degrade":
+            self._apply_degrade(turn, decision)
+
+    def record_turn_usage(self, turn, input_tokens: int = 0, output_tokens: int = 0, bytes_billed: int = 0) -> None:
+        """Adds usage to a turn and to the persisted counters."""
+        turn.input_tokens += input_tokens
+        turn.output_tokens += output_tokens
+        turn.bytes_billed += bytes_billed
+        if self.enabled:
+            self.record(turn.user_id, turn.session_id, input_tokens, output_tokens, bytes_billed)
+
+    def stats(self) -> dict:
+        """Returns how many turns were allowed, degraded, queued or rejected in this process, and the global usage."""
+        with self._lock:
+            decisions = dict(self._decisions)
+            queued_seconds = self._queued_seconds
+        return {
+            "enabled": self.enabled,
+            "decisions": decisions,
+            "avg_queue_seconds": round(queued_seconds / decisions["queue"], 2) if decisions["queue"] else 0.0,
+            "global": self.usage() if self.enabled else [],
+        }
+
+
+BUDGET = BudgetGovernor()
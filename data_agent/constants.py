@@ -14,11 +14,100 @@
 
 MODEL="gemini-2.5-pro" # Identifier for the specific generative model to be used by the agent. (e.g., "gemini-2.5-pro-preview-03-25")
 # MODEL="gemini-2.5-flash-preview-04-17"
+FAST_MODEL="gemini-2.5-flash" # Faster model for small talk, questions about the available data, short single-table lookups and clarification questions. Set to None to send every turn to MODEL.
 PROJECT_ID="mdp-ad-td-prd-476115" # The Google Cloud Project ID that contains the BigQuery datasets and tables to be analyzed. (e.g., "my-gcp-project-123")
 LOCATION="asia-south1" # The geographical location of the BigQuery datasets and tables to be analyzed (e.g., "US", "asia-northeast3")
 DATASET_NAME="mdp_ad_td_bqd_common" # The target BigQuery dataset name to be analyzed or for which data profiles are fetched. (e.g., "sales_data")
 TABLE_NAMES=[] # Optional list of specific table names within DATASET_NAME. If empty, operations might apply to all tables in the dataset. (e.g., ["orders", "customers"] or [])
 # - For Mahindra - mdp-ad-td-prd-476115.mdp_ad_td_bqd_common_dataprofiling.data_profile Local - "agentic-data.mdp_ad_td_bqd_common_dataprofiling.data_profile
 DATA_PROFILES_TABLE_FULL_ID="mdp-ad-td-prd-476115.mdp_ad_td_bqd_common_dataprofiling.data_profile" # Optional: Full BigQuery table ID where data profiling results are stored. Set to None or an empty string if not used. (e.g., "my_project.profiling_dataset.all_profiles", None, "")
+PROFILE_MAX_PERCENT_NULL=90 # Column profiles with a higher percent_null are left out of the prompt as noise. (e.g., 90)
 LOGGING_PROJECT_ID="srv-ad-nvoc-dev-445421" # The Google Cloud Project ID where logs should be sent. If None or empty, logging to Google Cloud is disabled. (e.g., "my-logging-project-123", None, "")
 GCS_BUCKET_FOR_DEBUGGING = "mahindra-t2data-debug-artifacts-nvoc-dev" # Optional: Google Cloud Storage bucket name for storing debugging artifacts. If None or empty, this feature is disabled. (e.g., "my-debug-bucket", None, "")
+
+# --- Filter-Value Grounding Index ---
+VALUE_INDEX_MAX_PERCENT_UNIQUE=5.0 # Columns whose data profile `percent_unique` is at or below this value are treated as low/medium cardinality and indexed. (e.g., 5.0)
+VALUE_INDEX_MAX_VALUES_PER_COLUMN=1000 # Upper bound on distinct values harvested and kept per column. (e.g., 1000)
+VALUE_INDEX_HARVEST_INTERVAL_SECONDS=6 * 60 * 60 # How often the index is refreshed with a distinct-value harvest from BigQuery. One worker per instance runs it and the others load its snapshot from VALUE_INDEX_SNAPSHOT_DIR. Set to 0 to rely on data profiles only. (e.g., 21600)
+VALUE_INDEX_HARVEST_MAX_BYTES_BILLED=5 * 1024 ** 3 # Safety cap on bytes billed per harvest query. (e.g., 5368709120 for 5 GiB)
+VALUE_INDEX_HARVEST_PARTITION_DAYS=90 # Tables that require a partition filter are harvested from their partitions of this many recent days. (e.g., 90)
+VALUE_INDEX_SNAPSHOT_DIR="/tmp/data_agent_value_index" # Directory shared by the gunicorn workers of one instance, where the worker that ran a harvest leaves it for the others.
+
+# --- Multi-Dataset Agent Registry ---
+DEFAULT_DATASET_ID="default" # Dataset id used when a request does not name one (and for the ADK `root_agent`).
+# Dataset profiles the service can answer questions about, keyed by the dataset id clients send to /api/chat.
+# Each profile may also set "instructions_override_file": a YAML file (relative to this package) whose sections
+# replace or extend the shared sections of instructions.yaml for that dataset, and "join_paths_file": a YAML file
+# (relative to this package) of curated join relationships used instead of join_paths.yaml (see join_graph.py).
+DATASET_PROFILES={
+    DEFAULT_DATASET_ID: {
+        "project_id": PROJECT_ID,
+        "location": LOCATION,
+        "dataset_name": DATASET_NAME,
+        "table_names": TABLE_NAMES,
+        "data_profiles_table_full_id": DATA_PROFILES_TABLE_FULL_ID,
+    },
+}
+AGENT_REGISTRY_MAX_MEMORY_BYTES=512 * 1024 ** 2 # Approximate memory cap for cached per-dataset agents, instructions and indexes. Least recently used datasets are evicted above it. (e.g., 536870912 for 512 MiB)
+
+# --- Live Metadata Refresh ---
+METADATA_REFRESH_INTERVAL_SECONDS=300 # How often each worker polls Dataplex and the data profiles table for changes and hot-swaps the agent instructions. Set to 0 to disable. (e.g., 300)
+PROMPT_CACHE_DIR="/tmp/data_agent_prompt_cache" # Directory shared by the gunicorn workers of one instance. The first worker to notice a change rebuilds the prompt and the others load it from here.
+
+# --- Context Caching ---
+CONTEXT_CACHE_ENABLED=True # If True, the static system instruction and tool declarations are stored once as an explicit Gemini cached-content resource and referenced by handle on every model call, instead of being resent in full.
+CONTEXT_CACHE_TTL_SECONDS=60 * 60 # Lifetime of a cached-content handle. It is extended while in use. (e.g., 3600)
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS=10 * 60 # A handle used recently is extended when it is this close to expiring. (e.g., 600)
+CONTEXT_CACHE_IDLE_SECONDS=30 * 60 # A handle that no worker used for this long is deleted instead of extended, so idle prefixes stop incurring storage cost. (e.g., 1800)
+CONTEXT_CACHE_MIN_TOKENS=4096 # Prefixes shorter than this (estimated) are not cached. Gemini rejects smaller cached contents. (e.g., 4096 for gemini-2.5-pro)
+CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS=5 * 60 # After a failed cache creation, requests for that prefix go uncached for this long before retrying. (e.g., 300)
+
+# --- Model Routing ---
+MODEL_ROUTING_ENABLED=True # If True, each turn is routed to FAST_MODEL or MODEL by a local heuristic over the question and the session (see routing.py).
+ROUTING_FAST_MAX_WORDS=20 # Questions longer than this (in words) always go to MODEL. (e.g., 20)
+ROUTING_ESCALATE_MIN_JOINS=1 # A FAST_MODEL answer whose SQL has at least this many JOINs is regenerated by MODEL. Set to 0 to keep all fast answers. (e.g., 1)
+
+# --- Usage Budgets ---
+BUDGET_ENABLED=True # If True, Gemini tokens and BigQuery bytes billed are metered per turn and the budgets below are enforced.
+BUDGET_DB_URL="sqlite:///./usage_budget.db" # SQLAlchemy URL of the usage counters. A file shared by all gunicorn workers of an instance.
+# Each rule limits one metric ('tokens' = input + output tokens, or 'bytes_billed') for one scope
+# ('session', 'user' or 'global') over a fixed window ('window_seconds', 0 = lifetime of the scope).
+# 'action' is what happens to new turns once the limit is reached:
+#   'reject'  - the turn is refused with HTTP 429 until the window resets.
+#   'queue'   - the turn waits for the window to reset (up to BUDGET_QUEUE_MAX_WAIT_SECONDS), then is rejected.
+#   'degrade' - the turn runs with queries capped at BUDGET_DEGRADED_MAX_BYTES_BILLED.
+# Any rule at BUDGET_SOFT_LIMIT_RATIO of its limit degrades the turn before the hard action applies.
+BUDGET_RULES=[
+    {"scope": "session", "metric": "tokens", "limit": 1_000_000, "window_seconds": 0, "action": "reject"},
+    {"scope": "session", "metric": "bytes_billed", "limit": 100 * 1024 ** 3, "window_seconds": 0, "action": "degrade"},
+    {"scope": "user", "metric": "tokens", "limit": 5_000_000, "window_seconds": 24 * 60 * 60, "action": "reject"},
+    {"scope": "user", "metric": "bytes_billed", "limit": 500 * 1024 ** 3, "window_seconds": 24 * 60 * 60, "action": "reject"},
+    {"scope": "global", "metric": "tokens", "limit": 2_000_000, "window_seconds": 60, "action": "queue"},
+    {"scope": "global", "metric": "bytes_billed", "limit": 10 * 1024 ** 4, "window_seconds": 24 * 60 * 60, "action": "degrade"},
+]
+BUDGET_SOFT_LIMIT_RATIO=0.9 # Share of a limit at which turns start running degraded. Set to 1.0 to disable. (e.g., 0.9)
+BUDGET_DEGRADED_MAX_BYTES_BILLED=1 * 1024 ** 3 # maximum_bytes_billed applied to queries of degraded turns. (e.g., 1073741824 for 1 GiB)
+BUDGET_QUEUE_MAX_WAIT_SECONDS=30 # Longest a turn waits on a 'queue' rule before it is rejected. (e.g., 30)
+
+# --- Query Coalescing ---
+SINGLE_FLIGHT_ENABLED=True # If True, identical queries (after normalization) that run at the same time share one BigQuery job and its result, within and across gunicorn workers.
+SINGLE_FLIGHT_WINDOW_SECONDS=60 # Identical queries started within the same window of this length attach to the same BigQuery job (via a deterministic job id). (e.g., 60)
+SINGLE_FLIGHT_FOLLOWER_WAIT_SECONDS=240 # How long a caller waits for another caller's in-process result before attaching to the BigQuery job directly. Keep below gunicorn's --timeout. (e.g., 240)
+SINGLE_FLIGHT_MAX_ATTEMPTS=3 # Job attempts per query when the shared job fails with a transient error (e.g. backendError, rateLimitExceeded). (e.g., 3)
+
+# --- Partition Pruning ---
+# Generated SQL is checked against the partitioning and clustering of the tables it reads before it runs (see partition_pruning.py).
+#   'rewrite' - date comparisons that wrap a TIMESTAMP/DATETIME partition column (e.g. DATE(BILL_DATE) BETWEEN ...) are
+#               rewritten into range predicates on the column; other findings are passed to the agent as notes.
+#   'guide'   - such queries are returned to the agent, unexecuted, with the suggested fix and the bytes it saves.
+#   'off'     - no analysis.
+PARTITION_PRUNING_MODE="rewrite"
+PARTITION_PRUNING_MIN_BYTES=1 * 1024 ** 3 # In 'guide' mode, queries whose dry run scans less than this run unchanged, with the guidance as a note. (e.g., 1073741824 for 1 GiB)
+PARTITION_PRUNING_MAX_UNFILTERED_BYTES=50 * 1024 ** 3 # A query that reads a partitioned table without a partition filter and scans at least this much is returned to the agent with guidance once per turn. Set to 0 to only add a note. (e.g., 53687091200 for 50 GiB)
+
+# --- Result Side Channel ---
+# Query results are returned to the client as typed columnar data next to the chat messages (see result_channel.py);
+# the agent only sees a preview, so it writes a short narrative instead of restating the table.
+RESULT_PREVIEW_ROWS=20 # Rows of a query result shown to the agent as a Markdown table. The full row count is always reported. (e.g., 20)
+RESULT_MAX_ROWS=10000 # Most rows of a query result sent to the client; larger results are truncated and flagged. (e.g., 10000)
+RESULT_FORMAT="json" # Default encoding of results in the chat response: 'json' (columnar JSON) or 'arrow' (base64 Arrow IPC stream). Clients can override it per request with "result_format".
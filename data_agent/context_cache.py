@@ -0,0 +1,470 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from .constants import (
+    PROMPT_CACHE_DIR,
+    CONTEXT_CACHE_TTL_SECONDS,
+    CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+    CONTEXT_CACHE_IDLE_SECONDS,
+    CONTEXT_CACHE_MIN_TOKENS,
+    CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS,
+)
+from .utils import shared_file_lock, estimate_tokens, start_periodic_task
+
+logger = logging.getLogger(__name__)
+
+_HANDLES_FILE = "context_cache_handles.json"
+# How often a worker writes its own last-use time to the shared handle file.
+_LAST_USED_WRITE_INTERVAL_SECONDS = 60
+# A handle this close to expiry is treated as expired when a request looks it up.
+_EXPIRY_SAFETY_SECONDS = 30
+
+
+def _serialize(value) -> str:
+    """Returns a stable string form of a system instruction, tool list or tool config."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_serialize(v) for v in value) + "]"
+    if hasattr(value, "model_dump"):
+        return json.dumps(value.model_dump(mode="json", exclude_none=True), sort_keys=True)
+    return json.dumps(value, sort_keys=True, default=str)
+
+def content_text(value) -> str:
+    """Returns the text parts of a system instruction or contents list, for token estimates."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return "\n".join(content_text(v) for v in value)
+    parts = getattr(value, "parts", None)
+    if parts is not None:
+        return "\n".join(getattr(p, "text", None) or "" for p in parts)
+    return _serialize(value)
+
+def _to_timestamp(expire_time) -> float | None:
+    if expire_time is None:
+        return None
+    if isinstance(expire_time, (int, float)):
+        return float(expire_time)
+    if isinstance(expire_time, datetime.datetime):
+        if expire_time.tzinfo is None:
+            expire_time = expire_time.replace(tzinfo=datetime.timezone.utc)
+        return expire_time.timestamp()
+    return None
+
+
+class LocalContextCacheClient:
+    """
+    An in-memory stand-in for the `caches` API of a `google.genai.Client`.
+
+    It implements the `caches.create/update/delete` calls used by ContextCacheManager
+    (with plain dict configs instead of `google.genai.types` objects), so the cache
+    lifecycle and token accounting can be exercised without a Gemini project, e.g.
+    `ContextCacheManager(client=LocalContextCacheClient())`. LocalGenerativeModelClient
+    serves model calls that reference its handles.
+    """
+
+    class _Caches:
+        def __init__(self):
+            self.entries: dict[str, dict] = {}
+
+        def create(self, model: str, config=None):
+            name = f"cachedContents/local-{uuid.uuid4().hex[:12]}"
+            ttl = _ttl_seconds((config or {}).get("ttl"))
+            self.entries[name] = {"model": model, "config": config, "expire_time": time.time() + (ttl or CONTEXT_CACHE_TTL_SECONDS)}
+            return _LocalCachedContent(name, self.entries[name]["expire_time"])
+
+        def update(self, name: str, config=None):
+            if name not in self.entries:
+                raise KeyError(f"Cached content {name} not found.")
+            ttl = _ttl_seconds((config or {}).get("ttl"))
+            self.entries[name]["expire_time"] = time.time() + (ttl or CONTEXT_CACHE_TTL_SECONDS)
+            return _LocalCachedContent(name, self.entries[name]["expire_time"])
+
+        def delete(self, name: str, config=None):
+            self.entries.pop(name, None)
+
+    def __init__(self):
+        self.caches = self._Caches()
+
+
+class LocalGenerativeModelClient:
+    """
+    An in-memory stand-in for the `aio.models.generate_content` call of a `google.genai.Client`.
+
+    Requests that reference a cached content are checked against a LocalContextCacheClient
+    like the real API does: a handle that was deleted or has expired is rejected with a 404
+    ClientError. Together they let DataAgentGemini run its cached call and its inline retry
+    without Gemini, e.g. `DataAgentGemini(model=MODEL).use_api_client(LocalGenerativeModelClient(caches))`.
+    Every request is recorded in `calls`.
+    """
+
+    class _Models:
+        def __init__(self, owner: "LocalGenerativeModelClient"):
+            self._owner = owner
+
+        async def generate_content(self, model: str, contents, config=None):
+            return self._owner.respond(model, contents, config)
+
+    def __init__(self, caches: LocalContextCacheClient | None = None, reply: str = "OK"):
+        self.caches_client = caches
+        self.reply = reply
+        self.calls: list[dict] = []
+        self.aio = type("_Aio", (), {})()
+        self.aio.models = self._Models(self)
+
+    def respond(self, model: str, contents, config=None):
+        from google.genai import errors, types
+
+        cached_content = getattr(config, "cached_content", None)
+        self.calls.append({"model": model, "cached_content": cached_content,
+                           "system_instruction": getattr(config, "system_instruction", None)})
+        prompt_tokens = estimate_tokens(content_text(contents))
+        cached_tokens = 0
+        if cached_content:
+            entry = self.caches_client.caches.entries.get(cached_content) if self.caches_client else None
+            if entry is None or entry["expire_time"] <= time.time():
+                message = f"Cached content {cached_content} not found or expired."
+                raise errors.ClientError(404, {"error": {"code": 404, "message": message, "status": "NOT_FOUND"}})
+            cached_tokens = estimate_tokens(content_text(entry["config"].get("system_instruction"))) + estimate_tokens(
+                _serialize(entry["config"].get("tools")))
+        else:
+            prompt_tokens += estimate_tokens(content_text(getattr(config, "system_instruction", None))) + estimate_tokens(
+                _serialize(getattr(config, "tools", None)))
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=self.reply)]),
+                                        finish_reason=types.FinishReason.STOP)],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens + cached_tokens,
+                cached_content_token_count=cached_tokens or None,
+                candidates_token_count=estimate_tokens(self.reply),
+            ),
+        )
+
+
+class _LocalCachedContent:
+    __slots__ = ("name", "expire_time")
+
+    def __init__(self, name: str, expire_time: float):
+        self.name = name
+        self.expire_time = expire_time
+
+def _ttl_seconds(ttl) -> float | None:
+    """Parses a '3600s' duration string as used by the caches API."""
+    if ttl is None:
+        return None
+    try:
+        return float(str(ttl).rstrip("s"))
+    except ValueError:
+        return None
+
+
+class ContextCacheManager:
+    """
+    Manages explicit Gemini cached-content handles for the static prompt prefix.
+
+    The system instruction, tool declarations and tool config of a request are stored
+    once as a cached-content resource and the request only references it by name, so
+    the large, stable prefix is not resent (and is billed at the cached rate) on every
+    model round trip. Handles are keyed by a hash of the model and the prefix, so all
+    sessions of an agent share one handle, and they are recorded in a file in
+    PROMPT_CACHE_DIR so that the gunicorn workers of an instance share them too.
+
+    Handles in use are extended shortly before they expire; handles that no worker
+    used for CONTEXT_CACHE_IDLE_SECONDS are deleted. A changed prompt (e.g. after a
+    metadata refresh) hashes to a new key, and the old handle ages out as idle.
+    """
+
+    def __init__(self, client=None, ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS, cache_dir: str = PROMPT_CACHE_DIR):
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._handles: dict[str, dict] = {}     # key -> {name, model, expire_time, last_used}
+        self._failed_until: dict[str, float] = {}
+        self._counters = {
+            "requests": 0, "cached_requests": 0, "uncached_requests": 0,
+            "cached_input_tokens": 0, "uncached_input_tokens": 0,
+            "creates": 0, "refreshes": 0, "deletes": 0, "failures": 0, "fallbacks": 0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai  # Imported lazily: only needed once caching is actually used.
+            self._client = genai.Client()
+        return self._client
+
+    # --- Keys and shared handle file ---
+
+    @staticmethod
+    def cache_key(model: str, system_instruction, tools=None, tool_config=None) -> str:
+        """Returns the cache key of a prompt prefix: a hash of the model and the serialized prefix."""
+        digest = hashlib.sha256()
+        for part in (model, _serialize(system_instruction), _serialize(tools), _serialize(tool_config)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()[:32]
+
+    def _handles_path(self) -> str:
+        return os.path.join(self.cache_dir, _HANDLES_FILE)
+
+    def _read_shared(self) -> dict:
+        try:
+            with open(self._handles_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logger.warning("[CONTEXT_CACHE] Could not read the shared handle file.", exc_info=True)
+            return {}
+
+    def _write_shared(self, handles: dict) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._handles_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(handles, f)
+        os.replace(tmp_path, self._handles_path())
+
+    # --- Lifecycle ---
+
+    def get_or_create(self, model: str, system_instruction, tools=None, tool_config=None) -> str | None:
+        """
+        Returns the name of a live cached-content handle for the prefix, creating it if needed.
+
+        Returns None when the prefix is too small to cache or creation recently failed;
+        the caller then sends the prefix inline.
+        """
+        key = self.cache_key(model, system_instruction, tools, tool_config)
+        now = time.time()
+
+        handle = self._handles.get(key)
+        if handle and handle["expire_time"] - _EXPIRY_SAFETY_SECONDS > now:
+            self._touch(key, handle, now)
+            return handle["name"]
+        if self._failed_until.get(key, 0) > now:
+            return None
+        if estimate_tokens(content_text(system_instruction)) + estimate_tokens(_serialize(tools)) < CONTEXT_CACHE_MIN_TOKENS:
+            return None
+
+        with shared_file_lock(self.cache_dir, "context-cache"):
+            shared = self._read_shared()
+            handle = shared.get(key)
+            if handle and handle["expire_time"] - _EXPIRY_SAFETY_SECONDS > now:
+                handle["last_used"] = now
+                self._write_shared(shared)
+            else:
+                try:
+                    handle = self._create(key, model, system_instruction, tools, tool_config)
+                except Exception:
+                    self._failed_until[key] = now + CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS
+                    with self._lock:
+                        self._counters["failures"] += 1
+                    logger.warning(f"[CONTEXT_CACHE] Could not create a cached content for prefix {key}; sending it inline.", exc_info=True)
+                    return None
+                shared[key] = handle
+                self._write_shared(shared)
+        with self._lock:
+            self._handles[key] = dict(handle, last_written=now)
+        return handle["name"]
+
+    def _create(self, key: str, model: str, system_instruction, tools, tool_config) -> dict:
+        start_time = time.time()
+        if isinstance(self._client, LocalContextCacheClient):
+            config = {"system_instruction": system_instruction, "tools": tools, "tool_config": tool_config,
+                      "ttl": f"{self.ttl_seconds}s", "display_name": f"data-agent-{key[:12]}"}
+        else:
+            from google.genai import types
+            config = types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                tools=tools or None,
+                tool_config=tool_config,
+                ttl=f"{self.ttl_seconds}s",
+                display_name=f"data-agent-{key[:12]}",
+            )
+        cached = self.client.caches.create(model=model, config=config)
+        expire_time = _to_timestamp(getattr(cached, "expire_time", None)) or start_time + self.ttl_seconds
+        with self._lock:
+            self._counters["creates"] += 1
+        duration = time.time() - start_time
+        logger.info(f"[CONTEXT_CACHE] Created cached content {cached.name} for model {model} (Duration: {duration:.2f} seconds).")
+        return {"name": cached.name, "model": model, "expire_time": expire_time, "last_used": start_time}
+
+    def _touch(self, key: str, handle: dict, now: float) -> None:
+        """Records a use, writing it to the shared file at most once per interval."""
+        handle["last_used"] = now
+        if now - handle.get("last_written", 0) < _LAST_USED_WRITE_INTERVAL_SECONDS:
+            return
+        handle["last_written"] = now
+        try:
+            with shared_file_lock(self.cache_dir, "context-cache"):
+                shared = self._read_shared()
+                if key in shared:
+                    shared[key]["last_used"] = max(shared[key].get("last_used", 0), now)
+                    self._write_shared(shared)
+        except Exception:
+            logger.warning("[CONTEXT_CACHE] Could not record handle use in the shared handle file.", exc_info=True)
+
+    def invalidate(self, name: str) -> None:
+        """Forgets a handle that the API rejected, so the next request recreates it."""
+        with shared_file_lock(self.cache_dir, "context-cache"):
+            shared = self._read_shared()
+            shared = {k: v for k, v in shared.items() if v.get("name") != name}
+            self._write_shared(shared)
+        with self._lock:
+            self._handles = {k: v for k, v in self._handles.items() if v.get("name") != name}
+
+    def maintain(self) -> None:
+        """
+        Extends handles that are in use and about to expire and deletes idle ones.
+
+        Runs periodically in every worker. The shared file lock makes sure each handle
+        is extended or deleted by one worker only.
+        """
+        now = time.time()
+        with self._lock:
+            local_last_used = {k: v.get("last_used", 0) for k, v in self._handles.items()}
+        with shared_file_lock(self.cache_dir, "context-cache"):
+            shared = self._read_shared()
+            changed = False
+            for key, handle in list(shared.items()):
+                last_used = max(handle.get("last_used", 0), local_last_used.get(key, 0))
+                if handle["expire_time"] <= now:
+                    del shared[key]
+                    changed = True
+                elif now - last_used > CONTEXT_CACHE_IDLE_SECONDS:
+                    self._delete(handle["name"])
+                    del shared[key]
+                    changed = True
+                elif handle["expire_time"] - now < CONTEXT_CACHE_REFRESH_MARGIN_SECONDS:
+                    try:
+                        handle["expire_time"] = self._refresh(handle["name"], now)
+                        handle["last_used"] = last_used
+                        changed = True
+                    except Exception:
+                        logger.warning(f"[CONTEXT_CACHE] Could not extend cached content {handle['name']}.", exc_info=True)
+                        del shared[key]
+                        changed = True
+            if changed:
+                self._write_shared(shared)
+        with self._lock:
+            self._handles = {k: dict(v, last_written=self._handles.get(k, {}).get("last_written", 0)) for k, v in shared.items()}
+
+    def _refresh(self, name: str, now: float) -> float:
+        if isinstance(self._client, LocalContextCacheClient):
+            config = {"ttl": f"{self.ttl_seconds}s"}
+        else:
+            from google.genai import types
+            config = types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+        updated = self.client.caches.update(name=name, config=config)
+        with self._lock:
+            self._counters["refreshes"] += 1
+        logger.info(f"[CONTEXT_CACHE] Extended cached content {name} by {self.ttl_seconds} seconds.")
+        return _to_timestamp(getattr(updated, "expire_time", None)) or now + self.ttl_seconds
+
+    def _delete(self, name: str) -> None:
+        try:
+            self.client.caches.delete(name=name)
+            with self._lock:
+                self._counters["deletes"] += 1
+            logger.info(f"[CONTEXT_CACHE] Deleted idle cached content {name}.")
+        except Exception:
+            logger.warning(f"[CONTEXT_CACHE] Could not delete cached content {name}.", exc_info=True)
+
+    def ensure_maintenance(self) -> None:
+        """Starts the periodic refresh/expiry task in the current worker process."""
+        interval = max(30, min(CONTEXT_CACHE_REFRESH_MARGIN_SECONDS, CONTEXT_CACHE_IDLE_SECONDS) // 2)
+        start_periodic_task("context-cache-maintenance", interval, self.maintain)
+
+    # --- Requests ---
+
+    def apply(self, llm_request) -> dict | None:
+        """
+        Moves the static prefix of an ADK LlmRequest into a cached-content handle.
+
+        Sets `config.cached_content` and clears the system instruction, tools and tool
+        config, which the API does not accept alongside a cached content.
+
+        Returns:
+            The removed fields (pass them to `restore()` to send the request uncached),
+            or None if the request is sent unchanged.
+        """
+        config = llm_request.config
+        if config is None or not config.system_instruction or getattr(config, "cached_content", None):
+            return None
+        self.ensure_maintenance()
+        name = self.get_or_create(llm_request.model, config.system_instruction, config.tools, config.tool_config)
+        if not name:
+            return None
+        saved = {
+            "cached_content": name,
+            "system_instruction": config.system_instruction,
+            "tools": config.tools,
+            "tool_config": config.tool_config,
+        }
+        config.cached_content = name
+        config.system_instruction = None
+        config.tools = None
+        config.tool_config = None
+        return saved
+
+    @staticmethod
+    def restore(llm_request, saved: dict) -> None:
+        """Undoes `apply()`, so the request carries its prefix inline again."""
+        config = llm_request.config
+        config.cached_content = None
+        config.system_instruction = saved["system_instruction"]
+        config.tools = saved["tools"]
+        config.tool_config = saved["tool_config"]
+
+    def record_usage(self, llm_request, usage_metadata=None, saved: dict | None = None, fallback: bool = False) -> int:
+        """
+        Records cached and uncached input tokens of one model call.
+
+        Uses the response's usage metadata when available and otherwise estimates the
+        prefix (cached if `saved` is set) and the conversation contents locally.
+
+        Returns:
+            The total number of input tokens of the call.
+        """
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", None)
+        if prompt_tokens is not None:
+            cached = getattr(usage_metadata, "cached_content_token_count", None) or 0
+            uncached = max(0, prompt_tokens - cached)
+        else:
+            config = llm_request.config
+            prefix = saved["system_instruction"] if saved else getattr(config, "system_instruction", None)
+            tools = saved["tools"] if saved else getattr(config, "tools", None)
+            prefix_tokens = estimate_tokens(content_text(prefix)) + estimate_tokens(_serialize(tools))
+            contents_tokens = estimate_tokens(content_text(llm_request.contents))
+            cached = prefix_tokens if saved else 0
+            uncached = contents_tokens + (0 if saved else prefix_tokens)
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["cached_requests" if saved else "uncached_requests"] += 1
+            self._counters["cached_input_tokens"] += cached
+            self._counters["uncached_input_tokens"] += uncached
+            if fallback:
+                self._counters["fallbacks"] += 1
+        return cached + uncached
+
+    def stats(self) -> dict:
+        """Returns handle and token counters, including the share of input tokens served from cache."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["live_handles"] = len(self._handles)
+        total = stats["cached_input_tokens"] + stats["uncached_input_tokens"]
+        stats["cached_token_ratio"] = round(stats["cached_input_tokens"] / total, 3) if total else None
+        return stats
+
+
+CONTEXT_CACHE = ContextCacheManager()
@@ -1,24 +1,41 @@
 import logging
 import time
 from google.cloud import bigquery
+from .arrow_utils import to_json_ready
+from .budget import BUDGET, BudgetExceededError
+from .constants import RESULT_MAX_ROWS
+from .registry import active_dataset
+from .result_channel import QueryResult
+from .single_flight import QUERY_COALESCER
+from .turn_context import current_turn
 
 # It's good practice to get the logger at the module level
 logger = logging.getLogger(__name__)
 
+def _materialize_results(query_job, results):
+    """
+    Downloads a finished query's rows once, as an Arrow table shared by coalesced callers.
+    `results` is capped at RESULT_MAX_ROWS rows; the returned count is the full result's.
+    """
+    if results.total_rows > 0:
+        return results.total_rows, results.to_arrow()
+    return 0, None
+
 def execute_bigquery_query(sql_query: str) -> str:
     """
     Executes a read-only (SELECT) GoogleSQL query on BigQuery and returns the result.
 
-    This tool is designed to be called by an AI agent. It returns data formatted
-    as a Markdown string for easy interpretation by the LLM. It also handles
-    cases where a query runs successfully but returns no data.
+    This tool is designed to be called by an AI agent. During a chat turn the full
+    result is sent to the user as a table next to the chat response, and the LLM
+    gets the row count and a preview of the first rows as a Markdown string. It also
+    handles cases where a query runs successfully but returns no data.
 
     Args:
         sql_query (str): The GoogleSQL query string to be executed. This must
                          be a valid and complete SQL statement.
 
     Returns:
-        str: A string containing the query results in a Markdown table format,
+        str: A string containing the query results (or their preview) in a Markdown table format,
              a message indicating no results were found, or a detailed error message.
     """
     logger.info("--- Starting BigQuery query execution ---")
@@ -27,32 +44,199 @@ def execute_bigquery_query(sql_query: str) -> str:
     # Log the exact query the LLM is attempting to run
     logger.info(f"[AGENT_TOOL] Executing LLM-generated query:\n---\n{sql_query}\n---")
 
+    dataset = active_dataset()
+    schema_validator = dataset.schema_validator
+
+    # Validate against the cached schema first, so invented tables/columns are
+    # reported back instantly instead of after a BigQuery round trip.
+    validation = schema_validator.validate(sql_query) if schema_validator.is_loaded else {"errors": [], "warnings": []}
+    if validation["errors"]:
+        logger.warning(f"[AGENT_TOOL] Query rejected by local schema validation: {validation['errors']}")
+        return ("The query was NOT executed because it failed validation against the table schema:\n"
+                + "\n".join(f"- {e}" for e in validation["errors"])
+                + "\nFix these references and call the tool again.")
+    warnings_note = ""
+    if validation["warnings"]:
+        logger.info(f"[AGENT_TOOL] Schema validation warnings: {validation['warnings']}")
+        warnings_note = "\n\nNote:\n" + "\n".join(f"- {w}" for w in validation["warnings"])
+
+    turn = current_turn()
+    job_config = bigquery.QueryJobConfig()
+    if turn is not None:
+        if turn.cancelled:
+            logger.info(f"[AGENT_TOOL] Query not executed: the turn was {turn.cancel_reason}.")
+            return f"The query was NOT executed: the request was {turn.cancel_reason}."
+        try:
+            BUDGET.enforce(turn)
+        except BudgetExceededError as e:
+            logger.warning(f"[AGENT_TOOL] Query not executed: {e}")
+            return f"The query was NOT executed: {e}. Tell the user their usage budget is spent and when they can retry."
+        if turn.max_bytes_billed:
+            job_config.maximum_bytes_billed = turn.max_bytes_billed
+            warnings_note += f"\n\nNote: {turn.budget_notice}"
+
     try:
-        client = bigquery.Client()
+        client = bigquery.Client(project=dataset.dataset["project_id"])
         logger.info("BigQuery client created successfully.")
 
-        query_job = client.query(sql_query)
-        results = query_job.result()  # Waits for the job to complete.
+        # Make sure the query can prune the partitions of the tables it reads: prunable
+        # rewrites of its date filters, or guidance when it would scan too much.
+        pruning = dataset.pruning_analyzer.check(client, sql_query, location=dataset.dataset.get("location"), turn=turn)
+        if pruning["rejection"]:
+            return ("The query was NOT executed because it does not let BigQuery prune partitions:\n"
+                    + pruning["rejection"] + "\nFix the query and call the tool again.")
+        if pruning["sql"] != sql_query:
+            logger.info(f"[AGENT_TOOL] Executing the partition-pruning rewrite:\n---\n{pruning['sql']}\n---")
+            sql_query = pruning["sql"]
+        if pruning["note"]:
+            warnings_note += "\n\nPartition pruning:\n" + pruning["note"]
+
+        # Identical queries running at the same time (in any worker) share one job. Jobs
+        # this turn creates are registered with it, so cancelling the turn cancels them.
+        outcome = QUERY_COALESCER.run(
+            client, sql_query, job_config=job_config, location=dataset.dataset.get("location"),
+            materialize=_materialize_results, on_job=turn.register_bigquery_job if turn is not None else None,
+            cancelled=(lambda: turn.cancelled) if turn is not None else None, max_results=RESULT_MAX_ROWS,
+        )
+        if turn is not None and outcome.role == "leader":
+            BUDGET.record_turn_usage(turn, bytes_billed=outcome.job.total_bytes_billed or 0)
+        total_rows, rows = outcome.value
 
-        if results.total_rows > 0:
-            logger.info(f"[AGENT_TOOL] Query successful. Fetched {results.total_rows} rows.")
-            df = results.to_dataframe()
-            
-            # Return results as a Markdown string for easy processing
-            return df.to_markdown(index=False, tablefmt="pipe")
+        if total_rows > 0:
+            logger.info(f"[AGENT_TOOL] Query successful. Fetched {rows.num_rows} of {total_rows} rows "
+                        f"(job {outcome.job.job_id}, {outcome.role}).")
+
+            if turn is None:
+                # No client to send the table to (e.g. the ADK CLI): return the fetched rows as Markdown.
+                header = f"The query returned {total_rows:,} rows; the first {rows.num_rows:,} are below.\n\n" if rows.num_rows < total_rows else ""
+                return header + to_json_ready(rows).to_pandas().to_markdown(index=False, tablefmt="pipe") + warnings_note
+            result = QueryResult(sql_query, rows, total_rows, job_id=outcome.job.job_id)
+            turn.results.append(result)
+            return result.preview() + warnings_note
         else:
             # This clear message prevents the LLM from getting confused by an empty result
             logger.info("[AGENT_TOOL] Query successful but returned no results.")
-            return "The query executed successfully but returned no matching data."
+            return "The query executed successfully but returned no matching data." + warnings_note
 
     except Exception as e:
         logger.error(
             "--- BigQuery query execution failed ---",
             exc_info=True # Provides the full traceback in your logs for debugging
         )
+        schema_validator.record_bigquery_failure(str(e), time.time() - start_time)
         # This provides a clear error message back to the LLM
         return f"An error occurred while executing the BigQuery query: {str(e)}"
     
     finally:
         duration = time.time() - start_time
-        logger.info(f"--- BigQuery query execution finished (Duration: {duration:.2f} seconds) ---")
\ No newline at end of file
+        logger.info(f"--- BigQuery query execution finished (Duration: {duration:.2f} seconds) ---")
+
+def lookup_filter_values(column_name: str, value: str, table_name: str = "") -> str:
+    """
+    Checks whether a filter value exists in a column, using a local index of distinct values.
+
+    Use this tool to ground user-provided filter values (e.g., a zone, model or status)
+    before writing SQL. It answers instantly from memory and does not run a BigQuery job.
+
+    Args:
+        column_name (str): The column the user wants to filter on (e.g., "zone_name").
+        value (str): The filter value as provided by the user (e.g., "North Star").
+        table_name (str): Optional table name to restrict the search (e.g., "ddp_service_cmm_kpis").
+
+    Returns:
+        str: The exact value to use if it exists, otherwise the closest known values,
+             or a message saying the column is not indexed.
+    """
+    value_index = active_dataset().value_index
+    value_index.ensure_harvester()
+    matches = value_index.lookup(column_name=column_name, value=value, table_name=table_name)
+    logger.info(f"[AGENT_TOOL] lookup_filter_values(column='{column_name}', value='{value}', table='{table_name}') -> {len(matches)} matches")
+
+    if not matches:
+        indexed_columns = {c.split('.')[-1].lower() for c in value_index.known_columns(table_name)}
+        if column_name.lower() not in indexed_columns:
+            return (f"The column '{column_name}' is not in the value index (it may be high-cardinality or unprofiled). "
+                    "Fall back to the data profiles and sample data, or ask the user to confirm the value.")
+        return f"No value similar to '{value}' was found in column '{column_name}'. Ask the user to confirm or correct the value."
+
+    lines = []
+    for m in matches:
+        count_str = f", {m['count']:,} rows" if m["count"] else ""
+        lines.append(f"- `{m['table_name']}.{m['column_name']}` = '{m['value']}' ({m['match_type']} match{count_str})")
+    if matches[0]["match_type"] == "exact":
+        header = f"Exact match found for '{value}'. Use the stored value exactly as shown:"
+    else:
+        header = f"No exact match for '{value}'. Closest known values (confirm with the user before using one):"
+    return header + "\n" + "\n".join(lines)
+
+def find_join_path(tables: str) -> str:
+    """
+    Returns how to join tables: the join sequence with the exact ON conditions, using the
+    approved and catalog-declared join relationships. It answers instantly from a
+    precomputed join graph and does not run a BigQuery job.
+
+    Call it before writing any query that reads more than one table, and use the returned
+    ON conditions as-is (all key pairs of a join are required).
+
+    Args:
+        tables (str): Comma-separated names of the tables the query needs
+                      (e.g., "ddp_service_cmm_kpis, stg2_sv_type_catg_master").
+                      Intermediate tables needed to connect them are added automatically.
+
+    Returns:
+        str: The joins in order (with join type, cardinality and alternatives) and warnings
+             about joins that multiply rows, or the tables that could not be found or connected.
+    """
+    join_graph = active_dataset().join_graph
+    names = [t.strip() for t in (tables or "").split(",") if t.strip()]
+    if not names:
+        return "Pass the table names as a comma-separated list, e.g. \"ddp_service_cmm_kpis, stg2_sv_type_catg_master\"."
+    result = join_graph.find_path(names)
+    logger.info(f"[AGENT_TOOL] find_join_path({names}) -> {len(result['joins'])} joins, "
+                f"unknown={list(result['unknown'])}, unreachable={result['unreachable']}")
+
+    lines = []
+    for name, matches in result["unknown"].items():
+        hint = f" Did you mean: {', '.join(matches)}?" if matches else ""
+        lines.append(f"Table `{name}` has no known join relationships.{hint}")
+    if len(names) == 1 and not result["unknown"]:
+        table = result["tables"][0]
+        neighbors = join_graph.neighbors(table)
+        if not neighbors:
+            return f"Table `{table}` has no known join relationships."
+        lines.append(f"Tables that join directly with `{table}`:")
+        for edge in neighbors:
+            other = edge.right if edge.left.lower() == table.lower() else edge.left
+            lines.append(f"- `{other}` ON {edge.on_clause()}")
+        return "\n".join(lines)
+
+    if result["joins"]:
+        lines.append(f"Join path for {', '.join(f'`{t}`' for t in result['tables'])}. "
+                     f"Start FROM `{result['tables'][0]}` and add the joins in this order:")
+        for i, join in enumerate(result["joins"], 1):
+            edge = join["edge"]
+            details = [join["join_type"] + " JOIN"]
+            if join["cardinality"]:
+                details.append(join["cardinality"])
+            if edge.approved:
+                details.append(f"approved{': ' + edge.label if edge.label else ''}")
+            elif edge.label:
+                details.append(edge.label)
+            lines.append(f"{i}. `{join['from']}` -> `{join['to']}` ON {edge.on_clause()} ({'; '.join(details)})")
+            if edge.description:
+                lines.append(f"   {edge.description}")
+            for alternative in join["alternatives"]:
+                lines.append(f"   Alternative: ON {alternative.on_clause()}")
+            if join["cardinality"] == "MANY_TO_MANY":
+                lines.append(f"   Warning: this join is many-to-many and multiplies the rows of both tables; "
+                             "aggregate one side to the join keys before joining.")
+        lines.append("Replace the table names in the ON conditions with your aliases. Use only the joins listed here.")
+        for trap in result["fan_traps"]:
+            sides = ", ".join(f"`{t}`" for t in trap["tables"])
+            lines.append(f"Warning: {sides} each have many rows per row of `{trap['table']}`, so joining them through it "
+                         "is many-to-many and inflates SUM and COUNT results. Aggregate each of them to the keys of "
+                         f"`{trap['table']}` in a separate CTE first, then join the aggregates.")
+    if result["unreachable"]:
+        lines.append(f"No join path connects {', '.join(f'`{t}`' for t in result['unreachable'])} with the other tables. "
+                     "Query them separately or ask the user how they relate.")
+    return "\n".join(lines)
@@ -14,24 +14,29 @@
 
 import os
 import datetime
+import functools
 import logging
 import json
 import yaml
 import time
 import tempfile
-import google.generativeai as genai
+import threading
 
-# GCP Imports
-from google.cloud import storage
+try:
+    import orjson  # Optional: a faster serializer for the (large) prompt data sections.
+except ImportError:
+    orjson = None
 
 # Import your project's modules
 from .utils import (
     fetch_table_entry_metadata,
     fetch_bigquery_data_profiles,
     fetch_sample_data_for_tables,
-    log_startup_kpis
+    log_startup_kpis,
+    estimate_tokens,
+    without_join_relationships,
 )
-from .constants import MODEL, GCS_BUCKET_FOR_DEBUGGING
+from .constants import GCS_BUCKET_FOR_DEBUGGING, DEFAULT_DATASET_ID
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +58,17 @@ def _log_prompt_for_debugging(prompt_content: str):
     except Exception as e:
         logger.warning(f"Could not create or log the structured debug prompt: {e}")
 
+def _upload_prompt_to_gcs(prompt_content: str, filename: str):
+    try:
+        from google.cloud import storage  # Deferred: only needed for this debugging upload.
+        client = storage.Client()
+        bucket = client.bucket(GCS_BUCKET_FOR_DEBUGGING)
+        blob = bucket.blob(filename)
+        blob.upload_from_string(prompt_content)
+        logger.info(f"Successfully saved full prompt to GCS: gs://{GCS_BUCKET_FOR_DEBUGGING}/{filename}")
+    except Exception as e:
+        logger.warning(f"Could not save prompt for debugging. This will not affect the application's functionality. Error: {e}")
+
 def _save_instructions_for_debugging(prompt_content: str):
     """
     Saves the final generated prompt to a file for easier debugging.
@@ -69,12 +85,10 @@ def _save_instructions_for_debugging(prompt_content: str):
         is_cloud_run = os.environ.get('K_SERVICE')
 
         if is_cloud_run:
-            # Save to GCS
-            client = storage.Client()
-            bucket = client.bucket(GCS_BUCKET_FOR_DEBUGGING)
-            blob = bucket.blob(filename)
-            blob.upload_from_string(prompt_content)
-            logger.info(f"Successfully saved full prompt to GCS: gs://{GCS_BUCKET_FOR_DEBUGGING}/{filename}")
+            # Save to GCS in the background: the upload (and importing the storage client)
+            # should not delay startup.
+            threading.Thread(target=_upload_prompt_to_gcs, args=(prompt_content, filename),
+                             name="prompt-debug-upload", daemon=True).start()
         else:
             # Save to local temporary directory
             temp_dir = tempfile.gettempdir()
@@ -87,75 +101,133 @@ def _save_instructions_for_debugging(prompt_content: str):
         # Log the error but do not raise it, so the application can continue.
         logger.warning(f"Could not save prompt for debugging. This will not affect the application's functionality. Error: {e}")
 
-def _build_master_instructions() -> str:
+@functools.lru_cache(maxsize=None)
+def _load_instruction_sections(override_file: str | None = None) -> dict:
     """
-    (Internal Helper) Fetches, formats, and combines all context for the agent.
-    This function runs only once at server startup and logs KPIs.
+    Loads the instruction template sections from instructions.yaml.
+
+    The base sections are parsed once and shared by every dataset. If `override_file`
+    is given (relative to this package), its sections replace the base sections with
+    the same key and any new sections are appended, so datasets only carry the parts
+    of the prompt that actually differ.
     """
-    app_start_time = time.time()
-    logger.info("Building master agent instructions... (This should only run once!)")
-    
-    # 1. Fetch all dynamic data from utils
-    table_metadata = fetch_table_entry_metadata()
-    data_profiles = fetch_bigquery_data_profiles()
-    samples = []
-    if not data_profiles:
-        logger.info("Data profiles not found. Fetching sample data as a fallback.")
-        samples = fetch_sample_data_for_tables()
-
-    # 2. Format data into strings for the prompt
-    table_metadata_str = json.dumps(table_metadata, indent=2, default=json_serial_default)
-    data_profiles_str = json.dumps(data_profiles, indent=2, default=json_serial_default)
-    samples_str = json.dumps(samples, indent=2, default=json_serial_default)
-    
-    # 3. Load the static instruction template from the YAML file
     script_dir = os.path.dirname(__file__)
-    yaml_file_path = os.path.join(script_dir, 'instructions.yaml')
-    with open(yaml_file_path, 'r', encoding='utf-8') as f:
-        instructions_yaml = yaml.safe_load(f)
-    
-    instruction_template = "\n---\n".join(instructions_yaml.values())
-
-    # 4. Inject dynamic data into the final prompt
-    final_prompt = instruction_template.format(
+    if not override_file:
+        with open(os.path.join(script_dir, 'instructions.yaml'), 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f)
+    # Start from the cached base sections so their strings are shared, not re-parsed.
+    sections = dict(_load_instruction_sections())
+    with open(os.path.join(script_dir, override_file), 'r', encoding='utf-8') as f:
+        sections.update(yaml.safe_load(f) or {})
+    return sections
+
+def _canonical_json(data) -> str:
+    """Serializes prompt data deterministically (sorted keys, fixed indentation)."""
+    if orjson is not None:
+        # Same layout as json.dumps below; only floats in exponent notation differ (1e-7 vs 1e-07).
+        options = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(data, option=options, default=json_serial_default).decode('utf-8')
+    return json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False, default=json_serial_default)
+
+def _static_sections_first(sections: dict) -> list[str]:
+    """
+    Orders the instruction sections so that the ones without data placeholders come
+    first (in their YAML order), followed by the ones that embed fetched data.
+    """
+    placeholders = ("{table_metadata}", "{data_profiles}", "{samples}")
+    static = [text for text in sections.values() if not any(p in text for p in placeholders)]
+    dynamic = [text for text in sections.values() if any(p in text for p in placeholders)]
+    return static + dynamic
+
+def render_instructions(dataset: dict, table_metadata: list[dict], data_profiles: list[dict], samples: list[dict]) -> str:
+    """
+    Formats already fetched metadata, profiles and samples into the final prompt.
+
+    This is pure string work, so the live metadata refresher can re-render the prompt
+    after re-fetching only the parts that changed.
+
+    The output is canonical: the same inputs always give byte-identical prompts,
+    regardless of catalog search order or dict iteration order, and the static sections
+    come first. That keeps the long static prefix stable for provider-side prefix caching
+    and for the explicit context cache (see context_cache.py).
+    """
+    # Format data into strings for the prompt, in a canonical order
+    # Join relationships are looked up with the `find_join_path` tool (see join_graph.py), not read from the prompt.
+    table_metadata_str = _canonical_json(sorted(without_join_relationships(table_metadata), key=lambda t: t.get('table_name') or ''))
+    data_profiles_str = _canonical_json(sorted(data_profiles, key=lambda p: (p.get('source_table_id') or '', p.get('column_name') or '')))
+    samples_str = _canonical_json(sorted(samples, key=lambda t: t.get('table_name') or ''))
+
+    # Load the (shared) static instruction template, static sections first
+    instructions_yaml = _load_instruction_sections(dataset.get("instructions_override_file"))
+    instruction_template = "\n---\n".join(_static_sections_first(instructions_yaml))
+
+    # Inject dynamic data into the final prompt
+    return instruction_template.format(
         table_metadata=table_metadata_str,
         data_profiles=data_profiles_str,
         samples=samples_str
     )
-    
+
+def build_dataset_instructions(dataset_id: str, dataset: dict, profiles_cache_key: str | None = None) -> dict:
+    """
+    Fetches, formats, and combines all context for the agent of one dataset and logs KPIs.
+
+    Args:
+        dataset_id: The id of the dataset profile (a key of DATASET_PROFILES).
+        dataset: The dataset profile.
+        profiles_cache_key: Optional version of the data profiles table; see
+            `fetch_bigquery_data_profiles()`.
+
+    Returns:
+        A dictionary with the final 'prompt' and the raw 'table_metadata',
+        'data_profiles' and 'samples' it was built from.
+    """
+    app_start_time = time.time()
+    logger.info(f"Building agent instructions for dataset '{dataset_id}'...")
+
+    # 1. Fetch all dynamic data from utils
+    table_metadata = fetch_table_entry_metadata(dataset)
+    data_profiles = fetch_bigquery_data_profiles(dataset, cache_key=profiles_cache_key)
+    samples = []
+    if not data_profiles:
+        logger.info("Data profiles not found. Fetching sample data as a fallback.")
+        samples = fetch_sample_data_for_tables(dataset=dataset)
+
+    # 2-4. Format the data and inject it into the (shared) static instruction template
+    final_prompt = render_instructions(dataset, table_metadata, data_profiles, samples)
+
     # 5. Log and save the final prompt for debugging purposes
     logger.info("\n--- START: FINAL POPULATED AGENT INSTRUCTIONS (DEBUG VIEW) ---\n\n")
     _log_prompt_for_debugging(final_prompt)
     logger.info("---\n\n END: FINAL POPULATED AGENT INSTRUCTIONS (DEBUG VIEW) ---\n")
-    
+
     # --- NEW: Save the instructions to a file ---
     _save_instructions_for_debugging(final_prompt)
-    
+
     # --- KPI Calculation and Logging ---
-    try:
-        model_for_token_count = genai.GenerativeModel(MODEL)
-        token_count = model_for_token_count.count_tokens(final_prompt).total_tokens
-    except Exception as e:
-        token_count = 0
-        logging.warning(f"Could not calculate token count: {e}")
+    # Estimated locally: a count_tokens call would add a network round trip to every build.
+    token_count = estimate_tokens(final_prompt)
     total_load_time = time.time() - app_start_time
-    
+
     log_startup_kpis(
-        metadata=table_metadata, 
+        metadata=table_metadata,
         profiles=data_profiles,
         token_count=token_count,
         load_time=total_load_time
     )
     # --- End KPI Logic ---
 
-    logger.info(f"[AGENT_INSTRUCTIONS] Caching complete. Final prompt length: {len(final_prompt)} characters.")
-    return final_prompt
-
-# This variable is populated only ONCE when the module is first imported.
-CACHED_INSTRUCTIONS = _build_master_instructions()
-
-def return_instructions_bigquery() -> str:
-    """Returns the pre-cached master instructions instantly from a module-level variable."""
-    logger.info(f"Returning CACHED_INSTRUCTIONS. Length: {len(CACHED_INSTRUCTIONS)} characters.")
-    logger.debug("[AGENT_INSTRUCTIONS] CACHED_INSTRUCTIONS requested.")
-    return CACHED_INSTRUCTIONS
+    logger.info(f"[AGENT_INSTRUCTIONS] Build complete for dataset '{dataset_id}'. Final prompt length: {len(final_prompt)} characters.")
+    return {
+        "prompt": final_prompt,
+        "table_metadata": table_metadata,
+        "data_profiles": data_profiles,
+        "samples": samples,
+    }
+
+def return_instructions_bigquery(dataset_id: str = DEFAULT_DATASET_ID) -> str:
+    """Returns the cached instructions of a dataset, building them on first use."""
+    from .registry import REGISTRY  # Imported here: the registry builds its entries with this module.
+    instructions = REGISTRY.get(dataset_id).instructions
+    logger.debug(f"[AGENT_INSTRUCTIONS] Instructions requested for dataset '{dataset_id}'. Length: {len(instructions)} characters.")
+    return instructions
@@ -0,0 +1,269 @@
+import difflib
+import functools
+import heapq
+import logging
+import os
+import threading
+import time
+import yaml
+from .constants import DATASET_PROFILES, DEFAULT_DATASET_ID
+from .utils import extract_join_relationships
+
+logger = logging.getLogger(__name__)
+
+# Join type and cardinality of an edge read from its right table to its left table.
+_REVERSED_JOIN_TYPES = {"LEFT": "RIGHT", "RIGHT": "LEFT"}
+_REVERSED_CARDINALITIES = {"ONE_TO_MANY": "MANY_TO_ONE", "MANY_TO_ONE": "ONE_TO_MANY"}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_curated_relationships(join_paths_file: str = "join_paths.yaml") -> tuple:
+    """Loads the curated relationships of a join paths file (relative to this package)."""
+    path = os.path.join(os.path.dirname(__file__), join_paths_file)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return tuple((yaml.safe_load(f) or {}).get('relationships') or [])
+    except FileNotFoundError:
+        logger.warning(f"[JOIN_GRAPH] Join paths file '{join_paths_file}' not found; using the catalog aspects only.")
+        return ()
+
+
+class JoinEdge:
+    """One way to join two tables: key pairs combined with AND, or an expression condition."""
+
+    __slots__ = ("left", "right", "join_keys", "condition", "join_type", "cardinality", "description", "label", "approved", "source")
+
+    def __init__(self, left: str, right: str, join_keys=(), condition: str | None = None, join_type: str = "INNER",
+                 cardinality: str | None = None, description: str | None = None, label: str | None = None,
+                 approved: bool = False, source: str = "aspect"):
+        self.left = left
+        self.right = right
+        self.join_keys = [tuple(pair) for pair in join_keys or ()]
+        self.condition = condition
+        self.join_type = (join_type or "INNER").upper()
+        self.cardinality = cardinality.strip().upper().replace("-", "_").replace(" ", "_") if cardinality else None
+        self.description = description
+        self.label = label
+        self.approved = approved
+        self.source = source
+
+    def identity(self) -> tuple:
+        """Identifies the join independently of its direction, to merge duplicates across sources."""
+        if self.condition:
+            return frozenset((self.left.lower(), self.right.lower())), self.condition
+        return frozenset((self.left.lower(), self.right.lower())), frozenset(
+            frozenset(((self.left.lower(), l.lower()), (self.right.lower(), r.lower()))) for l, r in self.join_keys)
+
+    def walked_from(self, table: str) -> tuple[str, str | None]:
+        """Returns the join type and cardinality of this join read from `table` to the other table."""
+        if table.lower() == self.left.lower():
+            return self.join_type, self.cardinality
+        return (_REVERSED_JOIN_TYPES.get(self.join_type, self.join_type),
+                _REVERSED_CARDINALITIES.get(self.cardinality, self.cardinality))
+
+    def on_clause(self, left_alias: str | None = None, right_alias: str | None = None) -> str:
+        """Renders the ON condition, qualifying the columns with the given aliases (default: the table names)."""
+        left_alias, right_alias = left_alias or self.left, right_alias or self.right
+        if self.condition:
+            return self.condition.format(left=left_alias, right=right_alias)
+        return " AND ".join(f"{left_alias}.{l} = {right_alias}.{r}" for l, r in self.join_keys)
+
+
+class JoinGraph:
+    """
+    A graph of the tables of a dataset and the ways to join them, built from the join
+    relationship aspects of the catalog and the curated relationships of join_paths.yaml
+    (or the dataset's "join_paths_file").
+
+    The shortest join path between every pair of tables is precomputed when the metadata
+    is loaded: fewest joins first, then fewest joins that are not approved. `find_path()`
+    connects two or more tables from these paths, so a lookup costs microseconds and the
+    join documentation does not have to be part of the prompt. It also reports fan traps:
+    a table on the "one" side of joins with two or more tables, whose rows multiply when
+    they are joined through it.
+    """
+
+    def __init__(self, dataset: dict | None = None):
+        self.dataset = dataset or DATASET_PROFILES[DEFAULT_DATASET_ID]
+        self._lock = threading.Lock()
+        self._names: dict[str, str] = {}  # lower-cased table name -> table name
+        self._edges: dict[str, dict[str, list[JoinEdge]]] = {}  # table -> neighbor -> edges, best first
+        self._paths: dict[str, dict[str, tuple]] = {}  # source -> destination -> (cost, tables on the path)
+        self._edge_count = 0
+        self._lookups = 0
+        self._lookup_seconds = 0.0
+        self._unresolved = 0
+        self._fan_traps = 0
+
+    def load_metadata(self, table_metadata: list[dict]) -> None:
+        """(Re)builds the graph and its shortest paths from `fetch_table_entry_metadata()` output."""
+        start_time = time.perf_counter()
+        edges: dict[tuple, JoinEdge] = {}
+        names = {(t.get('table_name') or '').lower(): t.get('table_name') for t in table_metadata or [] if t.get('table_name')}
+
+        candidates = [
+            JoinEdge(rel['table_name'], rel['related_table_name'], join_keys=rel['join_keys'], join_type=rel['join_type'],
+                     cardinality=rel['cardinality'], description=rel['description'], source="aspect")
+            for rel in extract_join_relationships(table_metadata) if rel['join_keys']
+        ]
+        for rel in _load_curated_relationships(self.dataset.get("join_paths_file") or "join_paths.yaml"):
+            if not rel.get('table') or not rel.get('related_table') or not (rel.get('join_keys') or rel.get('condition')):
+                continue
+            candidates.append(JoinEdge(
+                rel['table'], rel['related_table'], join_keys=rel.get('join_keys'), condition=rel.get('condition'),
+                join_type=rel.get('join_type'), cardinality=rel.get('cardinality'), description=rel.get('description'),
+                label=rel.get('label'), approved=bool(rel.get('approved')), source="curated"))
+
+        for edge in candidates:
+            existing = edges.get(edge.identity())
+            if existing is None:
+                edges[edge.identity()] = edge
+                continue
+            # The same join declared twice: keep the catalog's record and merge the curated flags into it.
+            existing.approved = existing.approved or edge.approved
+            existing.label = existing.label or edge.label
+            existing.cardinality = existing.cardinality or edge.cardinality
+            existing.description = existing.description or edge.description
+
+        adjacency: dict[str, dict[str, list[JoinEdge]]] = {}
+        for edge in edges.values():
+            for a, b in ((edge.left, edge.right), (edge.right, edge.left)):
+                names.setdefault(a.lower(), a)
+                adjacency.setdefault(a.lower(), {}).setdefault(b.lower(), []).append(edge)
+        for neighbors in adjacency.values():
+            for edge_list in neighbors.values():
+                # Approved first, then catalog-declared, then the most specific (most keys).
+                edge_list.sort(key=lambda e: (not e.approved, e.source != "aspect", -len(e.join_keys)))
+
+        paths = {source: self._shortest_paths(adjacency, source) for source in adjacency}
+        with self._lock:
+            self._names = names
+            self._edges = adjacency
+            self._paths = paths
+            self._edge_count = len(edges)
+        logger.info(f"[JOIN_GRAPH] Built a join graph of {len(adjacency)} tables and {len(edges)} relationships; "
+                    f"precomputed {sum(len(p) for p in paths.values())} paths in {(time.perf_counter() - start_time) * 1000:.1f} ms.")
+
+    @staticmethod
+    def _shortest_paths(adjacency: dict, source: str) -> dict[str, tuple]:
+        """Dijkstra over (joins, joins that are not approved) from `source`."""
+        best = {source: (0, 0)}
+        previous: dict[str, str] = {}
+        queue = [((0, 0), source)]
+        while queue:
+            cost, node = heapq.heappop(queue)
+            if cost > best.get(node, cost):
+                continue
+            for neighbor, edge_list in adjacency.get(node, {}).items():
+                candidate = (cost[0] + 1, cost[1] + (0 if edge_list[0].approved else 1))
+                if candidate < best.get(neighbor, (float("inf"), 0)):
+                    best[neighbor] = candidate
+                    previous[neighbor] = node
+                    heapq.heappush(queue, (candidate, neighbor))
+        paths = {}
+        for target in best:
+            if target == source:
+                continue
+            path = [target]
+            while path[-1] != source:
+                path.append(previous[path[-1]])
+            paths[target] = (best[target], path[::-1])
+        return paths
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self._edges)
+
+    def resolve(self, table: str) -> str | None:
+        """Returns the graph key of a table name (also accepts `dataset.table` and backticks), or None."""
+        key = table.strip().strip('`').split('.')[-1].lower()
+        return key if key in self._edges or key in self._names else None
+
+    def find_path(self, tables: list[str]) -> dict:
+        """
+        Connects tables with the fewest joins.
+
+        Two tables are connected by their precomputed shortest path; more tables are added
+        one at a time, each through the shortest path to any table already connected.
+
+        Args:
+            tables: Two or more table names.
+
+        Returns:
+            A dictionary with 'tables' (every table of the result, in join order), 'joins'
+            (one entry per join: the table already connected, the table it joins, the chosen
+            JoinEdge, the join type and cardinality read in that direction, and the alternative
+            edges), 'fan_traps' (tables on the "one" side of joins with two or more tables on
+            the "many" side, e.g. a dimension between two fact tables, with those tables),
+            'unreachable' (tables with no path to the others) and 'unknown' (names not in the
+            graph, with close matches).
+        """
+        start_time = time.perf_counter()
+        result = {"tables": [], "joins": [], "fan_traps": [], "unreachable": [], "unknown": {}}
+        keys = []
+        for table in tables:
+            key = self.resolve(table)
+            if key is None:
+                result["unknown"][table] = [self._names.get(m, m) for m in difflib.get_close_matches(
+                    table.strip().strip('`').split('.')[-1].lower(), list(self._names), n=3, cutoff=0.6)]
+            elif key not in keys:
+                keys.append(key)
+
+        if keys:
+            connected = [keys[0]]
+            remaining = keys[1:]
+            while remaining:
+                options = [(self._paths[source][target][0], i, source, target)
+                           for i, source in enumerate(connected) for target in remaining if target in self._paths.get(source, {})]
+                if not options:
+                    result["unreachable"].extend(self._names.get(t, t) for t in remaining)
+                    break
+                _, _, source, target = min(options)
+                path = self._paths[source][target][1]
+                for a, b in zip(path, path[1:]):
+                    if b in connected:
+                        continue
+                    edge_list = self._edges[a][b]
+                    join_type, cardinality = edge_list[0].walked_from(a)
+                    result["joins"].append({"from": self._names.get(a, a), "to": self._names.get(b, b),
+                                            "edge": edge_list[0], "join_type": join_type, "cardinality": cardinality,
+                                            "alternatives": edge_list[1:]})
+                    connected.append(b)
+                remaining.remove(target)
+            result["tables"] = [self._names.get(k, k) for k in connected]
+
+            # Tables on the "many" side of each table's joins; two or more multiply each other's rows.
+            many_sides: dict[str, list[str]] = {}
+            for join in result["joins"]:
+                if join["cardinality"] == "MANY_TO_ONE":
+                    many_sides.setdefault(join["to"], []).append(join["from"])
+                elif join["cardinality"] == "ONE_TO_MANY":
+                    many_sides.setdefault(join["from"], []).append(join["to"])
+            result["fan_traps"] = [{"table": table, "tables": sides} for table, sides in many_sides.items() if len(sides) > 1]
+
+        with self._lock:
+            self._lookups += 1
+            self._lookup_seconds += time.perf_counter() - start_time
+            if result["unknown"] or result["unreachable"]:
+                self._unresolved += 1
+            if result["fan_traps"]:
+                self._fan_traps += 1
+        return result
+
+    def neighbors(self, table: str) -> list[JoinEdge]:
+        """Returns the best edge to every table directly joinable with `table`."""
+        key = self.resolve(table)
+        return [edge_list[0] for edge_list in self._edges.get(key, {}).values()] if key else []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tables": len(self._edges),
+                "relationships": self._edge_count,
+                "approved_relationships": sum(1 for n in self._edges.values() for l in n.values() for e in l if e.approved) // 2,
+                "precomputed_paths": sum(len(p) for p in self._paths.values()),
+                "lookups": self._lookups,
+                "unresolved_lookups": self._unresolved,
+                "fan_trap_lookups": self._fan_traps,
+                "avg_lookup_us": round(self._lookup_seconds / self._lookups * 1e6, 1) if self._lookups else 0.0,
+            }
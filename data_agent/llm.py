@@ -0,0 +1,136 @@
+import logging
+import time
+from typing import AsyncGenerator
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from .budget import BUDGET
+from .constants import CONTEXT_CACHE_ENABLED
+from .context_cache import CONTEXT_CACHE, content_text
+from .routing import MODEL_ROUTER, TIER_FAST, escalation_reason
+from .turn_context import current_turn
+from .utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class DataAgentGemini(Gemini):
+    """
+    The ADK Gemini model, with model routing, context caching and usage metering.
+
+    Before each call the turn's usage budget is re-checked and the call is routed to
+    FAST_MODEL or MODEL (see routing.py). Answers of the fast model are checked before
+    they are passed on; if the fast call fails or its answer needs the Pro model (e.g.
+    multi-join SQL), the call is repeated with MODEL. The system instruction and tool
+    declarations are replaced by a cached-content handle (see context_cache.py). If a
+    cached call fails before any response was yielded (e.g. the handle expired or was
+    deleted by another worker), the handle is dropped and the call is retried once
+    with the prefix inline. The input and output tokens of every call are added to the
+    current turn and to the usage budget (see budget.py).
+    """
+
+    def use_api_client(self, client) -> "DataAgentGemini":
+        """
+        Replaces the genai client of this model, e.g. with context_cache.LocalGenerativeModelClient
+        to run the routing and caching logic against a local stand-in model.
+        """
+        self.__dict__["api_client"] = client  # Shadows the base class's cached_property.
+        return self
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        turn = current_turn()
+        if turn is not None:
+            BUDGET.enforce(turn)
+
+        decision = MODEL_ROUTER.route(llm_request, turn)
+        llm_request.model = decision.model
+        if decision.tier != TIER_FAST or stream:
+            # Streamed partial responses cannot be taken back, so they are not escalated.
+            async for llm_response in self._generate_cached(llm_request, stream, turn):
+                yield llm_response
+            return
+
+        try:
+            llm_responses = [r async for r in self._generate_cached(llm_request, stream, turn)]
+            reason = escalation_reason(llm_responses)
+        except Exception as e:
+            logger.warning(f"[ROUTING] Call on {decision.model} failed.", exc_info=True)
+            reason = f"error:{type(e).__name__}"
+        if reason is None:
+            for llm_response in llm_responses:
+                yield llm_response
+            return
+
+        llm_request.model = MODEL_ROUTER.record_fallback(turn, decision, reason).model
+        async for llm_response in self._generate_cached(llm_request, stream, turn):
+            yield llm_response
+
+    async def _generate_cached(
+        self, llm_request: LlmRequest, stream: bool, turn
+    ) -> AsyncGenerator[LlmResponse, None]:
+        saved = None
+        if CONTEXT_CACHE_ENABLED:
+            try:
+                saved = CONTEXT_CACHE.apply(llm_request)
+            except Exception:
+                logger.warning("[CONTEXT_CACHE] Could not apply the context cache; sending the prefix inline.", exc_info=True)
+
+        start_time = time.monotonic()
+        if saved is None:
+            async for llm_response in self._generate(llm_request, stream, saved=None):
+                yield llm_response
+            MODEL_ROUTER.record_latency(turn, llm_request.model, time.monotonic() - start_time)
+            return
+
+        yielded = False
+        try:
+            async for llm_response in self._generate(llm_request, stream, saved=saved):
+                yielded = True
+                yield llm_response
+        except Exception:
+            if yielded:
+                raise
+            logger.warning(f"[CONTEXT_CACHE] Cached call with {saved['cached_content']} failed; retrying with the prefix inline.", exc_info=True)
+            CONTEXT_CACHE.restore(llm_request, saved)
+            CONTEXT_CACHE.invalidate(saved["cached_content"])
+            async for llm_response in self._generate(llm_request, stream, saved=None, fallback=True):
+                yield llm_response
+        else:
+            # Put the prefix back, so the request can be sent again (e.g. to another model).
+            CONTEXT_CACHE.restore(llm_request, saved)
+        MODEL_ROUTER.record_latency(turn, llm_request.model, time.monotonic() - start_time)
+
+    async def _generate(
+        self, llm_request: LlmRequest, stream: bool, saved: dict | None, fallback: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if stream:
+            # Streaming responses are re-assembled by the base class; token usage is estimated.
+            output_text = ""
+            async for llm_response in super().generate_content_async(llm_request, stream=True):
+                if llm_response.partial and llm_response.content:
+                    output_text += content_text(llm_response.content)
+                yield llm_response
+            self._record_usage(llm_request, None, saved, fallback, estimate_tokens(output_text))
+            return
+
+        self._maybe_append_user_content(llm_request)
+        logger.info(f"Sending out request, model: {llm_request.model}, cached_content: {saved['cached_content'] if saved else None}")
+        response = await self.api_client.aio.models.generate_content(
+            model=llm_request.model,
+            contents=llm_request.contents,
+            config=llm_request.config,
+        )
+        llm_response = LlmResponse.create(response)
+        self._record_usage(llm_request, getattr(response, "usage_metadata", None), saved, fallback,
+                           estimate_tokens(content_text(llm_response.content)))
+        yield llm_response
+
+    @staticmethod
+    def _record_usage(llm_request: LlmRequest, usage_metadata, saved: dict | None, fallback: bool, estimated_output_tokens: int) -> None:
+        input_tokens = CONTEXT_CACHE.record_usage(llm_request, usage_metadata, saved=saved, fallback=fallback)
+        output_tokens = getattr(usage_metadata, "candidates_token_count", None) or estimated_output_tokens
+        turn = current_turn()
+        if turn is not None:
+            BUDGET.record_turn_usage(turn, input_tokens=input_tokens, output_tokens=output_tokens)
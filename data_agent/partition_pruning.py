@@ -0,0 +1,537 @@
+import hashlib
+import logging
+import threading
+import time
+from google.cloud import bigquery
+from .constants import (
+    DATASET_PROFILES,
+    DEFAULT_DATASET_ID,
+    PARTITION_PRUNING_MODE,
+    PARTITION_PRUNING_MIN_BYTES,
+    PARTITION_PRUNING_MAX_UNFILTERED_BYTES,
+)
+from .sql_parsing import tokenize_sql, normalize_sql, parse_table_references, CLAUSE_KEYWORDS, RESERVED_KEYWORDS
+from .utils import find_schema_aspect
+
+logger = logging.getLogger(__name__)
+
+_COMPARISON_OPS = {"=", "<", ">", "<=", ">=", "!=", "<>"}
+# Keywords that end the operand of a comparison at the same nesting depth.
+_OPERAND_END = CLAUSE_KEYWORDS | {"AND", "OR", "WHEN", "THEN", "ELSE", "END"}
+# Keywords that start the operand of a comparison, scanning backwards from the operator.
+_OPERAND_START = _OPERAND_END | {"SELECT", "NOT"}
+# The operator of `FN(col) op x` for a mirrored comparison `x op FN(col)`.
+_MIRRORED_OPS = {"=": "=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+# Wrappers around a TIMESTAMP/DATETIME partition column that compare its date, e.g. `DATE(ts) BETWEEN a AND b`.
+_DATE_WRAPPERS = {"DATE", "CAST", "SAFE_CAST"}
+# How many nested function calls around a column are followed up to a comparison.
+_MAX_WRAPPER_DEPTH = 3
+# Pseudo-columns of ingestion-time partitioned tables.
+_INGESTION_PSEUDO_COLUMNS = {"_partitiontime", "_partitiondate"}
+
+
+def _identifier_text(token) -> str:
+    return token[1][1:-1] if token[0] == "quoted" else token[1]
+
+
+def _is_word(token, *words) -> bool:
+    return token is not None and token[0] == "ident" and token[1].upper() in words
+
+
+def _token_end(token) -> int:
+    return token[2] + len(token[1])
+
+
+def _gib(num_bytes: int) -> str:
+    return f"{num_bytes / 1024 ** 3:.2f} GiB"
+
+
+def _matching_paren(tokens, open_index: int) -> int | None:
+    depth = 0
+    for j in range(open_index, len(tokens)):
+        if tokens[j][1] == "(":
+            depth += 1
+        elif tokens[j][1] == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+
+def _enclosing_paren(tokens, index: int) -> int | None:
+    """Returns the index of the innermost unmatched '(' before `index`."""
+    depth = 0
+    for j in range(index - 1, -1, -1):
+        if tokens[j][1] == ")":
+            depth += 1
+        elif tokens[j][1] == "(":
+            if depth == 0:
+                return j
+            depth -= 1
+    return None
+
+
+def _operand_end(tokens, start: int, stop_words=_OPERAND_END) -> int:
+    """Returns the index after the last token of the operand starting at `start`."""
+    depth = 0
+    j = start
+    while j < len(tokens):
+        text = tokens[j][1]
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and (text in (",", ";") or _is_word(tokens[j], *stop_words)):
+            break
+        j += 1
+    return j
+
+
+def _operand_start(tokens, end: int, stop_words=_OPERAND_START) -> int:
+    """Returns the index of the first token of the operand that ends just before `end`."""
+    depth = 0
+    j = end - 1
+    while j >= 0:
+        text = tokens[j][1]
+        if text == ")":
+            depth += 1
+        elif text == "(":
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and (text in (",", ";") or text in _COMPARISON_OPS or _is_word(tokens[j], *stop_words)):
+            break
+        j -= 1
+    return j + 1
+
+
+def _is_subquery(tokens, start: int, end: int) -> bool:
+    return any(_is_word(tokens[j], "SELECT") for j in range(start, end))
+
+
+class PruningAnalyzer:
+    """
+    Checks that agent-generated GoogleSQL lets BigQuery prune partitions, using the
+    partitioning and clustering of the tables (see `table_storage_info()`).
+
+    `analyze()` finds, per partitioned table the query reads:
+
+    * predicates that wrap the partition column in a function, which BigQuery cannot
+      prune on. Date comparisons of a TIMESTAMP/DATETIME column (`DATE(ts) BETWEEN a AND b`,
+      `CAST(ts AS DATE) >= a`, `a <= DATE(ts)`, ...) are rewritten into range predicates on the column;
+      other wrappers (EXTRACT, FORMAT_DATE, ...) get guidance.
+    * partition filters compared with a subquery, which are not pruned either.
+    * tables read without any partition filter (full scans).
+    * clustering columns wrapped in a function, which defeats block pruning.
+
+    `check()` applies PARTITION_PRUNING_MODE to the findings before a query is executed,
+    dry-running the query (and its rewrite) to report the bytes each fix saves.
+    """
+
+    def __init__(self, dataset: dict | None = None, mode: str = PARTITION_PRUNING_MODE):
+        self.dataset = dataset or DATASET_PROFILES[DEFAULT_DATASET_ID]
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._storage: dict[str, dict] = {}   # table -> {'partitioning', 'clustering_fields'}
+        self._columns: dict[str, set[str]] = {}  # table -> lower-cased column names
+        self._analyses = 0
+        self._queries_flagged = 0
+        self._rewrites_applied = 0
+        self._rewrite_failures = 0
+        self._queries_returned = 0
+        self._full_scans_flagged = 0
+        self._bytes_saved = 0
+        self._dry_runs = 0
+        self._dry_run_seconds = 0.0
+
+    def load_metadata(self, table_metadata: list[dict]) -> None:
+        """(Re)loads partitioning, clustering and column names from `fetch_table_entry_metadata()` output."""
+        storage, columns = {}, {}
+        for table_meta in table_metadata or []:
+            table_name = (table_meta.get('table_name') or '').lower()
+            if not table_name:
+                continue
+            fields = find_schema_aspect(table_meta).get('fields', [])
+            columns[table_name] = {f['name'].lower() for f in fields if f.get('name')}
+            info = table_meta.get('storage') or {}
+            if info.get('partitioning') or info.get('clustering_fields'):
+                storage[table_name] = info
+        with self._lock:
+            self._storage = storage
+            self._columns = columns
+        partitioned = sum(1 for info in storage.values() if info.get('partitioning'))
+        logger.info(f"[PARTITION_PRUNING] Loaded partitioning of {partitioned} tables and clustering of "
+                    f"{sum(1 for info in storage.values() if info.get('clustering_fields'))} tables.")
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self._storage)
+
+    # --- Analysis ---
+
+    def _column_references(self, tokens, tables: dict, referenced: set, qualifiers: dict, skip: set):
+        """
+        Yields (table, column_lower, start_index, end_index) for column references of `tables`.
+        An unqualified column is attributed to a table only if no other table of the query has it.
+        """
+        owners: dict[str, list[str]] = {}
+        for table in referenced:
+            names = set(self._columns.get(table, ()))
+            partitioning = (self._storage.get(table) or {}).get('partitioning')
+            if partitioning:
+                names.add(partitioning['column'].lower())
+                if partitioning['column'].lower() == "_partitiontime":
+                    names.update(_INGESTION_PSEUDO_COLUMNS)
+            for name in names:
+                owners.setdefault(name, []).append(table)
+
+        for i, token in enumerate(tokens):
+            if i in skip or token[0] not in ("ident", "quoted"):
+                continue
+            name = _identifier_text(token).lower()
+            if i + 1 < len(tokens) and tokens[i + 1][1] == ".":
+                continue
+            if i >= 2 and tokens[i - 1][1] == "." and tokens[i - 2][0] in ("ident", "quoted"):
+                table, start = qualifiers.get(_identifier_text(tokens[i - 2]).lower()), i - 2
+            elif i >= 1 and tokens[i - 1][1] == ".":
+                continue
+            else:
+                candidates = owners.get(name, [])
+                table, start = (candidates[0] if len(candidates) == 1 else None), i
+            if table is not None and table in tables:
+                yield table, name, start, i
+
+    def analyze(self, sql_query: str) -> dict:
+        """
+        Finds predicates that prevent partition or clustering pruning.
+
+        Args:
+            sql_query: The GoogleSQL query to analyze.
+
+        Returns:
+            A dictionary with:
+                - 'sql': the query with every rewritable predicate rewritten.
+                - 'rewrites': a list of {'table', 'original', 'rewritten'} predicates.
+                - 'issues': a list of {'kind', 'table', 'message'} findings that were not
+                  rewritten ('non_prunable', 'subquery_bound', 'missing_filter' or 'cluster_function').
+                - 'unfiltered_tables': partitioned tables the query reads without a partition filter.
+        """
+        storage, dataset_name = self._storage, self.dataset["dataset_name"].lower()
+        tokens = tokenize_sql(sql_query)
+        refs = parse_table_references(tokens)
+        tables: dict[str, dict] = {}
+        referenced, qualifiers, skip = set(), {}, set()
+        for ref in refs['tables']:
+            skip.update(range(ref['start'], ref['end']))
+            path_parts = [p.lower() for p in ref['path'].split('.')]
+            if len(path_parts) < 2 or path_parts[-2] != dataset_name:
+                continue
+            table = path_parts[-1]
+            referenced.add(table)
+            if table not in storage:
+                continue
+            tables[table] = storage[table]
+            qualifiers[table] = table
+            if ref['alias']:
+                qualifiers[ref['alias'].lower()] = table
+
+        result = {"sql": sql_query, "rewrites": [], "issues": [], "unfiltered_tables": []}
+        if not tables:
+            return result
+
+        filtered, edits, unprunable = set(), [], []
+        for table, column, start, end in self._column_references(tokens, tables, referenced, qualifiers, skip):
+            partitioning = tables[table].get('partitioning') or {}
+            partition_column = partitioning.get('column', '').lower()
+            is_partition = column == partition_column or (column in _INGESTION_PSEUDO_COLUMNS and partition_column == "_partitiontime")
+            is_cluster = column in {c.lower() for c in tables[table].get('clustering_fields') or []}
+            if not is_partition and not is_cluster:
+                continue
+            column_text = sql_query[tokens[start][2]:_token_end(tokens[end])]
+
+            # A direct comparison: `col op x`, `col BETWEEN a AND b`, `col IN (...)` or `x op col`.
+            following = tokens[end + 1] if end + 1 < len(tokens) else None
+            preceding = tokens[start - 1] if start > 0 else None
+            if following is not None and (following[1] in _COMPARISON_OPS or _is_word(following, "BETWEEN", "IN", "NOT")):
+                if is_partition and _is_subquery(tokens, end + 2, _operand_end(tokens, end + 2)):
+                    unprunable.append({"kind": "subquery_bound", "table": table, "message": (
+                        f"The filter on partition column `{column_text}` of `{table}` compares it with a subquery, so BigQuery "
+                        "scans every partition. Use constant bounds (literals, CURRENT_DATE(), DATE_SUB(...)) instead.")})
+                elif is_partition:
+                    filtered.add(table)
+                continue
+            if preceding is not None and preceding[1] in _COMPARISON_OPS:
+                if is_partition:
+                    filtered.add(table)
+                continue
+
+            # A comparison of a function of the column: `FN(col) op x` or `x op FN(col)`, possibly nested.
+            open_index = _enclosing_paren(tokens, start)
+            depth = 0
+            while open_index is not None and depth < _MAX_WRAPPER_DEPTH:
+                function = tokens[open_index - 1] if open_index > 0 else None
+                if function is None or function[0] != "ident" or (
+                        function[1].upper() in RESERVED_KEYWORDS and function[1].upper() not in ("CAST", "EXTRACT")):
+                    break
+                close_index = _matching_paren(tokens, open_index)
+                if close_index is None:
+                    break
+                after = tokens[close_index + 1] if close_index + 1 < len(tokens) else None
+                before = tokens[open_index - 2] if open_index > 1 else None
+                if ((after is not None and (after[1] in _COMPARISON_OPS or _is_word(after, "BETWEEN", "IN", "NOT")))
+                        or (before is not None and before[1] in _COMPARISON_OPS)):
+                    wrapper = (open_index - 1, close_index)
+                    edit = self._date_rewrite(sql_query, tokens, partitioning, wrapper, (start, end), column_text) if is_partition and depth == 0 else None
+                    wrapped_text = sql_query[function[2]:_token_end(tokens[close_index])]
+                    if edit is not None:
+                        edits.append(edit)
+                        filtered.add(table)
+                        result["rewrites"].append({"table": table, "original": edit[3], "rewritten": edit[2]})
+                    elif is_partition:
+                        unprunable.append({"kind": "non_prunable", "table": table, "message": (
+                            f"`{wrapped_text}` wraps partition column `{column_text}` of `{table}` in a function, so BigQuery "
+                            f"cannot prune partitions. Compare `{column_text}` itself with constant bounds, e.g. "
+                            f"`{column_text} >= <start> AND {column_text} < <end>`.")})
+                    else:
+                        result["issues"].append({"kind": "cluster_function", "table": table, "message": (
+                            f"`{wrapped_text}` wraps clustering column `{column_text}` of `{table}` in a function, which "
+                            f"prevents block pruning. Compare `{column_text}` itself with the stored values.")})
+                    break
+                open_index = _enclosing_paren(tokens, open_index)
+                depth += 1
+
+        for table, info in tables.items():
+            partitioning = info.get('partitioning')
+            if not partitioning or table in filtered:
+                continue
+            result["unfiltered_tables"].append(table)
+            # A function of the partition column (e.g. in the select list) matters only without a usable filter.
+            findings = [issue for issue in unprunable if issue["table"] == table]
+            if findings:
+                result["issues"].extend(findings)
+                continue
+            clustering = info.get('clustering_fields') or []
+            message = (f"Table `{table}` is partitioned by `{partitioning['column']}` ({partitioning['type']}) but the query "
+                       f"does not filter on it, so every partition is scanned. Filter `{partitioning['column']}` directly "
+                       "on the timeframe the user asked for.")
+            if clustering:
+                message += f" It is clustered by {', '.join(f'`{c}`' for c in clustering)}; filters on these columns also reduce the bytes read."
+            if partitioning.get('require_filter'):
+                message += " BigQuery rejects queries on this table without a partition filter."
+            result["issues"].append({"kind": "missing_filter", "table": table, "message": message})
+
+        # Apply the rewrites back to front so earlier offsets stay valid; skip overlapping ones.
+        sql, last_start = sql_query, len(sql_query) + 1
+        for start_pos, end_pos, replacement, _ in sorted(edits, key=lambda e: e[0], reverse=True):
+            if end_pos > last_start:
+                continue
+            sql = sql[:start_pos] + replacement + sql[end_pos:]
+            last_start = start_pos
+        result["sql"] = sql
+        return result
+
+    @staticmethod
+    def _date_rewrite(sql_query, tokens, partitioning, wrapper, column_span, column_text):
+        """
+        Rewrites `DATE(col) op x` / `CAST(col AS DATE) op x` (or the mirrored `x op DATE(col)`)
+        on a TIMESTAMP or DATETIME partition column into a range on the column itself.
+
+        Returns:
+            (start_pos, end_pos, replacement, original) or None if the form is not handled.
+        """
+        function_index, close_index = wrapper
+        start, end = column_span
+        function = tokens[function_index][1].upper()
+        if function not in _DATE_WRAPPERS:
+            return None
+        inner = [t[1].upper() for t in tokens[end + 1:close_index]]
+        if (function == "DATE" and inner) or (function != "DATE" and inner != ["AS", "DATE"]):
+            return None
+        if start != function_index + 2:
+            return None
+        column_type = (partitioning.get('column_type') or '').upper()
+
+        if column_type == "DATE":
+            # DATE(date_col) is the column itself.
+            replacement = column_text
+            original = sql_query[tokens[function_index][2]:_token_end(tokens[close_index])]
+            return tokens[function_index][2], _token_end(tokens[close_index]), replacement, original
+        if column_type not in ("TIMESTAMP", "DATETIME"):
+            return None
+        op_index = close_index + 1
+        op = tokens[op_index][1].upper() if op_index < len(tokens) else None
+        if op not in _MIRRORED_OPS and op != "BETWEEN" and function_index > 0 and tokens[function_index - 1][1] in _MIRRORED_OPS:
+            # `x op DATE(col)` is `DATE(col) op' x` with the operator mirrored.
+            op_index = function_index - 1
+            operand_start = _operand_start(tokens, op_index)
+            if operand_start == op_index:
+                return None
+            op = _MIRRORED_OPS[tokens[op_index][1]]
+            bounds = [(operand_start, op_index)]
+            span = (tokens[operand_start][2], _token_end(tokens[close_index]))
+        elif op == "BETWEEN":
+            lower_end = _operand_end(tokens, op_index + 1, stop_words=_OPERAND_END)
+            if lower_end >= len(tokens) or not _is_word(tokens[lower_end], "AND") or lower_end == op_index + 1:
+                return None
+            upper_end = _operand_end(tokens, lower_end + 1)
+            if upper_end == lower_end + 1:
+                return None
+            bounds = [(op_index + 1, lower_end), (lower_end + 1, upper_end)]
+            span = (tokens[function_index][2], _token_end(tokens[upper_end - 1]))
+        elif op in _MIRRORED_OPS:
+            operand_end = _operand_end(tokens, op_index + 1)
+            if operand_end == op_index + 1:
+                return None
+            bounds = [(op_index + 1, operand_end)]
+            span = (tokens[function_index][2], _token_end(tokens[operand_end - 1]))
+        else:
+            return None
+        if any(_is_subquery(tokens, a, b) for a, b in bounds):
+            return None
+
+        texts = [sql_query[tokens[a][2]:_token_end(tokens[b - 1])] for a, b in bounds]
+        cast = column_type  # TIMESTAMP(date) / DATETIME(date): midnight of that date (UTC for TIMESTAMP, as DATE(ts) uses).
+
+        def day_start(text):
+            return f"{cast}(CAST({text} AS DATE))"
+
+        def next_day_start(text):
+            return f"{cast}(DATE_ADD(CAST({text} AS DATE), INTERVAL 1 DAY))"
+
+        if op == "BETWEEN":
+            replacement = f"({column_text} >= {day_start(texts[0])} AND {column_text} < {next_day_start(texts[1])})"
+        elif op == "=":
+            replacement = f"({column_text} >= {day_start(texts[0])} AND {column_text} < {next_day_start(texts[0])})"
+        elif op == ">=":
+            replacement = f"{column_text} >= {day_start(texts[0])}"
+        elif op == ">":
+            replacement = f"{column_text} >= {next_day_start(texts[0])}"
+        elif op == "<":
+            replacement = f"{column_text} < {day_start(texts[0])}"
+        else:  # <=
+            replacement = f"{column_text} < {next_day_start(texts[0])}"
+        start_pos, end_pos = span
+        return start_pos, end_pos, replacement, sql_query[start_pos:end_pos]
+
+    # --- Enforcement ---
+
+    def _dry_run(self, client, sql_query: str, location: str | None) -> int | None:
+        """Returns the bytes a query would scan, or None if the dry run fails."""
+        start_time = time.perf_counter()
+        try:
+            job = client.query(sql_query, job_config=bigquery.QueryJobConfig(dry_run=True, use_query_cache=False), location=location)
+            return job.total_bytes_processed or 0
+        except Exception as e:
+            logger.info(f"[PARTITION_PRUNING] Dry run failed: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._dry_runs += 1
+                self._dry_run_seconds += time.perf_counter() - start_time
+
+    def check(self, client, sql_query: str, location: str | None = None, turn=None) -> dict:
+        """
+        Applies PARTITION_PRUNING_MODE to a query before it is executed.
+
+        * 'rewrite': rewritable predicates are rewritten (if the rewrite passes a dry run)
+          and the rewritten query runs; other findings are added as a note.
+        * 'guide': a query with fixable predicates that scans at least PARTITION_PRUNING_MIN_BYTES
+          is returned to the agent with the suggested fix and the bytes it saves.
+        * Both modes: a query that reads a partitioned table without a partition filter and
+          scans at least PARTITION_PRUNING_MAX_UNFILTERED_BYTES is returned with guidance
+          the first time in a turn; resubmitted unchanged, it runs.
+
+        Returns:
+            A dictionary with 'sql' (the query to execute), 'note' (text for the agent,
+            appended to the results) and 'rejection' (None, or the reason the query was
+            not executed).
+        """
+        outcome = {"sql": sql_query, "note": "", "rejection": None}
+        if self.mode == "off" or not self.is_loaded:
+            return outcome
+        analysis = self.analyze(sql_query)
+        with self._lock:
+            self._analyses += 1
+        if not analysis["rewrites"] and not analysis["issues"]:
+            return outcome
+
+        bytes_before = self._dry_run(client, sql_query, location)
+        bytes_after = self._dry_run(client, analysis["sql"], location) if analysis["rewrites"] else bytes_before
+        saved = bytes_before - bytes_after if bytes_before is not None and bytes_after is not None else None
+        messages = [issue["message"] for issue in analysis["issues"] if issue["kind"] != "missing_filter"]
+        suggested = "\n".join(f"- `{r['original']}` -> `{r['rewritten']}`" for r in analysis["rewrites"])
+        notes, reject = [], []
+
+        if analysis["rewrites"] and self.mode == "rewrite" and bytes_after is not None:
+            outcome["sql"] = analysis["sql"]
+            saved_text = f" It scans {_gib(bytes_after)} instead of {_gib(bytes_before)}." if saved is not None else ""
+            notes.append(f"The date filters were rewritten so BigQuery can prune partitions:\n{suggested}\n{saved_text.strip()}".rstrip())
+            with self._lock:
+                self._rewrites_applied += 1
+                self._bytes_saved += max(saved or 0, 0)
+            logger.info(f"[PARTITION_PRUNING] Rewrote {len(analysis['rewrites'])} predicates; "
+                        f"dry run {bytes_before} -> {bytes_after} bytes.")
+        elif analysis["rewrites"]:
+            if self.mode == "rewrite":
+                with self._lock:
+                    self._rewrite_failures += 1
+                logger.warning(f"[PARTITION_PRUNING] Rewritten query failed its dry run; running the original:\n{analysis['sql']}")
+            message = f"These filters prevent partition pruning. Rewrite them as:\n{suggested}"
+            if saved:
+                message += f"\nThis reduces the scan from {_gib(bytes_before)} to {_gib(bytes_after)}."
+            if self.mode == "guide" and (bytes_before or 0) >= PARTITION_PRUNING_MIN_BYTES and (saved or 0) > 0:
+                reject.append(message)
+            else:
+                notes.append(message)
+        if messages:
+            notes.extend(messages)
+
+        scanned = bytes_after if outcome["sql"] != sql_query else bytes_before
+        unfiltered = [issue["message"] for issue in analysis["issues"] if issue["kind"] == "missing_filter"]
+        if unfiltered:
+            with self._lock:
+                self._full_scans_flagged += 1
+            query_key = hashlib.sha256(normalize_sql(sql_query).encode()).hexdigest()
+            warned = getattr(turn, "pruning_warnings", None)
+            if (warned is not None and query_key not in warned and PARTITION_PRUNING_MAX_UNFILTERED_BYTES
+                    and scanned is not None and scanned >= PARTITION_PRUNING_MAX_UNFILTERED_BYTES):
+                warned.add(query_key)
+                reject.append("\n".join(unfiltered) + f"\nAs written, the query scans {_gib(scanned)}. If the user "
+                              "really asked for the whole history, call the tool again with the same query unchanged.")
+            else:
+                notes.extend(unfiltered)
+
+        if reject:
+            with self._lock:
+                self._queries_flagged += 1
+                self._queries_returned += 1
+            outcome["sql"] = sql_query
+            outcome["rejection"] = "\n".join(reject + notes)
+            logger.info(f"[PARTITION_PRUNING] Query returned to the agent: {outcome['rejection']}")
+            return outcome
+        with self._lock:
+            self._queries_flagged += 1
+        outcome["note"] = "\n".join(notes)
+        return outcome
+
+    def stats(self) -> dict:
+        """
+        Returns pruning counters. 'bytes_saved' sums the dry-run bytes of rewritten queries
+        minus those of their rewrites (what BigQuery would otherwise have scanned).
+        """
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "partitioned_tables": sum(1 for info in self._storage.values() if info.get('partitioning')),
+                "analyses": self._analyses,
+                "queries_flagged": self._queries_flagged,
+                "queries_returned_with_guidance": self._queries_returned,
+                "rewrites_applied": self._rewrites_applied,
+                "rewrite_failures": self._rewrite_failures,
+                "full_scans_flagged": self._full_scans_flagged,
+                "bytes_saved": self._bytes_saved,
+                "dry_runs": self._dry_runs,
+                "avg_dry_run_ms": round(self._dry_run_seconds / self._dry_runs * 1000, 1) if self._dry_runs else 0.0,
+            }
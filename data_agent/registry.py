@@ -0,0 +1,354 @@
+import collections
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from .constants import (
+    DATASET_PROFILES,
+    DEFAULT_DATASET_ID,
+    AGENT_REGISTRY_MAX_MEMORY_BYTES,
+    METADATA_REFRESH_INTERVAL_SECONDS,
+    PROMPT_CACHE_DIR,
+)
+from .instructions import build_dataset_instructions, render_instructions, json_serial_default
+from .join_graph import JoinGraph
+from .partition_pruning import PruningAnalyzer
+from .sql_validator import SchemaValidator
+from .utils import (
+    fetch_table_entry_metadata,
+    fetch_bigquery_data_profiles,
+    fetch_sample_data_for_tables,
+    fetch_metadata_fingerprints,
+    shared_file_lock,
+    start_periodic_task,
+)
+from .value_index import ValueIndex
+
+logger = logging.getLogger(__name__)
+
+# The dataset the current chat turn runs against. Set by the caller of the ADK runner
+# (see backend/app.py) and read by the agent tools to pick the matching indexes.
+ACTIVE_DATASET_ID: contextvars.ContextVar[str] = contextvars.ContextVar("active_dataset_id", default=DEFAULT_DATASET_ID)
+
+# Which prompt sections each fingerprinted source feeds.
+_SECTIONS = ("metadata", "profiles")
+
+
+def prompt_version_id(prompt: str) -> str:
+    """Returns a short content hash identifying a prompt. Identical prompts get identical ids in every worker."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def _prompt_cache_path(dataset_id: str, fingerprints: dict) -> str:
+    key = hashlib.sha256(json.dumps([dataset_id, fingerprints], sort_keys=True).encode()).hexdigest()[:24]
+    return os.path.join(PROMPT_CACHE_DIR, f"{dataset_id}-{key}.json")
+
+
+def _remove_stale_prompt_caches(dataset_id: str, keep_path: str) -> None:
+    """Deletes the prompt caches of older fingerprints of a dataset (PROMPT_CACHE_DIR may be in memory)."""
+    pattern = re.compile(re.escape(dataset_id) + r"-[0-9a-f]{24}\.json")
+    for name in os.listdir(PROMPT_CACHE_DIR):
+        path = os.path.join(PROMPT_CACHE_DIR, name)
+        if pattern.fullmatch(name) and path != keep_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _read_prompt_cache(dataset_id: str, fingerprints: dict) -> dict | None:
+    """Loads a context (prompt, metadata, profiles, samples) another worker built for these fingerprints."""
+    if any(fingerprints.get(k) is None for k in _SECTIONS):
+        return None
+    try:
+        with open(_prompt_cache_path(dataset_id, fingerprints), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning(f"[AGENT_REGISTRY] Ignoring unreadable prompt cache for dataset '{dataset_id}'", exc_info=True)
+        return None
+
+
+def _write_prompt_cache(dataset_id: str, fingerprints: dict, context: dict) -> None:
+    """Atomically writes a built context so other workers can load it instead of re-fetching."""
+    if any(fingerprints.get(k) is None for k in _SECTIONS):
+        return
+    try:
+        os.makedirs(PROMPT_CACHE_DIR, exist_ok=True)
+        path = _prompt_cache_path(dataset_id, fingerprints)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(context, f, default=json_serial_default)
+        os.replace(tmp_path, path)
+        _remove_stale_prompt_caches(dataset_id, path)
+    except Exception:
+        logger.warning(f"[AGENT_REGISTRY] Could not write prompt cache for dataset '{dataset_id}'", exc_info=True)
+
+
+def _profiles_cache_key(fingerprints: dict) -> str | None:
+    """The profiles fingerprint, used to cache the profiles table as an Arrow file (None if unknown)."""
+    fingerprint = fingerprints.get("profiles")
+    return fingerprint if fingerprint and fingerprint != "disabled" else None
+
+
+class UnknownDatasetError(KeyError):
+    """Raised when a dataset id is not configured in DATASET_PROFILES."""
+
+
+class DatasetResources:
+    """Everything built for one dataset: instructions, agent and the local lookup indexes."""
+
+    def __init__(self, dataset_id: str, dataset: dict):
+        self.dataset_id = dataset_id
+        self.dataset = dataset
+        self.instructions = ""
+        self.prompt_version = None
+        self.version_history = collections.deque(maxlen=20)
+        self.fingerprints: dict = {}
+        self.context: dict = {}  # The fetched 'table_metadata', 'data_profiles' and 'samples'.
+        self.agent = None
+        self.refresh_count = 0
+        self.last_refresh_check = None
+        self.value_index = ValueIndex(dataset_id, dataset)
+        self.schema_validator = SchemaValidator(dataset)
+        self.pruning_analyzer = PruningAnalyzer(dataset)
+        self.join_graph = JoinGraph(dataset)
+        self.build_seconds = 0.0
+        self.built_at = None
+        self.last_used = None
+        self.size_bytes = 0
+
+    def apply(self, context: dict, fingerprints: dict, sections=_SECTIONS) -> None:
+        """
+        Installs a (re)built context: reloads the indexes fed by the changed `sections`
+        and swaps the agent instruction.
+
+        The swap is a single reference assignment. A turn that is already running keeps
+        the request it has built; its next model round trip sees the new instruction.
+        """
+        from .agent import create_agent  # Imported here: agent.py exposes root_agent through the registry.
+
+        if "metadata" in sections:
+            self.schema_validator.load_metadata(context["table_metadata"])
+            self.pruning_analyzer.load_metadata(context["table_metadata"])
+            self.join_graph.load_metadata(context["table_metadata"])
+        if "profiles" in sections or "metadata" in sections:
+            self.value_index.load_profiles(context["data_profiles"], context["table_metadata"])
+        self.context = {k: context[k] for k in ("table_metadata", "data_profiles", "samples")}
+        self.fingerprints = dict(fingerprints)
+        self.instructions = context["prompt"]
+        self.prompt_version = prompt_version_id(self.instructions)
+        if self.agent is None:
+            self.agent = create_agent(self.instructions)
+        else:
+            self.agent.instruction = self.instructions
+        self.version_history.append({"prompt_version": self.prompt_version, "applied_at": time.time(), "fingerprints": self.fingerprints})
+    def close(self) -> None:
+        """Stops the background work of this entry. Called when the entry leaves the registry."""
+        self.value_index.stop_harvester()
+
+    def estimate_size(self) -> int:
+        """Roughly estimates the memory held by this entry, for the registry's memory cap."""
+        value_stats = self.value_index.stats()
+        return (
+            len(self.instructions) * 2  # The prompt string plus the copy held by the ADK agent/request.
+            + value_stats["values_indexed"] * 160
+            + self.schema_validator.column_count() * 120
+            + self.join_graph.stats()["precomputed_paths"] * 200
+        )
+
+
+class AgentRegistry:
+    """
+    Builds agents and instructions per dataset on first use and keeps them in an LRU cache.
+
+    Entries are evicted least-recently-used first once their estimated total size exceeds
+    AGENT_REGISTRY_MAX_MEMORY_BYTES; the most recently used entry is always kept. Concurrent
+    first requests for the same dataset wait for a single build.
+    """
+
+    def __init__(self, max_memory_bytes: int = AGENT_REGISTRY_MAX_MEMORY_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+        self._build_locks: dict[str, threading.Lock] = collections.defaultdict(threading.Lock)
+        self._entries: collections.OrderedDict[str, DatasetResources] = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._build_history: dict[str, list[float]] = collections.defaultdict(list)
+
+    def get(self, dataset_id: str | None = None) -> DatasetResources:
+        """
+        Returns the resources of a dataset, building them if they are not cached.
+
+        Raises:
+            UnknownDatasetError: If the dataset id is not configured.
+        """
+        dataset_id = dataset_id or DEFAULT_DATASET_ID
+        if dataset_id not in DATASET_PROFILES:
+            raise UnknownDatasetError(dataset_id)
+
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is not None:
+                self._entries.move_to_end(dataset_id)
+                entry.last_used = time.time()
+                self._hits += 1
+                return entry
+
+        with self._build_locks[dataset_id]:
+            with self._lock:
+                entry = self._entries.get(dataset_id)
+                if entry is not None:  # Built by another thread while we waited.
+                    self._entries.move_to_end(dataset_id)
+                    self._hits += 1
+                    return entry
+                self._misses += 1
+            entry = self._build(dataset_id)
+            with self._lock:
+                self._entries[dataset_id] = entry
+                self._entries.move_to_end(dataset_id)
+                self._evict_over_cap()
+        return entry
+
+    def _build(self, dataset_id: str) -> DatasetResources:
+        start_time = time.time()
+        dataset = DATASET_PROFILES[dataset_id]
+        entry = DatasetResources(dataset_id, dataset)
+        # Fingerprint before fetching, so a change that lands mid-build is picked up by the next refresh.
+        fingerprints = fetch_metadata_fingerprints(dataset) if METADATA_REFRESH_INTERVAL_SECONDS > 0 else {}
+        with shared_file_lock(PROMPT_CACHE_DIR, dataset_id):
+            built = _read_prompt_cache(dataset_id, fingerprints) if fingerprints else None
+            if built is None:
+                built = build_dataset_instructions(dataset_id, dataset, profiles_cache_key=_profiles_cache_key(fingerprints))
+                if fingerprints:
+                    _write_prompt_cache(dataset_id, fingerprints, built)
+        # Seed the filter-value index and the schema used to validate generated SQL, and create the agent.
+        entry.apply(built, fingerprints)
+        entry.build_seconds = time.time() - start_time
+        entry.built_at = entry.last_used = time.time()
+        entry.size_bytes = entry.estimate_size()
+        self._build_history[dataset_id].append(round(entry.build_seconds, 2))
+        logger.info(f"[AGENT_REGISTRY] Built dataset '{dataset_id}' in {entry.build_seconds:.2f} seconds "
+                    f"(~{entry.size_bytes / 1024 / 1024:.1f} MiB, prompt_version={entry.prompt_version}).")
+        return entry
+
+    def refresh(self, dataset_id: str) -> bool:
+        """
+        Polls the fingerprints of a resident dataset and, if its catalog metadata or data
+        profiles changed, re-fetches only the changed parts and swaps the agent instruction.
+
+        The first worker to notice a change fetches and writes the result to PROMPT_CACHE_DIR
+        under a cross-process lock; the other workers load it from there, so every worker
+        ends up on the same prompt version.
+
+        Returns:
+            True if a new prompt version was applied.
+        """
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+        if entry is None:
+            return False
+
+        entry.last_refresh_check = time.time()
+        fingerprints = fetch_metadata_fingerprints(entry.dataset)
+        changed = [k for k in _SECTIONS if fingerprints.get(k) is not None and fingerprints[k] != entry.fingerprints.get(k)]
+        if not changed:
+            return False
+        # Keep the old fingerprint for a source that could not be checked this time.
+        fingerprints = {k: fingerprints.get(k) if fingerprints.get(k) is not None else entry.fingerprints.get(k) for k in _SECTIONS}
+
+        start_time = time.time()
+        with shared_file_lock(PROMPT_CACHE_DIR, dataset_id):
+            context = _read_prompt_cache(dataset_id, fingerprints)
+            if context is None:
+                context = dict(entry.context)
+                if "metadata" in changed:
+                    context["table_metadata"] = fetch_table_entry_metadata(entry.dataset)
+                if "profiles" in changed:
+                    context["data_profiles"] = fetch_bigquery_data_profiles(entry.dataset, cache_key=_profiles_cache_key(fingerprints))
+                    context["samples"] = [] if context["data_profiles"] else fetch_sample_data_for_tables(dataset=entry.dataset)
+                context["prompt"] = render_instructions(entry.dataset, context["table_metadata"], context["data_profiles"], context["samples"])
+                _write_prompt_cache(dataset_id, fingerprints, context)
+
+        previous_version = entry.prompt_version
+        entry.apply(context, fingerprints, sections=changed)
+        entry.refresh_count += 1
+        with self._lock:
+            entry.size_bytes = entry.estimate_size()
+        logger.info(f"[AGENT_REGISTRY] Refreshed {changed} for dataset '{dataset_id}' in {time.time() - start_time:.2f} seconds: "
+                    f"prompt_version {previous_version} -> {entry.prompt_version}.")
+        return True
+
+    def refresh_all(self) -> None:
+        """Refreshes every resident dataset. Run periodically in each worker."""
+        for entry in self.resident():
+            try:
+                self.refresh(entry.dataset_id)
+            except Exception:
+                logger.error(f"[AGENT_REGISTRY] Metadata refresh failed for dataset '{entry.dataset_id}'", exc_info=True)
+
+    def ensure_refresher(self) -> None:
+        """
+        Starts the periodic metadata refresh in the current worker process, if enabled.
+        Called from request paths (the backend's request hook and `active_dataset()`), never
+        from `get()`, which also runs while a gunicorn --preload master creates the app.
+        """
+        start_periodic_task("metadata-refresh", METADATA_REFRESH_INTERVAL_SECONDS, self.refresh_all)
+
+    def _evict_over_cap(self) -> None:
+        """Evicts least recently used entries until the cache fits the memory cap. Caller holds the lock."""
+        total = sum(e.size_bytes for e in self._entries.values())
+        while total > self.max_memory_bytes and len(self._entries) > 1:
+            dataset_id, evicted = self._entries.popitem(last=False)
+            total -= evicted.size_bytes
+            evicted.close()
+            self._evictions += 1
+            logger.info(f"[AGENT_REGISTRY] Evicted dataset '{dataset_id}' (~{evicted.size_bytes / 1024 / 1024:.1f} MiB) to stay under the memory cap.")
+
+    def resident(self) -> list[DatasetResources]:
+        """Returns the cached entries, least recently used first."""
+        with self._lock:
+            return list(self._entries.values())
+
+    def stats(self) -> dict:
+        """Returns per-dataset build times and cache residency."""
+        with self._lock:
+            entries = list(self._entries.values())
+            return {
+                "configured_datasets": sorted(DATASET_PROFILES),
+                "resident_datasets": [e.dataset_id for e in entries],
+                "resident_bytes": sum(e.size_bytes for e in entries),
+                "max_memory_bytes": self.max_memory_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "datasets": {
+                    e.dataset_id: {
+                        "build_seconds": round(e.build_seconds, 2),
+                        "size_bytes": e.size_bytes,
+                        "prompt_version": e.prompt_version,
+                        "prompt_versions": list(e.version_history),
+                        "refresh_count": e.refresh_count,
+                        "last_refresh_check": e.last_refresh_check,
+                        "built_at": e.built_at,
+                        "last_used": e.last_used,
+                    }
+                    for e in entries
+                },
+                "build_seconds_history": dict(self._build_history),
+            }
+
+
+# A single registry per process.
+REGISTRY = AgentRegistry()
+
+def active_dataset() -> DatasetResources:
+    """Returns the resources of the dataset the current turn runs against."""
+    REGISTRY.ensure_refresher()
+    return REGISTRY.get(ACTIVE_DATASET_ID.get())
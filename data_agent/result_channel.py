@@ -0,0 +1,99 @@
+import base64
+import itertools
+import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+from .arrow_utils import contains_type, logical_type, map_leaf_arrays, table_to_columns, table_to_ipc_stream, to_json_ready
+from .constants import RESULT_FORMAT, RESULT_MAX_ROWS, RESULT_PREVIEW_ROWS
+
+logger = logging.getLogger(__name__)
+
+RESULT_FORMATS = ("json", "arrow")
+
+_result_ids = itertools.count(1)
+
+
+class QueryResult:
+    """
+    The result of one query of a chat turn, kept with its Arrow types so it can be sent to
+    the client next to the chat messages instead of through the model's restatement.
+    """
+
+    __slots__ = ("id", "sql", "job_id", "table", "total_rows")
+
+    def __init__(self, sql: str, table: pa.Table, total_rows: int, job_id: str | None = None):
+        self.id = f"r{next(_result_ids)}"
+        self.sql = sql
+        self.job_id = job_id
+        # At most RESULT_MAX_ROWS rows; `total_rows` is the size of the full result.
+        self.table = table.slice(0, RESULT_MAX_ROWS) if table.num_rows > RESULT_MAX_ROWS else table
+        self.total_rows = total_rows
+
+    @property
+    def truncated(self) -> bool:
+        return self.table.num_rows < self.total_rows
+
+    def preview(self, rows: int = RESULT_PREVIEW_ROWS) -> str:
+        """Renders what the agent sees of the result: the row count and the first `rows` rows as a Markdown table."""
+        shown = min(rows, self.table.num_rows)
+        table_md = to_json_ready(self.table.slice(0, shown)).to_pandas().to_markdown(index=False, tablefmt="pipe")
+        if shown < self.total_rows:
+            header = (f"The query returned {self.total_rows:,} rows and {self.table.num_columns} columns. "
+                      f"The first {shown} rows are below.")
+        else:
+            header = f"The query returned {self.total_rows:,} rows and {self.table.num_columns} columns."
+        return (header + " The complete result is shown to the user as a table next to your answer, so do not "
+                "repeat it; write a short narrative of the findings instead.\n\n" + table_md)
+
+    def encode(self, result_format: str = RESULT_FORMAT) -> dict:
+        """
+        Encodes the result for the chat response.
+
+        Args:
+            result_format: 'json' for columnar JSON ('data' holds one array per column, with
+                dates and timestamps as ISO strings and decimals as numbers) or 'arrow' for a
+                base64 Arrow IPC stream ('arrow_ipc') that keeps the BigQuery types.
+
+        Returns:
+            A dictionary with the result's metadata, its typed 'columns' and the encoded data.
+        """
+        payload = {
+            "id": self.id,
+            "sql": self.sql,
+            "job_id": self.job_id,
+            "total_rows": self.total_rows,
+            "row_count": self.table.num_rows,
+            "truncated": self.truncated,
+            "format": result_format,
+            "columns": [{"name": f.name, "type": logical_type(f.type)} for f in self.table.schema],
+        }
+        if result_format == "arrow":
+            payload["arrow_ipc"] = base64.b64encode(table_to_ipc_stream(self.table)).decode("ascii")
+        else:
+            payload["data"] = table_to_columns(_without_nan(to_json_ready(self.table)))
+        return payload
+
+
+def _nan_to_null(array: pa.Array) -> pa.Array:
+    if pa.types.is_floating(array.type) and len(array) and pc.any(pc.is_nan(array)).as_py():
+        return pc.if_else(pc.is_nan(array), pa.scalar(None, array.type), array)
+    return array
+
+
+def _without_nan(table: pa.Table) -> pa.Table:
+    """Replaces NaN by nulls in float columns and in the floats inside lists and structs, as NaN is not valid JSON."""
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        if table.num_rows and contains_type(field.type, pa.types.is_floating):
+            column = map_leaf_arrays(column, _nan_to_null)
+        columns.append(column)
+    return pa.table(columns, names=table.column_names)
+
+
+def encode_results(results: list[QueryResult], result_format: str | None = None) -> list[dict]:
+    """Encodes the results of a turn; unknown formats fall back to RESULT_FORMAT."""
+    if result_format not in RESULT_FORMATS:
+        if result_format:
+            logger.warning(f"Unknown result format '{result_format}'; using '{RESULT_FORMAT}'.")
+        result_format = RESULT_FORMAT
+    return [result.encode(result_format) for result in results]
@@ -0,0 +1,213 @@
+import logging
+import re
+import threading
+from .constants import (
+    MODEL,
+    FAST_MODEL,
+    MODEL_ROUTING_ENABLED,
+    ROUTING_FAST_MAX_WORDS,
+    ROUTING_ESCALATE_MIN_JOINS,
+)
+
+logger = logging.getLogger(__name__)
+
+TIER_FAST = "fast"
+TIER_PRO = "pro"
+
+_SMALLTALK = re.compile(r"^\s*(hi|hello|hey|thanks|thank you|ok|okay|great|cool|bye|good (morning|afternoon|evening))\b[\s!.]*$", re.IGNORECASE)
+# Questions about the data itself rather than about its values; answered from the prompt.
+_METADATA_LOOKUP = re.compile(
+    r"\b(what|which|list|show|describe)\b.{0,30}\b(tables?|columns?|fields?|schema|datasets?|data do you have)\b"
+    r"|\bwhat can you\b|\bhow do i use\b|\bhelp\b",
+    re.IGNORECASE,
+)
+# Phrasings that usually need several tables, window functions or multi-step aggregation.
+_COMPLEX = re.compile(
+    r"\b(join|joined|compare|comparison|compared|versus|vs\.?|trend|trends|growth|ratio|share of|percentage|"
+    r"correlat\w*|rank|ranking|top \d+|bottom \d+|breakdown|break down|cohort|cumulative|running total|"
+    r"month over month|year over year|mom|yoy|median|distribution|across|each|per|split by|along with|"
+    r"together with|as well as)\b",
+    re.IGNORECASE,
+)
+_JOIN = re.compile(r"\bjoin\b", re.IGNORECASE)
+
+
+class RoutingDecision:
+    """The model chosen for one model call of a turn, and why."""
+
+    __slots__ = ("tier", "model", "reason")
+
+    def __init__(self, tier: str, model: str, reason: str):
+        self.tier = tier
+        self.model = model
+        self.reason = reason
+
+    def as_dict(self) -> dict:
+        return {"tier": self.tier, "model": self.model, "reason": self.reason}
+
+
+def _role_texts(content) -> tuple[str, bool, bool]:
+    """Returns (text, has_function_call, has_function_response) of a genai Content."""
+    texts, has_call, has_response = [], False, False
+    for part in getattr(content, "parts", None) or []:
+        if getattr(part, "text", None) and not getattr(part, "thought", False):
+            texts.append(part.text)
+        has_call = has_call or getattr(part, "function_call", None) is not None
+        has_response = has_response or getattr(part, "function_response", None) is not None
+    return "\n".join(texts), has_call, has_response
+
+
+def question_for_routing(contents) -> tuple[str, bool]:
+    """
+    Extracts the question a model call answers from the request contents.
+
+    Returns:
+        (question, answers_clarification). If the latest user message replies to a
+        clarification question of the model (a model text without tool calls), the
+        question is the original user message and the reply, joined.
+    """
+    contents = list(contents or [])
+    user_indexes = [i for i, c in enumerate(contents)
+                    if getattr(c, "role", None) == "user" and _role_texts(c)[0] and not _role_texts(c)[2]]
+    if not user_indexes:
+        return "", False
+    last = user_indexes[-1]
+    question = _role_texts(contents[last])[0]
+    previous_model = next((c for c in reversed(contents[:last]) if getattr(c, "role", None) == "model"), None)
+    if previous_model is None:
+        return question, False
+    model_text, has_call, _ = _role_texts(previous_model)
+    if has_call or not model_text.rstrip().endswith("?") or len(user_indexes) < 2:
+        return question, False
+    return f"{_role_texts(contents[user_indexes[-2]])[0]}\n{question}", True
+
+
+def classify_question(question: str) -> tuple[str, str]:
+    """
+    Classifies a question with local heuristics.
+
+    Returns:
+        (tier, reason): TIER_FAST for small talk, questions about the available data and
+        short questions without multi-table or analytical phrasing (which are typically
+        single-table lookups, or are answered with a clarification question such as the
+        missing timeframe), TIER_PRO otherwise.
+    """
+    text = question.strip()
+    if not text:
+        return TIER_PRO, "no_question"
+    if _SMALLTALK.match(text):
+        return TIER_FAST, "smalltalk"
+    if _METADATA_LOOKUP.search(text) and not _COMPLEX.search(text):
+        return TIER_FAST, "metadata_lookup"
+    if _COMPLEX.search(text):
+        return TIER_PRO, "complex_phrasing"
+    if len(text.split()) > ROUTING_FAST_MAX_WORDS:
+        return TIER_PRO, "long_question"
+    return TIER_FAST, "simple_lookup"
+
+
+def escalation_reason(llm_responses) -> str | None:
+    """
+    Returns why a fast-model answer must be regenerated by MODEL, or None to keep it.
+
+    SQL with ROUTING_ESCALATE_MIN_JOINS or more joins is left to the Pro model, as are
+    empty answers.
+    """
+    has_output = False
+    for llm_response in llm_responses:
+        content = getattr(llm_response, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            function_call = getattr(part, "function_call", None)
+            if function_call is not None:
+                has_output = True
+                sql = str((function_call.args or {}).get("sql_query", ""))
+                if ROUTING_ESCALATE_MIN_JOINS and len(_JOIN.findall(sql)) >= ROUTING_ESCALATE_MIN_JOINS:
+                    return "multi_table_sql"
+            elif getattr(part, "text", None):
+                has_output = True
+    return None if has_output else "empty_response"
+
+
+class ModelRouter:
+    """
+    Routes each model call of a chat turn to FAST_MODEL or MODEL.
+
+    The tier is decided on the first model call of a turn from the user's question
+    (see `classify_question()`) and kept for the turn's later calls (after tool
+    results), so one answer is not produced by two models. A fast call that fails, or
+    whose answer needs escalation (see `escalation_reason()`), is retried with MODEL,
+    and the rest of the turn stays on MODEL. Decisions, per-model latency and the
+    fallback rate are kept for /api/metrics.
+    """
+
+    def __init__(self, enabled: bool = MODEL_ROUTING_ENABLED, fast_model: str = FAST_MODEL, pro_model: str = MODEL):
+        self.enabled = enabled and bool(fast_model) and fast_model != pro_model
+        self.fast_model = fast_model
+        self.pro_model = pro_model
+        self._lock = threading.Lock()
+        self._decisions: dict[str, int] = {}
+        self._fallbacks: dict[str, int] = {}
+        self._latency = {}  # model -> [calls, total seconds, max seconds]
+
+    def route(self, llm_request, turn=None) -> RoutingDecision:
+        """Chooses the model of one call; the turn (if any) remembers the decision."""
+        if not self.enabled:
+            return RoutingDecision(TIER_PRO, llm_request.model or self.pro_model, "routing_disabled")
+        routing = getattr(turn, "routing", None)
+        if routing and routing.get("tier"):
+            tier = routing["tier"]
+            return RoutingDecision(tier, self.fast_model if tier == TIER_FAST else self.pro_model, routing["reason"])
+
+        question, answers_clarification = question_for_routing(llm_request.contents)
+        tier, reason = classify_question(question)
+        if answers_clarification:
+            reason = f"clarification_answer:{reason}"
+        decision = RoutingDecision(tier, self.fast_model if tier == TIER_FAST else self.pro_model, reason)
+        with self._lock:
+            self._decisions[f"{tier}:{reason}"] = self._decisions.get(f"{tier}:{reason}", 0) + 1
+        if turn is not None:
+            turn.routing.update(decision.as_dict())
+        logger.info(f"[ROUTING] Turn routed to {decision.model} ({reason}).")
+        return decision
+
+    def record_fallback(self, turn, decision: RoutingDecision, reason: str) -> RoutingDecision:
+        """Records that a fast call is retried with MODEL; returns the new decision."""
+        with self._lock:
+            self._fallbacks[reason] = self._fallbacks.get(reason, 0) + 1
+        fallback = RoutingDecision(TIER_PRO, self.pro_model, f"fallback:{reason}")
+        if turn is not None:
+            turn.routing.update(fallback.as_dict())
+            turn.routing["fallbacks"] = turn.routing.get("fallbacks", 0) + 1
+        logger.warning(f"[ROUTING] Call on {decision.model} ({decision.reason}) falls back to {self.pro_model}: {reason}.")
+        return fallback
+
+    def record_latency(self, turn, model: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._latency.setdefault(model, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        if turn is not None:
+            per_model = turn.routing.setdefault("llm_seconds", {})
+            per_model[model] = round(per_model.get(model, 0.0) + seconds, 3)
+
+    def stats(self) -> dict:
+        """Returns routing decisions, fallbacks and per-model latency of this worker."""
+        with self._lock:
+            fast_turns = sum(n for key, n in self._decisions.items() if key.startswith(f"{TIER_FAST}:"))
+            fallbacks = sum(self._fallbacks.values())
+            return {
+                "enabled": self.enabled,
+                "fast_model": self.fast_model,
+                "pro_model": self.pro_model,
+                "decisions": dict(self._decisions),
+                "fallbacks": dict(self._fallbacks),
+                "fallback_rate": round(fallbacks / fast_turns, 3) if fast_turns else None,
+                "latency": {
+                    model: {"calls": calls, "avg_seconds": round(total / calls, 3), "max_seconds": round(peak, 3)}
+                    for model, (calls, total, peak) in self._latency.items()
+                },
+            }
+
+
+MODEL_ROUTER = ModelRouter()
@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import threading
+import time
+from google.api_core import exceptions as api_exceptions
+from .constants import (
+    SINGLE_FLIGHT_ENABLED,
+    SINGLE_FLIGHT_WINDOW_SECONDS,
+    SINGLE_FLIGHT_FOLLOWER_WAIT_SECONDS,
+    SINGLE_FLIGHT_MAX_ATTEMPTS,
+)
+from .sql_parsing import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# BigQuery error reasons after which a rerun of the same query may succeed. Any other
+# failure (invalidQuery, bytesBilledLimitExceeded, accessDenied, ...) is deterministic
+# and shared with every caller of the job.
+_TRANSIENT_REASONS = {
+    "backendError", "internalError", "jobBackendError", "jobInternalError",
+    "rateLimitExceeded", "quotaExceeded", "stopped", "timeout",
+}
+
+
+def _is_transient(error: Exception) -> bool:
+    """Classifies a query failure: True if a fresh job may succeed where this one failed."""
+    if isinstance(error, (api_exceptions.BadRequest, api_exceptions.Forbidden, api_exceptions.NotFound)):
+        # Client errors are deterministic unless BigQuery reports a transient reason
+        # (e.g. rateLimitExceeded is returned as 403).
+        reasons = {e.get("reason") for e in getattr(error, "errors", None) or [] if isinstance(e, dict)}
+        return bool(reasons & _TRANSIENT_REASONS)
+    # Server errors, timeouts, cancellations and connection errors.
+    return True
+
+
+class QueryCancelled(Exception):
+    """Raised when the caller of a query was cancelled while waiting for it."""
+
+
+class CoalescedResult:
+    """The shared outcome of a query. `value` is whatever `materialize()` returned for the job."""
+
+    __slots__ = ("value", "job", "role")
+
+    def __init__(self, value, job, role: str):
+        self.value = value
+        self.job = job
+        # 'leader': this call created the BigQuery job and is billed for it.
+        # 'follower': another call in this worker ran the job; its result was reused.
+        # 'attached': the job was created by another worker (or earlier in the window).
+        self.role = role
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "transient", "attempt", "window")
+
+    def __init__(self, attempt: int):
+        self.done = threading.Event()
+        # The time window the job ids of this flight belong to, fixed when the flight starts.
+        self.window = int(time.time() // SINGLE_FLIGHT_WINDOW_SECONDS) if SINGLE_FLIGHT_WINDOW_SECONDS > 0 else 0
+        self.result = None
+        self.error = None
+        self.transient = False
+        self.attempt = attempt
+
+
+class QueryCoalescer:
+    """
+    Single-flight execution of identical BigQuery queries.
+
+    Concurrent callers with the same normalized SQL (and job settings) share one job:
+
+    * Within a worker, the first caller (the leader) runs the job and materializes its
+      result; the others wait for it and reuse the same result object.
+    * Across workers, the job id is derived from the query hash and a time window
+      (SINGLE_FLIGHT_WINDOW_SECONDS). A second worker submitting the same query gets
+      a 409 Conflict and attaches to the existing job with `get_job()` instead.
+
+    If the shared job fails with a deterministic error, every caller gets that error.
+    If it fails transiently, or the leader does not finish within
+    SINGLE_FLIGHT_FOLLOWER_WAIT_SECONDS, waiting callers run (or attach to) the job
+    themselves, using a new attempt number in the job id so they coalesce again.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+        self._counters = {"leaders": 0, "followers": 0, "attached": 0, "reruns": 0, "follower_timeouts": 0, "bytes_billed_saved": 0}
+
+    @staticmethod
+    def flight_key(sql_query: str, project_id: str, job_config=None) -> str:
+        """Hashes the normalized SQL with the settings that change a job's outcome."""
+        max_bytes = getattr(job_config, "maximum_bytes_billed", None) if job_config is not None else None
+        payload = "\0".join((project_id or "", str(max_bytes or ""), normalize_sql(sql_query)))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:40]
+
+    @staticmethod
+    def _job_id(key: str, window: int, attempt: int) -> str:
+        return f"data_agent_{key}_{window}_{attempt}"
+
+    def run(self, client, sql_query: str, job_config=None, location: str | None = None, materialize=None, on_job=None,
+            cancelled=None, max_results: int | None = None) -> CoalescedResult:
+        """
+        Runs a query, sharing the job and its result with identical concurrent calls.
+
+        Args:
+            client: A `bigquery.Client`.
+            sql_query: The query to run.
+            job_config: An optional `bigquery.QueryJobConfig`.
+            location: The location of the dataset, used to look up jobs by id.
+            materialize: A callable `(job, rows) -> value` turning the finished job's
+                RowIterator into the value shared with all callers (e.g. a DataFrame).
+                The value must not be mutated by callers.
+            on_job: An optional callable receiving each job this call creates (not jobs
+                it attaches to), before waiting for its result, e.g. to cancel it later.
+            cancelled: An optional zero-argument callable returning True once the caller
+                is cancelled. A cancelled caller stops waiting for a shared job and does
+                not retry its own failed job.
+            max_results: An optional cap on the rows downloaded into the RowIterator passed to
+                `materialize`. Its `total_rows` still counts the full result. Callers of the
+                same query should pass the same cap, as they share one materialized value.
+
+        Returns:
+            A CoalescedResult.
+
+        Raises:
+            The query's exception if the job failed deterministically, or all attempts failed.
+            QueryCancelled: If `cancelled()` became True.
+        """
+        materialize = materialize or (lambda job, rows: rows)
+        if not self.enabled:
+            job = client.query(sql_query, job_config=job_config)
+            if on_job is not None:
+                on_job(job)
+            return CoalescedResult(materialize(job, job.result(max_results=max_results)), job, "leader")
+
+        key = self.flight_key(sql_query, client.project, job_config)
+        attempt = 0
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                is_leader = flight is None or flight.attempt < attempt
+                if is_leader:
+                    flight = self._flights[key] = _Flight(attempt)
+
+            if is_leader:
+                return self._lead(key, flight, client, sql_query, job_config, location, materialize, on_job, cancelled,
+                                  max_results)
+
+            if not self._wait(flight, cancelled):
+                # The leader is stuck (e.g. a slow page download). Attach to the job directly.
+                with self._lock:
+                    self._counters["follower_timeouts"] += 1
+                logger.warning(f"[SINGLE_FLIGHT] Leader of query {key} did not finish in time; attaching to its job.")
+                return self._execute(self._job_id(key, flight.window, flight.attempt), client, sql_query, job_config, location,
+                                     materialize, max_results=max_results)
+
+            if flight.error is None:
+                with self._lock:
+                    self._counters["followers"] += 1
+                    self._counters["bytes_billed_saved"] += flight.result.job.total_bytes_billed or 0
+                logger.info(f"[SINGLE_FLIGHT] Reused the in-flight result of query {key}.")
+                return CoalescedResult(flight.result.value, flight.result.job, "follower")
+            if not flight.transient or flight.attempt + 1 >= SINGLE_FLIGHT_MAX_ATTEMPTS:
+                raise flight.error
+            if cancelled is not None and cancelled():
+                raise QueryCancelled(f"Cancelled before rerunning query {key}.")
+            attempt = flight.attempt + 1
+            with self._lock:
+                self._counters["reruns"] += 1
+
+    @staticmethod
+    def _wait(flight: _Flight, cancelled) -> bool:
+        """Waits for the leader of a flight; returns False if it did not finish in time."""
+        if cancelled is None:
+            return flight.done.wait(timeout=SINGLE_FLIGHT_FOLLOWER_WAIT_SECONDS)
+        deadline = time.monotonic() + SINGLE_FLIGHT_FOLLOWER_WAIT_SECONDS
+        while not flight.done.wait(timeout=min(1.0, max(0.0, deadline - time.monotonic()))):
+            if cancelled():
+                raise QueryCancelled("Cancelled while waiting for a shared query.")
+            if time.monotonic() >= deadline:
+                return False
+        return True
+
+    def _lead(self, key, flight, client, sql_query, job_config, location, materialize, on_job=None, cancelled=None,
+              max_results=None) -> CoalescedResult:
+        attempt = flight.attempt
+        try:
+            while True:
+                try:
+                    result = self._execute(self._job_id(key, flight.window, attempt), client, sql_query, job_config, location,
+                                           materialize, on_job, max_results)
+                    break
+                except Exception as e:
+                    if not _is_transient(e) or attempt + 1 >= SINGLE_FLIGHT_MAX_ATTEMPTS or (cancelled is not None and cancelled()):
+                        raise
+                    logger.warning(f"[SINGLE_FLIGHT] Attempt {attempt} of query {key} failed transiently ({e}); retrying.")
+                    attempt += 1
+                    flight.attempt = attempt
+                    with self._lock:
+                        self._counters["reruns"] += 1
+            flight.result = result
+            return result
+        except Exception as e:
+            flight.error = e
+            flight.transient = _is_transient(e)
+            flight.attempt = attempt
+            raise
+        finally:
+            flight.done.set()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def _execute(self, job_id, client, sql_query, job_config, location, materialize, on_job=None, max_results=None) -> CoalescedResult:
+        """Creates the job with the given id, or attaches to it if another worker already did."""
+        role = "leader"
+        try:
+            job = client.query(sql_query, job_config=job_config, job_id=job_id, location=location)
+            if on_job is not None:
+                on_job(job)
+        except api_exceptions.Conflict:
+            job = client.get_job(job_id, location=location)
+            role = "attached"
+        rows = job.result(max_results=max_results)
+        value = materialize(job, rows)
+        with self._lock:
+            if role == "leader":
+                self._counters["leaders"] += 1
+            else:
+                self._counters["attached"] += 1
+                self._counters["bytes_billed_saved"] += job.total_bytes_billed or 0
+        if role == "attached":
+            logger.info(f"[SINGLE_FLIGHT] Attached to existing BigQuery job {job_id}.")
+        return CoalescedResult(value, job, role)
+
+    def stats(self) -> dict:
+        """Returns how many queries ran, were shared in-process or attached across workers."""
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._flights))
+
+
+QUERY_COALESCER = QueryCoalescer()
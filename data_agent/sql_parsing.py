@@ -0,0 +1,240 @@
+import re
+
+# A deliberately small GoogleSQL tokenizer. It understands just enough of the
+# lexical grammar (quoted identifiers, string literals, comments) to reliably find
+# table references, aliases and `alias.column` references in agent-generated SQL.
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ws>\s+)
+    | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    | (?P<string>[rRbB]{0,2}(?:'''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*"))
+    | (?P<quoted>`(?:[^`\\]|\\.)*`)
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<op><=|>=|<>|!=|\|\||<<|>>|[-+*/%=<>!~&|^])
+    | (?P<punct>[(),.;:\[\]{}@?])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Keywords that can never be a table alias.
+RESERVED_KEYWORDS = {
+    "ALL", "AND", "ANY", "ARRAY", "AS", "ASC", "BETWEEN", "BY", "CASE", "CAST", "CROSS",
+    "CUBE", "DEFAULT", "DESC", "DISTINCT", "ELSE", "END", "EXCEPT", "EXISTS", "EXTRACT",
+    "FALSE", "FETCH", "FOR", "FROM", "FULL", "GROUP", "GROUPING", "HAVING", "IF", "IN",
+    "INNER", "INTERSECT", "INTERVAL", "INTO", "IS", "JOIN", "LEFT", "LIKE", "LIMIT", "NATURAL",
+    "NOT", "NULL", "OFFSET", "ON", "OR", "ORDER", "OUTER", "OVER", "PARTITION", "PIVOT",
+    "QUALIFY", "RANGE", "RECURSIVE", "RIGHT", "ROLLUP", "ROWS", "SELECT", "SET", "TABLESAMPLE",
+    "THEN", "TRUE", "UNION", "UNNEST", "UNPIVOT", "USING", "WHEN", "WHERE", "WINDOW", "WITH",
+}
+
+# Keywords that end an ON condition or a FROM list at the same nesting depth.
+CLAUSE_KEYWORDS = {
+    "JOIN", "LEFT", "RIGHT", "INNER", "FULL", "CROSS", "WHERE", "GROUP", "ORDER", "HAVING",
+    "QUALIFY", "WINDOW", "LIMIT", "UNION", "INTERSECT", "EXCEPT", "USING", "ON",
+}
+
+
+def tokenize_sql(sql: str) -> list[tuple[str, str, int]]:
+    """
+    Splits a GoogleSQL string into (kind, text, position) tokens, dropping whitespace and comments.
+
+    Kinds are 'ident', 'quoted' (backtick identifier), 'string', 'number', 'op' and 'punct'.
+    Characters the tokenizer does not recognise are returned as 'punct' tokens.
+    """
+    tokens = []
+    pos = 0
+    length = len(sql or "")
+    while pos < length:
+        match = _TOKEN_RE.match(sql, pos)
+        if not match:
+            tokens.append(("punct", sql[pos], pos))
+            pos += 1
+            continue
+        kind = match.lastgroup
+        if kind not in ("ws", "comment"):
+            tokens.append((kind, match.group(), pos))
+        pos = match.end()
+    return tokens
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Returns a canonical form of a query: comments removed, whitespace collapsed,
+    keywords upper-cased and a trailing semicolon dropped. Literals and quoted
+    identifiers are kept verbatim, so two queries with the same normal form are
+    semantically identical.
+    """
+    parts = []
+    for kind, text, _ in tokenize_sql(sql):
+        if kind == "ident" and text.upper() in RESERVED_KEYWORDS:
+            text = text.upper()
+        parts.append(text)
+    while parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts)
+
+
+def paren_scopes(tokens: list[tuple[str, str, int]]) -> tuple[list[int], dict[int, int]]:
+    """
+    Maps every token to the parenthesis level it is in, so names bound in a subquery or
+    CTE body can be told apart from names bound outside of it.
+
+    Returns:
+        A list with the index of the innermost "(" enclosing each token (-1 at the top
+        level), and a dictionary mapping the index of each "(" to the scope it is in.
+    """
+    scope_of, parents, stack = [], {}, [-1]
+    for i, token in enumerate(tokens):
+        if token[1] == ")" and len(stack) > 1:
+            stack.pop()
+        scope_of.append(stack[-1])
+        if token[1] == "(":
+            parents[i] = stack[-1]
+            stack.append(i)
+    return scope_of, parents
+
+
+def _is_word(token, *words) -> bool:
+    return token is not None and token[0] == "ident" and token[1].upper() in words
+
+
+def _identifier_text(token) -> str:
+    return token[1][1:-1] if token[0] == "quoted" else token[1]
+
+
+def parse_table_references(tokens: list[tuple[str, str, int]]) -> dict:
+    """
+    Finds the tables read by a query.
+
+    Args:
+        tokens: The output of `tokenize_sql()`.
+
+    Returns:
+        A dictionary with:
+            - 'tables': a list of dicts with 'path' (the dotted reference as written),
+              'table_name' (its last segment), 'alias' (or None), and 'start'/'end'
+              token indexes of the reference.
+            - 'cte_names': the lower-cased names defined in WITH clauses (and named windows).
+    """
+    cte_names = set()
+    for i in range(len(tokens) - 2):
+        if tokens[i][0] in ("ident", "quoted") and _is_word(tokens[i + 1], "AS") and tokens[i + 2][1] == "(":
+            cte_names.add(_identifier_text(tokens[i]).lower())
+
+    # FROM also appears inside EXTRACT(part FROM expr) and in IS [NOT] DISTINCT FROM.
+    non_table_from = set()
+    paren_stack = []
+    for i, token in enumerate(tokens):
+        if token[1] == "(":
+            paren_stack.append(i > 0 and _is_word(tokens[i - 1], "EXTRACT"))
+        elif token[1] == ")":
+            if paren_stack:
+                paren_stack.pop()
+        elif _is_word(token, "FROM") and ((paren_stack and paren_stack[-1]) or (i > 0 and _is_word(tokens[i - 1], "DISTINCT"))):
+            non_table_from.add(i)
+
+    tables = []
+    i = 0
+    while i < len(tokens):
+        if not _is_word(tokens[i], "FROM", "JOIN") or i in non_table_from:
+            i += 1
+            continue
+        i += 1
+        while i < len(tokens):
+            # Read a dotted path made of identifiers and/or backtick-quoted parts.
+            start = i
+            segments = []
+            while i < len(tokens) and tokens[i][0] in ("ident", "quoted"):
+                if tokens[i][0] == "ident" and tokens[i][1].upper() in RESERVED_KEYWORDS:
+                    break
+                segments.append(_identifier_text(tokens[i]))
+                if i + 1 < len(tokens) and tokens[i + 1][1] == "." and i + 2 < len(tokens) and tokens[i + 2][0] in ("ident", "quoted"):
+                    i += 2
+                    continue
+                i += 1
+                break
+            if not segments:
+                break
+            path = ".".join(segments)
+            end = i
+            alias = None
+            if i < len(tokens) and _is_word(tokens[i], "AS"):
+                i += 1
+            if i < len(tokens) and tokens[i][0] in ("ident", "quoted") and not (
+                    tokens[i][0] == "ident" and tokens[i][1].upper() in RESERVED_KEYWORDS):
+                alias = _identifier_text(tokens[i])
+                i += 1
+            tables.append({
+                "path": path,
+                "table_name": path.split(".")[-1],
+                "alias": alias,
+                "start": start,
+                "end": end,
+            })
+            # Comma-separated FROM lists (implicit cross joins).
+            if i < len(tokens) and tokens[i][1] == ",":
+                i += 1
+                continue
+            break
+    return {"tables": tables, "cte_names": cte_names}
+
+
+def parse_qualified_columns(tokens: list[tuple[str, str, int]], skip: set[int] = frozenset()) -> list[tuple[str, str, int]]:
+    """
+    Finds `qualifier.column` references.
+
+    Args:
+        tokens: The output of `tokenize_sql()`.
+        skip: Token indexes to ignore (e.g., those that are part of table references).
+
+    Returns:
+        A list of (qualifier, column, token_index) tuples.
+    """
+    refs = []
+    for i in range(len(tokens) - 2):
+        if i in skip or (i > 0 and tokens[i - 1][1] == "."):
+            continue
+        first, dot, second = tokens[i], tokens[i + 1], tokens[i + 2]
+        if first[0] in ("ident", "quoted") and dot[1] == "." and second[0] in ("ident", "quoted"):
+            refs.append((_identifier_text(first), _identifier_text(second), i))
+    return refs
+
+
+def parse_join_conditions(tokens: list[tuple[str, str, int]]) -> list[tuple[int, list[tuple[str, str, str, str]]]]:
+    """
+    Extracts the column equalities of every `JOIN ... ON` condition.
+
+    Returns:
+        One (token_index, pairs) tuple per ON clause, where token_index is the index of the
+        ON keyword and pairs holds (left_qualifier, left_column, right_qualifier, right_column)
+        tuples for the `a.x = b.y` terms found at the top level of that clause.
+    """
+    conditions = []
+    for i, token in enumerate(tokens):
+        if not _is_word(token, "ON"):
+            continue
+        pairs = []
+        depth = 0
+        j = i + 1
+        while j < len(tokens):
+            text = tokens[j][1]
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+            elif depth == 0 and (text == ";" or (tokens[j][0] == "ident" and text.upper() in CLAUSE_KEYWORDS)):
+                break
+            if (j + 6 < len(tokens) and tokens[j + 3][1] == "="
+                    and tokens[j + 1][1] == "." and tokens[j + 5][1] == "."
+                    and all(tokens[k][0] in ("ident", "quoted") for k in (j, j + 2, j + 4, j + 6))):
+                pairs.append((_identifier_text(tokens[j]), _identifier_text(tokens[j + 2]),
+                              _identifier_text(tokens[j + 4]), _identifier_text(tokens[j + 6])))
+                j += 7
+                continue
+            j += 1
+        conditions.append((i, pairs))
+    return conditions
@@ -0,0 +1,239 @@
+import difflib
+import logging
+import re
+import threading
+import time
+from .constants import DATASET_PROFILES, DEFAULT_DATASET_ID
+from .sql_parsing import tokenize_sql, paren_scopes, parse_table_references, parse_qualified_columns, parse_join_conditions
+from .utils import find_schema_aspect, extract_join_relationships
+
+logger = logging.getLogger(__name__)
+
+# BigQuery error messages that a schema-aware validator should have caught locally.
+# Used to measure how many schema mistakes still slip through to BigQuery.
+_SCHEMA_ERROR_PATTERNS = re.compile(
+    r"Unrecognized name|Name \S+ not found inside|Not found: Table|Table \S+ was not found|"
+    r"must be qualified with a dataset|Field name \S+ does not exist",
+    re.IGNORECASE,
+)
+
+# Pseudo-columns that never appear in the schema aspect but are valid to reference.
+_PSEUDO_COLUMNS = {"_partitiontime", "_partitiondate", "_table_suffix", "_file_name"}
+
+
+class SchemaValidator:
+    """
+    Validates agent-generated GoogleSQL against the cached table schema before execution.
+
+    The validator only reports definite mistakes as errors (unknown tables in the target
+    dataset, unknown `alias.column` references) so that a valid query is never blocked.
+    Columns of tables whose catalog entry has no schema aspect are not checked.
+    Aliases are scoped per parenthesis level: a reference resolves to the nearest binding
+    of its qualifier in its own subquery or an enclosing one. A qualifier bound to more
+    than one table at the same level (e.g. in both branches of a UNION) is ambiguous, and
+    unknown columns behind it are only reported as warnings.
+    Join conditions that do not match the declared join relationship aspect are reported
+    as warnings and passed back to the agent together with the query results.
+    """
+
+    def __init__(self, dataset: dict | None = None):
+        self.dataset = dataset or DATASET_PROFILES[DEFAULT_DATASET_ID]
+        self._lock = threading.Lock()
+        self._tables: set[str] = set()   # lower-cased names of every table of the dataset
+        self._columns: dict[str, dict[str, str]] = {}   # table -> {column_lower: column}, for tables with a schema
+        self._relationships: dict[frozenset, list[dict]] = {}
+        self._validations = 0
+        self._rejections = 0
+        self._validation_seconds = 0.0
+        self._schema_errors_missed = 0
+        self._bq_failure_count = 0
+        self._bq_failure_seconds = 0.0
+
+    def load_metadata(self, table_metadata: list[dict]) -> None:
+        """(Re)loads column names and join relationships from `fetch_table_entry_metadata()` output."""
+        tables, columns = set(), {}
+        for table_meta in table_metadata or []:
+            table_name = table_meta.get('table_name')
+            if not table_name:
+                continue
+            tables.add(table_name.lower())
+            fields = find_schema_aspect(table_meta).get('fields', [])
+            if fields:
+                columns[table_name.lower()] = {f['name'].lower(): f['name'] for f in fields if f.get('name')}
+
+        relationships: dict[frozenset, list[dict]] = {}
+        for rel in extract_join_relationships(table_metadata):
+            key = frozenset((rel['table_name'].lower(), rel['related_table_name'].lower()))
+            relationships.setdefault(key, []).append(rel)
+
+        with self._lock:
+            self._tables = tables
+            self._columns = columns
+            self._relationships = relationships
+        logger.info(f"[SQL_VALIDATOR] Loaded schema for {len(columns)} of {len(tables)} tables and "
+                    f"{len(relationships)} join relationships.")
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self._tables)
+
+    def column_count(self) -> int:
+        """Returns the number of columns known across all tables."""
+        return sum(len(cols) for cols in self._columns.values())
+
+    def validate(self, sql_query: str) -> dict:
+        """
+        Checks table, column and join key references in a query.
+
+        Args:
+            sql_query: The GoogleSQL query to validate.
+
+        Returns:
+            A dictionary with 'errors' (a list of fix hints that would make BigQuery reject
+            the query) and 'warnings' (a list of hints about suspicious join keys).
+        """
+        start_time = time.perf_counter()
+        project_id, dataset_name = self.dataset["project_id"], self.dataset["dataset_name"]
+        known_tables, columns = self._tables, self._columns
+        relationships = self._relationships
+        errors: list[str] = []
+        warnings: list[str] = []
+
+        tokens = tokenize_sql(sql_query)
+        refs = parse_table_references(tokens)
+        cte_names = refs['cte_names']
+        scope_of, parent_scope = paren_scopes(tokens)
+
+        # (scope, qualifier lower-cased) -> the schema tables bound to it there. Tables that
+        # cannot be checked (CTEs, other datasets, unknown tables) bind an empty set, so they
+        # still shadow bindings of the same name in enclosing scopes.
+        bindings: dict[tuple[int, str], set[str]] = {}
+
+        def bind(ref, table_key: str | None) -> None:
+            scope = scope_of[ref['start']]
+            for name in filter(None, (ref['table_name'], ref['alias'])):
+                tables = bindings.setdefault((scope, name.lower()), set())
+                if table_key:
+                    tables.add(table_key)
+
+        def resolve(qualifier: str, token_index: int) -> set[str]:
+            scope = scope_of[token_index]
+            while True:
+                tables = bindings.get((scope, qualifier.lower()))
+                if tables is not None:
+                    return tables
+                if scope == -1:
+                    return set()
+                scope = parent_scope[scope]
+
+        table_token_indexes = set()
+        for ref in refs['tables']:
+            table_token_indexes.update(range(ref['start'], ref['end']))
+            path_parts = [p.lower() for p in ref['path'].split('.')]
+            table_key = path_parts[-1]
+            if len(path_parts) == 1:
+                bind(ref, None)
+                if table_key in cte_names:
+                    continue
+                errors.append(
+                    f"Table `{ref['path']}` is not fully qualified. Use `{project_id}.{dataset_name}.{ref['path']}`."
+                )
+                continue
+            if path_parts[-2] != dataset_name.lower():
+                bind(ref, None)
+                continue  # A table outside the target dataset; nothing to check it against.
+            if table_key not in known_tables:
+                bind(ref, None)
+                suggestion = difflib.get_close_matches(table_key, list(known_tables), n=3, cutoff=0.6)
+                hint = f" Did you mean: {', '.join(suggestion)}?" if suggestion else ""
+                errors.append(f"Table `{ref['path']}` does not exist in dataset `{dataset_name}`.{hint}")
+                continue
+            # A table without a loaded schema aspect exists, but its columns cannot be checked.
+            bind(ref, table_key if table_key in columns else None)
+
+        for qualifier, column, index in parse_qualified_columns(tokens, skip=table_token_indexes):
+            tables = resolve(qualifier, index)
+            if not tables or column.lower() in _PSEUDO_COLUMNS or any(column.lower() in columns[t] for t in tables):
+                continue
+            if len(tables) > 1:
+                message = (f"Column `{qualifier}.{column}` was not found in any of the tables aliased as `{qualifier}` "
+                           f"({', '.join(sorted(tables))}). Check the reference; the alias is used for more than one table.")
+                if message not in warnings:
+                    warnings.append(message)
+                continue
+            table_key = next(iter(tables))
+            suggestion = difflib.get_close_matches(column.lower(), list(columns[table_key]), n=3, cutoff=0.6)
+            hint = f" Did you mean: {', '.join(columns[table_key][s] for s in suggestion)}?" if suggestion else ""
+            message = f"Column `{column}` does not exist in table `{table_key}` (referenced as `{qualifier}.{column}`).{hint}"
+            if message not in errors:
+                errors.append(message)
+
+        for on_index, pairs in parse_join_conditions(tokens):
+            for left_q, left_col, right_q, right_col in pairs:
+                left_tables, right_tables = resolve(left_q, on_index), resolve(right_q, on_index)
+                if len(left_tables) != 1 or len(right_tables) != 1:
+                    continue
+                left_table, right_table = next(iter(left_tables)), next(iter(right_tables))
+                if left_table == right_table:
+                    continue
+                declared = relationships.get(frozenset((left_table, right_table)))
+                if not declared:
+                    continue
+                declared_pairs = set()
+                for rel in declared:
+                    for local, related in rel['join_keys']:
+                        declared_pairs.add(frozenset(((rel['table_name'].lower(), local.lower()),
+                                                      (rel['related_table_name'].lower(), related.lower()))))
+                used = frozenset(((left_table, left_col.lower()), (right_table, right_col.lower())))
+                if used not in declared_pairs:
+                    keys = "; ".join(
+                        " AND ".join(f"{rel['table_name']}.{l} = {rel['related_table_name']}.{r}" for l, r in rel['join_keys'])
+                        for rel in declared
+                    )
+                    warnings.append(
+                        f"Join condition `{left_q}.{left_col} = {right_q}.{right_col}` does not match the declared "
+                        f"join keys between `{left_table}` and `{right_table}`: {keys}."
+                    )
+
+        with self._lock:
+            self._validations += 1
+            self._validation_seconds += time.perf_counter() - start_time
+            if errors:
+                self._rejections += 1
+        return {"errors": errors, "warnings": warnings}
+
+    def record_bigquery_failure(self, error_message: str, duration_seconds: float) -> None:
+        """
+        Records a query that passed local validation but failed in BigQuery.
+
+        The failure latency feeds the time-saved estimate, and schema-related failures
+        count as validator misses for the hit-rate metric.
+        """
+        with self._lock:
+            self._bq_failure_count += 1
+            self._bq_failure_seconds += duration_seconds
+            if _SCHEMA_ERROR_PATTERNS.search(error_message or ""):
+                self._schema_errors_missed += 1
+
+    def stats(self) -> dict:
+        """
+        Returns validator counters.
+
+        'hit_rate' is the share of schema mistakes caught locally (rejections divided by
+        rejections plus schema errors that still reached BigQuery). 'estimated_seconds_saved'
+        multiplies the rejections by the average latency of a failing BigQuery query; the
+        extra LLM turn that each failure would have cost comes on top of that.
+        """
+        with self._lock:
+            caught_and_missed = self._rejections + self._schema_errors_missed
+            avg_failure = self._bq_failure_seconds / self._bq_failure_count if self._bq_failure_count else 0.0
+            return {
+                "validations": self._validations,
+                "rejections": self._rejections,
+                "schema_errors_missed": self._schema_errors_missed,
+                "hit_rate": round(self._rejections / caught_and_missed, 3) if caught_and_missed else None,
+                "avg_validation_ms": round(self._validation_seconds / self._validations * 1000, 3) if self._validations else 0.0,
+                "avg_bigquery_failure_seconds": round(avg_failure, 3),
+                "estimated_seconds_saved": round(self._rejections * avg_failure, 2),
+            }
+
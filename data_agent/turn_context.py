@@ -0,0 +1,85 @@
+import contextvars
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The chat turn being processed in the current task. Set by the backend around
+# `runner.run_async()` and read by the model wrapper and the tools, which run in
+# the same context.
+CURRENT_TURN: contextvars.ContextVar["TurnContext | None"] = contextvars.ContextVar("current_turn", default=None)
+
+
+class TurnContext:
+    """Per-turn state shared between the backend, the model wrapper and the tools."""
+
+    def __init__(self, user_id: str, session_id: str, dataset_id: str):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.dataset_id = dataset_id
+        self.start_time = time.time()
+        # Set when a budget is nearly spent: the turn runs with a lower bytes-billed cap.
+        self.degraded = False
+        self.max_bytes_billed: int | None = None
+        self.budget_notice = ""
+        # Usage metered during this turn.
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.bytes_billed = 0
+        # The model tier chosen for the turn, its fallbacks and per-model latency (see routing.py).
+        self.routing: dict = {}
+        # Queries already returned to the agent for scanning partitioned tables without a filter (see partition_pruning.py).
+        self.pruning_warnings: set[str] = set()
+        # Query results returned to the client next to the chat messages (see result_channel.py).
+        self.results: list = []
+        # Set when the turn is cancelled (e.g. an async chat job); see `cancel()`.
+        self.cancel_event = threading.Event()
+        self.cancel_reason = ""
+        self._bigquery_jobs = []
+        self._jobs_lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def register_bigquery_job(self, job) -> None:
+        """Tracks a BigQuery job started by this turn, so `cancel()` can stop it."""
+        with self._jobs_lock:
+            self._bigquery_jobs.append(job)
+            cancelled = self.cancelled
+        if cancelled:
+            self._cancel_job(job)
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Marks the turn as cancelled and cancels the BigQuery jobs it started that are still running."""
+        with self._jobs_lock:
+            if self.cancelled:
+                return
+            self.cancel_reason = reason
+            self.cancel_event.set()
+            jobs = list(self._bigquery_jobs)
+        for job in jobs:
+            self._cancel_job(job)
+
+    @staticmethod
+    def _cancel_job(job) -> None:
+        try:
+            if not job.done():
+                job.cancel()
+                logger.info(f"Cancelled BigQuery job {job.job_id}.")
+        except Exception:
+            logger.warning(f"Could not cancel BigQuery job {getattr(job, 'job_id', None)}.", exc_info=True)
+
+    def usage(self) -> dict:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "bytes_billed": self.bytes_billed,
+            "degraded": self.degraded,
+        }
+
+
+def current_turn() -> TurnContext | None:
+    """Returns the turn being processed, or None outside of a chat turn (e.g. the ADK CLI)."""
+    return CURRENT_TURN.get()
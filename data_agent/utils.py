@@ -1,61 +1,86 @@
 import collections
-from google.cloud import bigquery, dataplex_v1
+import contextlib
+import hashlib
+import os
+import threading
+from google.cloud import bigquery
 from google.cloud.bigquery.table import TableReference
-from .constants import PROJECT_ID, DATASET_NAME, TABLE_NAMES, DATA_PROFILES_TABLE_FULL_ID, LOCATION
+import pyarrow as pa
+from .arrow_utils import to_json_ready, filter_sparse_profiles, table_to_records, read_arrow_cache, write_arrow_cache
+from .constants import DATASET_PROFILES, DEFAULT_DATASET_ID, PROMPT_CACHE_DIR, PROFILE_MAX_PERCENT_NULL
 import time
 import logging
 from proto.marshal.collections.repeated import RepeatedComposite
 from proto.marshal.collections.maps import MapComposite
-from decimal import Decimal
+try:
+    import fcntl  # Used for locks shared by the gunicorn workers of one instance.
+except ImportError:  # Not available on Windows; shared_file_lock() then degrades to a no-op.
+    fcntl = None
 import pprint
-from google.protobuf.json_format import MessageToDict
 
 # Get a logger instance for this module, inheriting from the central app config.
 logger = logging.getLogger(__name__)
 
-def _convert_decimals(obj):
-    """
-    Recursively traverses a data structure to convert Decimal objects to floats.
-    This is a helper function to prevent JSON serialization errors.
+def _resolve_dataset(dataset: dict | None) -> dict:
+    """Returns the given dataset profile, or the default one from DATASET_PROFILES."""
+    return dataset or DATASET_PROFILES[DEFAULT_DATASET_ID]
 
-    Args:
-        obj: The Python object (e.g., list, dict) to traverse.
+def _profiles_cache_prefix(dataset: dict) -> str:
+    dataset_key = hashlib.sha256(f"{dataset['project_id']}.{dataset['dataset_name']}".encode()).hexdigest()[:12]
+    return f"profiles-{dataset_key}-"
 
-    Returns:
-        The object with all Decimal instances converted to floats.
-    """
-    if isinstance(obj, list):
-        return [_convert_decimals(i) for i in obj]
-    if isinstance(obj, dict):
-        return {k: _convert_decimals(v) for k, v in obj.items()}
-    if isinstance(obj, Decimal):
-        return float(obj)
-    return obj
+def _profiles_cache_path(dataset: dict, cache_key: str) -> str:
+    key = hashlib.sha256(cache_key.encode()).hexdigest()[:24]
+    return os.path.join(PROMPT_CACHE_DIR, f"{_profiles_cache_prefix(dataset)}{key}.arrow")
 
-def fetch_bigquery_data_profiles() -> list[dict]:
+def _remove_stale_profile_caches(dataset: dict, keep_path: str) -> None:
+    """Deletes the Arrow caches of older versions of a dataset's profiles."""
+    prefix = _profiles_cache_prefix(dataset)
+    for name in os.listdir(PROMPT_CACHE_DIR):
+        path = os.path.join(PROMPT_CACHE_DIR, name)
+        if name.startswith(prefix) and name.endswith(".arrow") and path != keep_path:
+            try:
+                os.remove(path)  # Workers that still map the file keep their view until they drop it.
+            except OSError:
+                pass
+
+def fetch_bigquery_data_profiles_arrow(dataset: dict | None = None, cache_key: str | None = None) -> pa.Table | None:
     """
-    Fetches column data profiles from a specified BigQuery table.
+    Fetches column data profiles from a specified BigQuery table as an Arrow table.
 
-    This function queries a pre-populated data profiles table to get statistics
-    (like null percentage, min/max values, top values) for columns in the target
-    dataset. It filters out columns that are more than 90% null to reduce noise.
-    The data is cleaned to handle Decimal-to-float conversions.
+    The rows arrive in columnar form (`to_arrow()`), decimals and timestamps are cast
+    in one vectorized pass (see arrow_utils.to_json_ready) and columns that are more
+    than PROFILE_MAX_PERCENT_NULL percent null are filtered out with a vectorized mask.
+
+    Args:
+        dataset: The dataset profile (see DATASET_PROFILES). Defaults to the default dataset.
+        cache_key: Optional version of the profiles table (e.g. its fingerprint). If given,
+            the result is cached as a memory-mappable Arrow file in PROMPT_CACHE_DIR and
+            later calls with the same key read it from there instead of querying BigQuery.
 
     Returns:
-        A list of dictionaries, where each dictionary is the data profile for a column.
-        Returns an empty list if an error occurs or no profiles are found.
+        An Arrow table with one row per column profile, or None if profiles are not
+        configured or an error occurs.
     """
     start_time = time.time()
-    dataset_name_to_filter = DATASET_NAME
-    target_table_names = TABLE_NAMES
-    profiles_table_id = DATA_PROFILES_TABLE_FULL_ID
+    dataset = _resolve_dataset(dataset)
+    dataset_name_to_filter = dataset["dataset_name"]
+    target_table_names = dataset.get("table_names")
+    profiles_table_id = dataset.get("data_profiles_table_full_id")
 
     if not profiles_table_id:
         logger.info("DATA_PROFILES_TABLE_FULL_ID is not configured. Skipping data profile fetching.")
-        return []
+        return None
+
+    cache_path = _profiles_cache_path(dataset, cache_key) if cache_key else None
+    if cache_path:
+        cached = read_arrow_cache(cache_path)
+        if cached is not None:
+            logger.info(f"--- Loaded {cached.num_rows} column profiles from {cache_path} (Duration: {time.time() - start_time:.2f} seconds) ---")
+            return cached
 
     logger.info(f"Starting to fetch data profiles from '{profiles_table_id}'.")
-    client = bigquery.Client(project=PROJECT_ID)
+    client = bigquery.Client(project=dataset["project_id"])
 
     select_clause = """
         SELECT
@@ -77,56 +102,78 @@ def fetch_bigquery_data_profiles() -> list[dict]:
 
     try:
         query_job = client.query(final_query, job_config=job_config)
-        raw_profiles_data = [dict(row.items()) for row in query_job.result()]
-        cleaned_profiles_data = _convert_decimals(raw_profiles_data)
-        
-        profiles_data = [
-            p for p in cleaned_profiles_data 
-            if not (isinstance(p.get('percent_null'), (float, int)) and p.get('percent_null') > 90)
-        ]
+        profiles = to_json_ready(query_job.result().to_arrow())
+        profiles = filter_sparse_profiles(profiles, PROFILE_MAX_PERCENT_NULL)
+        if cache_path:
+            try:
+                write_arrow_cache(profiles, cache_path)
+                _remove_stale_profile_caches(dataset, cache_path)
+            except OSError:
+                logger.warning(f"Could not write the data profiles cache {cache_path}", exc_info=True)
 
         duration = time.time() - start_time
-        logger.info(f"--- Successfully fetched {len(profiles_data)} column profiles (Duration: {duration:.2f} seconds) ---")
-        return profiles_data
+        logger.info(f"--- Successfully fetched {profiles.num_rows} column profiles (Duration: {duration:.2f} seconds) ---")
+        return profiles
     except Exception:
         logger.error("--- Failed to fetch data profiles ---", exc_info=True)
-        return []
+        return None
+
+def fetch_bigquery_data_profiles(dataset: dict | None = None, cache_key: str | None = None) -> list[dict]:
+    """
+    Fetches column data profiles from a specified BigQuery table.
+
+    This function queries a pre-populated data profiles table to get statistics
+    (like null percentage, min/max values, top values) for columns in the target
+    dataset. It filters out columns that are more than 90% null to reduce noise.
+    See `fetch_bigquery_data_profiles_arrow()` for the columnar pipeline and caching.
 
-def fetch_sample_data_for_tables(num_rows: int = 3) -> list[dict]:
+    Args:
+        dataset: The dataset profile (see DATASET_PROFILES). Defaults to the default dataset.
+        cache_key: Optional version of the profiles table used to cache the result on disk.
+
+    Returns:
+        A list of dictionaries, where each dictionary is the data profile for a column.
+        Returns an empty list if an error occurs or no profiles are found.
+    """
+    profiles = fetch_bigquery_data_profiles_arrow(dataset, cache_key)
+    return table_to_records(profiles) if profiles is not None else []
+
+def fetch_sample_data_for_tables(num_rows: int = 3, dataset: dict | None = None) -> list[dict]:
     """
     Fetches a small sample of rows from the target BigQuery tables.
 
-    If TABLE_NAMES is specified in constants, it fetches samples only for those tables.
+    If the dataset profile lists table names, it fetches samples only for those tables.
     Otherwise, it lists all tables in the dataset and fetches samples for each.
-    The data is cleaned to handle Decimal-to-float conversions.
+    Rows arrive as Arrow tables and are cast to JSON-ready types in one vectorized pass.
 
     Args:
         num_rows: The number of sample rows to fetch for each table.
+        dataset: The dataset profile (see DATASET_PROFILES). Defaults to the default dataset.
 
     Returns:
         A list of dictionaries, each containing a 'table_name' and a list of 'sample_rows'.
     """
     start_time = time.time()
     sample_data_results: list[dict] = []
-    client = bigquery.Client(project=PROJECT_ID)
+    dataset = _resolve_dataset(dataset)
+    project_id, dataset_name = dataset["project_id"], dataset["dataset_name"]
+    client = bigquery.Client(project=project_id)
 
-    tables_to_fetch = TABLE_NAMES
+    tables_to_fetch = dataset.get("table_names")
     if not tables_to_fetch:
-        logger.info(f"No specific tables listed; fetching samples for all tables in dataset '{DATASET_NAME}'.")
+        logger.info(f"No specific tables listed; fetching samples for all tables in dataset '{dataset_name}'.")
         try:
-            tables_to_fetch = [t.table_id for t in client.list_tables(DATASET_NAME) if t.table_type == 'TABLE']
+            tables_to_fetch = [t.table_id for t in client.list_tables(f"{project_id}.{dataset_name}") if t.table_type == 'TABLE']
         except Exception:
-            logger.error(f"Could not list tables for dataset '{DATASET_NAME}'", exc_info=True)
+            logger.error(f"Could not list tables for dataset '{dataset_name}'", exc_info=True)
             tables_to_fetch = []
 
     for table_id in tables_to_fetch:
-        full_table_name = f"{PROJECT_ID}.{DATASET_NAME}.{table_id}"
+        full_table_name = f"{project_id}.{dataset_name}.{table_id}"
         try:
-            rows_iterator = client.list_rows(full_table_name, max_results=num_rows)
-            raw_rows = [dict(row.items()) for row in rows_iterator]
-            cleaned_rows = _convert_decimals(raw_rows)
-            if cleaned_rows:
-                sample_data_results.append({"table_name": full_table_name, "sample_rows": cleaned_rows})
+            rows = to_json_ready(client.list_rows(full_table_name, max_results=num_rows).to_arrow())
+            if rows.num_rows:
+                sample_data_results.append({"table_name": full_table_name, "sample_rows": table_to_records(rows)})
         except Exception:
             logger.error(f"Error fetching sample data for table {full_table_name}", exc_info=True)
             continue
@@ -151,29 +198,36 @@ def convert_proto_to_dict(obj):
         return [convert_proto_to_dict(elem) for elem in obj]
     return obj
 
-def fetch_table_entry_metadata() -> list[dict]:
+def fetch_table_entry_metadata(dataset: dict | None = None) -> list[dict]:
     """
     Fetches complete metadata entries for tables using a hybrid approach.
     It discovers tables using the Dataplex Catalog and enriches them with
     real-time descriptions directly from the BigQuery API to ensure accuracy.
 
+    Args:
+        dataset: The dataset profile (see DATASET_PROFILES). Defaults to the default dataset.
+
     Returns:
         A list of dictionaries, where each dictionary contains the metadata for one table.
     """
     start_time = time.time()
-    logger.info(f"Fetching Dataplex entry metadata for tables='{TABLE_NAMES if TABLE_NAMES else 'All'}'")
+    dataset = _resolve_dataset(dataset)
+    project_id, dataset_name, location = dataset["project_id"], dataset["dataset_name"], dataset["location"]
+    table_names = dataset.get("table_names")
+    logger.info(f"Fetching Dataplex entry metadata for dataset='{dataset_name}', tables='{table_names if table_names else 'All'}'")
     all_entry_metadata: list[dict] = []
+    from google.cloud import dataplex_v1  # Deferred: only the metadata fetches use the Dataplex client.
     dataplex_client = dataplex_v1.CatalogServiceClient()
-    bq_client = bigquery.Client(project=PROJECT_ID) # Initialize BigQuery client
+    bq_client = bigquery.Client(project=project_id) # Initialize BigQuery client
 
     target_entry_names: list[str] = []
-    if TABLE_NAMES:
-        for table_name in TABLE_NAMES:
-            entry_name = f"projects/{PROJECT_ID}/locations/{LOCATION}/entryGroups/@bigquery/entries/bigquery.googleapis.com%2Fprojects%2F{PROJECT_ID}%2Fdatasets%2F{DATASET_NAME}%2Ftables%2F{table_name}"
+    if table_names:
+        for table_name in table_names:
+            entry_name = f"projects/{project_id}/locations/{location}/entryGroups/@bigquery/entries/bigquery.googleapis.com%2Fprojects%2F{project_id}%2Fdatasets%2F{dataset_name}%2Ftables%2F{table_name}"
             target_entry_names.append(entry_name)
     else:
         try:
-            search_request = dataplex_v1.SearchEntriesRequest(name=f"projects/{PROJECT_ID}/locations/global", query=f"name:projects/{PROJECT_ID}/datasets/{DATASET_NAME}/tables/")
+            search_request = dataplex_v1.SearchEntriesRequest(name=f"projects/{project_id}/locations/global", query=f"name:projects/{project_id}/datasets/{dataset_name}/tables/")
             target_entry_names = [entry.dataplex_entry.name for entry in dataplex_client.search_entries(request=search_request)]
         except Exception:
             logger.error(f"Error listing Dataplex entries", exc_info=True)
@@ -188,12 +242,14 @@ def fetch_table_entry_metadata() -> list[dict]:
             # --- FINAL FIX: Correctly parse the table name from the full resource string ---
             short_table_name = entry_name.split('/')[-1]
 
-            # --- HYBRID FIX: Get description directly from BigQuery ---
+            # --- HYBRID FIX: Get description (and partitioning/clustering) directly from BigQuery ---
             table_description = ''
+            storage = {}
             try:
-                full_bq_table_id = f"{PROJECT_ID}.{DATASET_NAME}.{short_table_name}"
+                full_bq_table_id = f"{project_id}.{dataset_name}.{short_table_name}"
                 bq_table = bq_client.get_table(full_bq_table_id)
                 table_description = bq_table.description or ''
+                storage = table_storage_info(bq_table)
                 logger.info(f"Successfully fetched description for '{short_table_name}' from BigQuery.")
             except Exception:
                 logger.warning(f"Could not fetch description for '{short_table_name}' from BigQuery.", exc_info=True)
@@ -204,6 +260,7 @@ def fetch_table_entry_metadata() -> list[dict]:
             all_entry_metadata.append({
                 'table_name': short_table_name,
                 'description': table_description, # Use the description from BigQuery
+                'storage': storage,
                 'aspects': aspects_data
             })
             
@@ -215,6 +272,35 @@ def fetch_table_entry_metadata() -> list[dict]:
     logger.info(f"--- Successfully fetched {len(all_entry_metadata)} entry metadata sets (Duration: {duration:.2f} seconds) ---")
     return all_entry_metadata
 
+def table_storage_info(bq_table) -> dict:
+    """
+    Summarizes how a BigQuery table is partitioned and clustered.
+
+    Args:
+        bq_table: A `google.cloud.bigquery.Table` (from `Client.get_table()`).
+
+    Returns:
+        A dictionary with 'partitioning' (None for unpartitioned tables, otherwise a dict
+        with 'type' ('DAY', 'HOUR', 'MONTH', 'YEAR' or 'RANGE'), 'column', 'column_type'
+        and 'require_filter') and 'clustering_fields' (a possibly empty list).
+        Ingestion-time partitioned tables report the pseudo-column `_PARTITIONTIME`.
+    """
+    column_types = {field.name.lower(): field.field_type for field in bq_table.schema or []}
+    partitioning = None
+    if bq_table.time_partitioning is not None:
+        column = bq_table.time_partitioning.field or "_PARTITIONTIME"
+        partitioning = {
+            "type": bq_table.time_partitioning.type_,
+            "column": column,
+            "column_type": column_types.get(column.lower(), "TIMESTAMP"),
+        }
+    elif bq_table.range_partitioning is not None:
+        column = bq_table.range_partitioning.field
+        partitioning = {"type": "RANGE", "column": column, "column_type": column_types.get(column.lower(), "INTEGER")}
+    if partitioning is not None:
+        partitioning["require_filter"] = bool(bq_table.require_partition_filter)
+    return {"partitioning": partitioning, "clustering_fields": list(bq_table.clustering_fields or [])}
+
 def log_startup_kpis(metadata: list[dict], profiles: list[dict], token_count: int, load_time: float):
     """
     Calculates and logs a summary of KPIs after the initial data fetch.
@@ -230,12 +316,8 @@ def log_startup_kpis(metadata: list[dict], profiles: list[dict], token_count: in
     cols_without_desc_samples = []
 
     for table_meta in metadata:
-        schema_aspect = {}
-        for key, value in table_meta.get('aspects', {}).items():
-            if key.endswith('.schema'):
-                schema_aspect = value
-                break
-        
+        schema_aspect = find_schema_aspect(table_meta)
+
         # This check will now work correctly with the description from BigQuery
         if table_meta.get('description'):
             tables_with_desc += 1
@@ -260,7 +342,7 @@ def log_startup_kpis(metadata: list[dict], profiles: list[dict], token_count: in
     ======================================================================
     [Performance]
       - Total Application Load Time: {load_time:.2f} seconds
-      - Initial Prompt Token Count: {token_count:,} tokens
+      - Initial Prompt Token Count: ~{token_count:,} tokens (estimated)
 
     [Table Metadata]
       - Tables Found: {num_tables}
@@ -276,3 +358,217 @@ def log_startup_kpis(metadata: list[dict], profiles: list[dict], token_count: in
     """
     logger.info(log_summary)
 
+
+# Registry of background threads keyed by (task name, process id). Gunicorn is
+# started with --preload, so threads created in the master process do not
+# survive the fork into the workers; keying on the pid lets each worker start
+# its own copy on first use.
+_PERIODIC_TASKS: dict[tuple[str, int], tuple[threading.Thread, threading.Event | None]] = {}
+_PERIODIC_TASKS_LOCK = threading.Lock()
+
+def start_periodic_task(name: str, interval_seconds: float, func, run_immediately: bool = False,
+                        stop_event: threading.Event | None = None) -> bool:
+    """
+    Starts a daemon thread that calls `func` every `interval_seconds` in this process.
+
+    Calling this more than once for the same `name` in the same process is a no-op,
+    so it is safe to call from request paths to lazily start the task in each worker.
+
+    Args:
+        name: A unique name for the task, used for de-duplication and logging.
+        interval_seconds: Seconds to sleep between runs. Values <= 0 disable the task.
+        func: A zero-argument callable. Exceptions are logged and do not stop the loop.
+        run_immediately: If True, runs `func` once before the first sleep.
+        stop_event: Optional event that ends the task when set. The thread exits at its
+            next wait (or after the run in progress) and drops its reference to `func`;
+            a task under the same name can be started again right away.
+
+    Returns:
+        True if a new thread was started, False otherwise.
+    """
+    if not interval_seconds or interval_seconds <= 0:
+        return False
+    if stop_event is not None and stop_event.is_set():
+        return False
+    key = (name, os.getpid())
+    with _PERIODIC_TASKS_LOCK:
+        existing, existing_stop = _PERIODIC_TASKS.get(key, (None, None))
+        if existing and existing.is_alive() and not (existing_stop is not None and existing_stop.is_set()):
+            return False
+
+        stopped = stop_event or threading.Event()
+
+        def _loop():
+            if not run_immediately and stopped.wait(interval_seconds):
+                return
+            while not stopped.is_set():
+                try:
+                    func()
+                except Exception:
+                    logger.error(f"Periodic task '{name}' failed", exc_info=True)
+                if stopped.wait(interval_seconds):
+                    break
+            logger.info(f"Stopped periodic task '{name}' in process {os.getpid()}.")
+
+        thread = threading.Thread(target=_loop, name=f"periodic-{name}", daemon=True)
+        _PERIODIC_TASKS[key] = (thread, stop_event)
+        thread.start()
+    logger.info(f"Started periodic task '{name}' (every {interval_seconds}s) in process {os.getpid()}.")
+    return True
+
+def find_schema_aspect(table_meta: dict) -> dict:
+    """Returns the schema aspect (the one whose key ends with '.schema') of a table metadata entry."""
+    for key, value in table_meta.get('aspects', {}).items():
+        if key.endswith('.schema'):
+            return value or {}
+    return {}
+
+@contextlib.contextmanager
+def shared_file_lock(lock_dir: str, name: str):
+    """
+    An exclusive lock across the worker processes of this instance, backed by flock().
+
+    Args:
+        lock_dir: The directory holding the lock files (created if missing).
+        name: The lock name; one lock file per name.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f"{name}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def extract_join_relationships(table_metadata: list[dict]) -> list[dict]:
+    """
+    Collects the join relationships declared with the join relationship aspect type
+    (see nl2sql_join_relationship_aspect_type_v4.yaml) across all tables.
+
+    The aspect data is walked recursively so that both a single relationship record and
+    a list of relationship records per table are supported.
+
+    Args:
+        table_metadata: The list returned by `fetch_table_entry_metadata()`.
+
+    Returns:
+        A list of dictionaries with 'table_name', 'related_table_id', 'related_table_name',
+        'join_keys' (a list of (local_column, related_column) tuples), 'join_type',
+        'cardinality' and 'description'.
+    """
+    relationships: list[dict] = []
+
+    def _walk(table_name, node):
+        if isinstance(node, dict):
+            if 'related-table-id' in node:
+                related_table_id = node.get('related-table-id') or ''
+                join_keys = [
+                    (pair.get('local-column'), pair.get('related-column'))
+                    for pair in (node.get('join-keys') or [])
+                    if isinstance(pair, dict) and pair.get('local-column') and pair.get('related-column')
+                ]
+                relationships.append({
+                    'table_name': table_name,
+                    'related_table_id': related_table_id,
+                    'related_table_name': related_table_id.split('.')[-1],
+                    'join_keys': join_keys,
+                    'join_type': (node.get('join-type') or 'INNER').upper(),
+                    'cardinality': node.get('cardinality'),
+                    'description': node.get('relationship-description'),
+                })
+                return
+            for value in node.values():
+                _walk(table_name, value)
+        elif isinstance(node, list):
+            for value in node:
+                _walk(table_name, value)
+
+    for table_meta in table_metadata or []:
+        for key, aspect in table_meta.get('aspects', {}).items():
+            if key.endswith('.schema'):
+                continue
+            _walk(table_meta.get('table_name'), aspect)
+    return relationships
+
+def without_join_relationships(table_metadata: list[dict]) -> list[dict]:
+    """
+    Returns copies of the table metadata entries without their join relationship aspects
+    (the aspects holding 'related-table-id' records). The join graph serves those through
+    the `find_join_path` tool, so they are left out of the prompt.
+    """
+    def _has_relationship(node) -> bool:
+        if isinstance(node, dict):
+            return 'related-table-id' in node or any(_has_relationship(v) for v in node.values())
+        if isinstance(node, list):
+            return any(_has_relationship(v) for v in node)
+        return False
+
+    stripped = []
+    for table_meta in table_metadata or []:
+        aspects = {key: aspect for key, aspect in table_meta.get('aspects', {}).items()
+                   if key.endswith('.schema') or not _has_relationship(aspect)}
+        stripped.append({**table_meta, 'aspects': aspects})
+    return stripped
+
+def fetch_metadata_fingerprints(dataset: dict | None = None) -> dict:
+    """
+    Cheaply fingerprints the sources the agent instructions are built from, without
+    fetching them.
+
+    - 'metadata': the Dataplex entries of the dataset's tables and their update times
+      (a single catalog search; aspect, schema and description changes bump an entry's
+      update time).
+    - 'profiles': the last-modified time and row count of the data profiles table
+      (a single BigQuery metadata call).
+
+    Args:
+        dataset: The dataset profile (see DATASET_PROFILES). Defaults to the default dataset.
+
+    Returns:
+        A dictionary with 'metadata' and 'profiles' fingerprint strings. A value is None
+        when its source could not be checked, in which case callers should assume no change.
+    """
+    dataset = _resolve_dataset(dataset)
+    project_id, dataset_name = dataset["project_id"], dataset["dataset_name"]
+    fingerprints = {"metadata": None, "profiles": None}
+
+    try:
+        from google.cloud import dataplex_v1
+        dataplex_client = dataplex_v1.CatalogServiceClient()
+        search_request = dataplex_v1.SearchEntriesRequest(name=f"projects/{project_id}/locations/global", query=f"name:projects/{project_id}/datasets/{dataset_name}/tables/")
+        table_names = set(dataset.get("table_names") or [])
+        entries = []
+        for result in dataplex_client.search_entries(request=search_request):
+            entry = result.dataplex_entry
+            short_table_name = entry.name.split('/')[-1]
+            if table_names and short_table_name not in table_names:
+                continue
+            entries.append(f"{entry.name}@{entry.update_time}")
+        fingerprints["metadata"] = hashlib.sha256("\n".join(sorted(entries)).encode()).hexdigest()[:16]
+    except Exception:
+        logger.warning(f"Could not fingerprint Dataplex metadata for dataset '{dataset_name}'", exc_info=True)
+
+    profiles_table_id = dataset.get("data_profiles_table_full_id")
+    if profiles_table_id:
+        try:
+            profiles_table = bigquery.Client(project=project_id).get_table(profiles_table_id)
+            fingerprints["profiles"] = f"{profiles_table.modified.isoformat() if profiles_table.modified else ''}:{profiles_table.num_rows}"
+        except Exception:
+            logger.warning(f"Could not fingerprint data profiles table '{profiles_table_id}'", exc_info=True)
+    else:
+        fingerprints["profiles"] = "disabled"
+    return fingerprints
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of Gemini tokens in a text locally, without a network call.
+
+    Uses the common ~4 characters per token rule of thumb for English and code, which
+    is accurate to within a few percent for the JSON-heavy prompts this agent sends.
+    """
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
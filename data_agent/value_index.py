@@ -0,0 +1,413 @@
+import bisect
+import difflib
+import json
+import logging
+import os
+import threading
+import time
+from google.cloud import bigquery
+from .constants import (
+    DATASET_PROFILES,
+    DEFAULT_DATASET_ID,
+    VALUE_INDEX_MAX_PERCENT_UNIQUE,
+    VALUE_INDEX_MAX_VALUES_PER_COLUMN,
+    VALUE_INDEX_HARVEST_INTERVAL_SECONDS,
+    VALUE_INDEX_HARVEST_MAX_BYTES_BILLED,
+    VALUE_INDEX_HARVEST_PARTITION_DAYS,
+    VALUE_INDEX_SNAPSHOT_DIR,
+)
+from .utils import find_schema_aspect, shared_file_lock, start_periodic_task
+
+logger = logging.getLogger(__name__)
+
+# Schema types whose values CAST(... AS STRING) renders as filter values. STRUCT/RECORD, ARRAY,
+# JSON, GEOGRAPHY and BYTES columns are never harvested: the cast is invalid or can fail per row.
+_HARVESTABLE_TYPES = {
+    "STRING", "INT64", "INTEGER", "NUMERIC", "BIGNUMERIC", "DECIMAL", "BIGDECIMAL", "FLOAT", "FLOAT64",
+    "BOOL", "BOOLEAN", "DATE", "DATETIME", "TIME", "TIMESTAMP",
+}
+
+def _normalize(value) -> str:
+    """Normalizes a filter value for case- and whitespace-insensitive matching."""
+    return " ".join(str(value).split()).casefold()
+
+def _short_table_name(table_id: str) -> str:
+    """Returns the table name from a `project.dataset.table` id (or the input if already short)."""
+    return (table_id or "").split(".")[-1]
+
+def _harvestable_columns(table_metadata: list[dict] | None) -> dict[str, set[str] | None]:
+    """
+    Maps each lower-cased table name to the lower-cased names of its top-level scalar,
+    non-repeated columns, from the schema aspects. Tables without a schema aspect map to None.
+    """
+    harvestable: dict[str, set[str] | None] = {}
+    for table_meta in table_metadata or []:
+        table_name = (table_meta.get('table_name') or '').lower()
+        if not table_name:
+            continue
+        fields = find_schema_aspect(table_meta).get('fields')
+        if not fields:
+            harvestable[table_name] = None
+            continue
+        harvestable[table_name] = {
+            f['name'].lower() for f in fields
+            if f.get('name') and (f.get('mode') or '').upper() != 'REPEATED' and not f.get('fields')
+            and (f.get('dataType') or f.get('type') or 'STRING').upper() in _HARVESTABLE_TYPES
+        }
+    return harvestable
+
+def _recent_partitions_filter(bq_table, days: int = VALUE_INDEX_HARVEST_PARTITION_DAYS) -> str | None:
+    """
+    Returns a WHERE condition on the partition column of `bq_table` that keeps the last `days`
+    days, or None for tables partitioned by something other than time (integer ranges).
+    """
+    partitioning = bq_table.time_partitioning
+    if partitioning is None:
+        return None
+    column = partitioning.field or "_PARTITIONTIME"
+    column_type = next((f.field_type for f in bq_table.schema or [] if f.name.lower() == column.lower()), "TIMESTAMP").upper()
+    if column_type == "DATE":
+        return f"`{column}` >= DATE_SUB(CURRENT_DATE(), INTERVAL {days} DAY)"
+    if column_type == "DATETIME":
+        return f"`{column}` >= DATETIME_SUB(CURRENT_DATETIME(), INTERVAL {days} DAY)"
+    return f"`{column}` >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY)"
+
+def _harvest_query(full_table_name: str, column_names: list[str], where: str | None = None) -> str:
+    """Builds the query that unpivots `column_names` and keeps the most frequent values of each."""
+    where_clause = f" WHERE {where}" if where else ""
+    unpivot = "\n      UNION ALL ".join(
+        f"SELECT '{col}' AS column_name, CAST(`{col}` AS STRING) AS value FROM `{full_table_name}`{where_clause}"
+        for col in column_names
+    )
+    return f"""
+        SELECT column_name, value, COUNT(*) AS cnt
+        FROM ({unpivot})
+        WHERE value IS NOT NULL
+        GROUP BY column_name, value
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY column_name ORDER BY cnt DESC) <= @max_values
+    """
+
+
+class _ColumnValues:
+    """The distinct values known for a single column, kept sorted for prefix lookups."""
+
+    __slots__ = ("table_name", "column_name", "counts", "originals", "sorted_keys", "source")
+
+    def __init__(self, table_name: str, column_name: str, source: str):
+        self.table_name = table_name
+        self.column_name = column_name
+        self.counts: dict[str, int] = {}       # normalized value -> row count (0 if unknown)
+        self.originals: dict[str, str] = {}    # normalized value -> value as stored in BigQuery
+        self.sorted_keys: list[str] = []
+        self.source = source
+
+    def add(self, value, count) -> None:
+        if value is None:
+            return
+        key = _normalize(value)
+        if not key:
+            return
+        self.originals.setdefault(key, str(value))
+        self.counts[key] = max(self.counts.get(key, 0), int(count or 0))
+
+    def seal(self) -> None:
+        """Trims the column to the configured size and rebuilds the sorted key list."""
+        if len(self.counts) > VALUE_INDEX_MAX_VALUES_PER_COLUMN:
+            keep = sorted(self.counts, key=self.counts.get, reverse=True)[:VALUE_INDEX_MAX_VALUES_PER_COLUMN]
+            self.counts = {k: self.counts[k] for k in keep}
+            self.originals = {k: self.originals[k] for k in keep}
+        self.sorted_keys = sorted(self.counts)
+
+
+class ValueIndex:
+    """
+    An in-memory index of distinct values for low- and medium-cardinality columns.
+
+    The index is seeded from the data profiles fetched at startup (`top_n` values)
+    and is periodically topped up by a distinct-value harvest from BigQuery. It lets
+    the agent check user-provided filter values with exact, prefix and fuzzy matching
+    without spending an LLM turn or an exploratory `SELECT DISTINCT` job.
+    """
+
+    def __init__(self, dataset_id: str = DEFAULT_DATASET_ID, dataset: dict | None = None):
+        self.dataset_id = dataset_id
+        self.dataset = dataset or DATASET_PROFILES[dataset_id]
+        self._lock = threading.Lock()
+        # (table_name, column_name) lower-cased -> _ColumnValues. Replaced wholesale on
+        # every load so that readers never observe a partially built index.
+        self._columns: dict[tuple[str, str], _ColumnValues] = {}
+        self._harvest_candidates: dict[str, list[str]] = {}
+        self._last_harvest_time = None
+        self._harvests = 0  # Harvests this process ran against BigQuery.
+        self._snapshot_loads = 0  # Harvests this process loaded from another worker's snapshot.
+        self._lookup_count = 0
+        self._lookup_seconds = 0.0
+        # Set when the index is dropped (e.g. its dataset is evicted from the registry) to stop its harvester.
+        self._stopped = threading.Event()
+
+    # --- Building ---
+
+    def load_profiles(self, data_profiles: list[dict], table_metadata: list[dict] | None = None) -> None:
+        """
+        (Re)builds the index from data profile rows.
+
+        Columns whose `percent_unique` is at or below VALUE_INDEX_MAX_PERCENT_UNIQUE
+        are indexed from their `top_n` values. Those that are top-level scalar columns
+        according to the schema aspects in `table_metadata` (nested `a.b` profile names
+        never are) are remembered as candidates for the periodic distinct-value harvest.
+        """
+        harvestable = _harvestable_columns(table_metadata)
+        columns: dict[tuple[str, str], _ColumnValues] = {}
+        candidates: dict[str, list[str]] = {}
+        for profile in data_profiles or []:
+            table_name = _short_table_name(profile.get("source_table_id"))
+            column_name = profile.get("column_name")
+            if not table_name or not column_name:
+                continue
+            percent_unique = profile.get("percent_unique")
+            if isinstance(percent_unique, (int, float)) and percent_unique > VALUE_INDEX_MAX_PERCENT_UNIQUE:
+                continue
+            column = _ColumnValues(table_name, column_name, source="profile")
+            for item in profile.get("top_n") or []:
+                if isinstance(item, dict):
+                    column.add(item.get("value"), item.get("count"))
+                else:
+                    column.add(item, 0)
+            if not column.counts:
+                continue
+            column.seal()
+            columns[(table_name.lower(), column_name.lower())] = column
+            scalar_columns = harvestable.get(table_name.lower())
+            if "." not in column_name and (scalar_columns is None or column_name.lower() in scalar_columns):
+                candidates.setdefault(table_name, []).append(column_name)
+
+        with self._lock:
+            # Keep any harvested columns; profiles only add to or refresh the index.
+            merged = {k: v for k, v in self._columns.items() if v.source == "harvest"}
+            for key, column in columns.items():
+                merged.setdefault(key, column)
+            self._columns = merged
+            self._harvest_candidates = candidates
+        logger.info(f"[VALUE_INDEX] Loaded {len(columns)} columns from data profiles.")
+
+    def harvest(self) -> None:
+        """
+        Refreshes candidate columns with their full distinct-value lists.
+
+        One worker per instance runs the BigQuery harvest, under a cross-process lock, and
+        writes the result as a JSON snapshot to VALUE_INDEX_SNAPSHOT_DIR. The other workers load
+        that snapshot while it is younger than VALUE_INDEX_HARVEST_INTERVAL_SECONDS instead
+        of repeating the scans.
+        """
+        with self._lock:
+            candidates = dict(self._harvest_candidates)
+        if not candidates:
+            return
+
+        start_time = time.time()
+        with shared_file_lock(VALUE_INDEX_SNAPSHOT_DIR, self.dataset_id):
+            harvested, harvested_at = self._read_snapshot(candidates)
+            source = "snapshot"
+            if harvested is None:
+                harvested, harvested_at = self._harvest_from_bigquery(candidates), time.time()
+                self._write_snapshot(candidates, harvested, harvested_at)
+                source = "BigQuery"
+
+        for column in harvested.values():
+            column.seal()
+        with self._lock:
+            merged = dict(self._columns)
+            merged.update(harvested)
+            self._columns = merged
+            self._last_harvest_time = harvested_at
+            if source == "snapshot":
+                self._snapshot_loads += 1
+            else:
+                self._harvests += 1
+        duration = time.time() - start_time
+        logger.info(f"[VALUE_INDEX] Harvested distinct values for {len(harvested)} columns from {source} (Duration: {duration:.2f} seconds).")
+
+    def _harvest_from_bigquery(self, candidates: dict[str, list[str]]) -> dict[tuple[str, str], _ColumnValues]:
+        """
+        Runs one query per table. Each query unpivots the candidate columns, groups by
+        value and keeps at most VALUE_INDEX_MAX_VALUES_PER_COLUMN values per column.
+        Tables that require a partition filter are read from their recent partitions
+        (VALUE_INDEX_HARVEST_PARTITION_DAYS); range-partitioned ones are skipped.
+        """
+        project_id, dataset_name = self.dataset["project_id"], self.dataset["dataset_name"]
+        client = bigquery.Client(project=project_id)
+        harvested: dict[tuple[str, str], _ColumnValues] = {}
+        for table_name, column_names in candidates.items():
+            if self._stopped.is_set():
+                break  # The index was dropped mid-harvest; skip the remaining scans.
+            full_table_name = f"{project_id}.{dataset_name}.{table_name}"
+            try:
+                bq_table = client.get_table(full_table_name)
+            except Exception:
+                logger.error(f"[VALUE_INDEX] Could not read table {full_table_name}; skipping its harvest", exc_info=True)
+                continue
+            where = None
+            if bq_table.require_partition_filter:
+                where = _recent_partitions_filter(bq_table)
+                if where is None:
+                    logger.info(f"[VALUE_INDEX] Skipping the harvest of {full_table_name}: it requires a filter on its range partitions.")
+                    continue
+            query = _harvest_query(full_table_name, column_names, where)
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ScalarQueryParameter("max_values", "INT64", VALUE_INDEX_MAX_VALUES_PER_COLUMN)],
+                maximum_bytes_billed=VALUE_INDEX_HARVEST_MAX_BYTES_BILLED,
+            )
+            try:
+                for row in client.query(query, job_config=job_config).result():
+                    key = (table_name.lower(), row.column_name.lower())
+                    column = harvested.get(key)
+                    if column is None:
+                        column = harvested[key] = _ColumnValues(table_name, row.column_name, source="harvest")
+                    column.add(row.value, row.cnt)
+            except Exception:
+                logger.error(f"[VALUE_INDEX] Distinct-value harvest failed for table {full_table_name}", exc_info=True)
+        return harvested
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(VALUE_INDEX_SNAPSHOT_DIR, f"{self.dataset_id}.json")
+
+    def _read_snapshot(self, candidates: dict[str, list[str]]) -> tuple[dict | None, float | None]:
+        """Loads the harvest another worker wrote, if it is fresh and covers the same candidate columns."""
+        try:
+            with open(self._snapshot_path(), "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None, None
+        except Exception:
+            logger.warning(f"[VALUE_INDEX] Ignoring unreadable harvest snapshot {self._snapshot_path()}", exc_info=True)
+            return None, None
+        if snapshot.get("candidates") != candidates or time.time() - snapshot.get("harvested_at", 0) >= VALUE_INDEX_HARVEST_INTERVAL_SECONDS:
+            return None, None
+        harvested = {}
+        for entry in snapshot.get("columns", []):
+            column = _ColumnValues(entry["table_name"], entry["column_name"], source="harvest")
+            for value, count in entry["values"]:
+                column.add(value, count)
+            harvested[(entry["table_name"].lower(), entry["column_name"].lower())] = column
+        return harvested, snapshot["harvested_at"]
+
+    def _write_snapshot(self, candidates: dict[str, list[str]], harvested: dict, harvested_at: float) -> None:
+        """Atomically writes a harvest so the other workers of this instance can load it."""
+        snapshot = {
+            "dataset_id": self.dataset_id,
+            "harvested_at": harvested_at,
+            "candidates": candidates,
+            "columns": [
+                {"table_name": c.table_name, "column_name": c.column_name,
+                 "values": [[c.originals[k], c.counts[k]] for k in c.counts]}
+                for c in harvested.values()
+            ],
+        }
+        path = self._snapshot_path()
+        try:
+            os.makedirs(VALUE_INDEX_SNAPSHOT_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.warning(f"[VALUE_INDEX] Could not write harvest snapshot {path}", exc_info=True)
+
+    def ensure_harvester(self) -> None:
+        """Starts the periodic distinct-value harvest of this index in the current worker process, if enabled."""
+        start_periodic_task(f"value-index-harvest:{self.dataset_id}", VALUE_INDEX_HARVEST_INTERVAL_SECONDS, self.harvest,
+                            run_immediately=True, stop_event=self._stopped)
+
+    def stop_harvester(self) -> None:
+        """Stops the periodic harvest of this index, so the index can be freed and a rebuilt index can start its own."""
+        self._stopped.set()
+
+    # --- Lookups ---
+
+    def lookup(self, column_name: str, value: str, table_name: str = "", limit: int = 5) -> list[dict]:
+        """
+        Looks up `value` among the known values of a column.
+
+        Args:
+            column_name: The column to check. Matching is case-insensitive.
+            value: The user-provided filter value.
+            table_name: Optional table name (short or fully qualified) to restrict the search.
+            limit: The maximum number of matches returned per column.
+
+        Returns:
+            A list of match dictionaries ordered best-first, each with 'table_name',
+            'column_name', 'value', 'count' and 'match_type' ('exact', 'prefix' or 'fuzzy').
+        """
+        start_time = time.perf_counter()
+        columns = self._columns  # Snapshot; the dict is replaced, never mutated.
+        wanted_column = (column_name or "").lower()
+        wanted_table = _short_table_name(table_name).lower()
+        needle = _normalize(value)
+
+        matches: list[dict] = []
+        for (table_key, column_key), column in columns.items():
+            if column_key != wanted_column or (wanted_table and table_key != wanted_table):
+                continue
+            matches.extend(self._match_column(column, needle, limit))
+
+        rank = {"exact": 0, "prefix": 1, "fuzzy": 2}
+        matches.sort(key=lambda m: (rank[m["match_type"]], -m.get("score", 0), -m["count"]))
+
+        with self._lock:
+            self._lookup_count += 1
+            self._lookup_seconds += time.perf_counter() - start_time
+        return matches
+
+    @staticmethod
+    def _match_column(column: _ColumnValues, needle: str, limit: int) -> list[dict]:
+        def _result(key, match_type, score=1.0):
+            return {
+                "table_name": column.table_name,
+                "column_name": column.column_name,
+                "value": column.originals[key],
+                "count": column.counts[key],
+                "match_type": match_type,
+                "score": score,
+            }
+
+        if needle in column.counts:
+            return [_result(needle, "exact")]
+
+        results = []
+        keys = column.sorted_keys
+        i = bisect.bisect_left(keys, needle)
+        while i < len(keys) and keys[i].startswith(needle) and len(results) < limit:
+            results.append(_result(keys[i], "prefix"))
+            i += 1
+        if results:
+            return results
+
+        for key in difflib.get_close_matches(needle, keys, n=limit, cutoff=0.6):
+            score = difflib.SequenceMatcher(None, needle, key).ratio()
+            results.append(_result(key, "fuzzy", round(score, 3)))
+        return results
+
+    def known_columns(self, table_name: str = "") -> list[str]:
+        """Returns the `table.column` names currently indexed, optionally for one table."""
+        wanted_table = _short_table_name(table_name).lower()
+        return sorted(
+            f"{c.table_name}.{c.column_name}"
+            for (table_key, _), c in self._columns.items()
+            if not wanted_table or table_key == wanted_table
+        )
+
+    def stats(self) -> dict:
+        """Returns index size and lookup latency counters."""
+        with self._lock:
+            columns = self._columns
+            return {
+                "columns_indexed": len(columns),
+                "values_indexed": sum(len(c.counts) for c in columns.values()),
+                "harvested_columns": sum(1 for c in columns.values() if c.source == "harvest"),
+                "last_harvest_time": self._last_harvest_time,
+                "bigquery_harvests": self._harvests,
+                "snapshot_loads": self._snapshot_loads,
+                "lookups": self._lookup_count,
+                "avg_lookup_microseconds": round(self._lookup_seconds / self._lookup_count * 1e6, 1) if self._lookup_count else 0.0,
+            }
+
@@ -31,6 +31,8 @@ echo "Starting backend server with Gunicorn..."
 
 # Start Gunicorn
 # -w: number of worker processes (adjust based on your server's cores)
+# --worker-class gthread / --threads: each worker serves several requests on threads, so turns
+#   waiting in the admission queue (see backend/admission.py) do not block a whole worker
 # -b: bind address and port
 # app:app: module_name:flask_app_instance_name (referring to backend/app.py and the 'app' instance in it)
 # --chdir: change directory to 'backend' before running, so app:app resolves correctly
@@ -54,7 +56,7 @@ fi
 PORT="${PORT:-8080}"
 
 echo "Attempting to start Gunicorn on port $PORT..."
-exec gunicorn --chdir backend -w 4 -b 0.0.0.0:$PORT --timeout 300 --preload app:app --log-level info --access-logfile - --error-logfile -
+exec gunicorn --chdir backend -w 4 --worker-class gthread --threads "${GUNICORN_THREADS:-8}" -b 0.0.0.0:$PORT --timeout 300 --preload app:app --log-level info --access-logfile - --error-logfile -
 # Using '-' for logfiles sends them to stdout/stderr, which is common for containerized apps.
 # If you prefer files: --access-logfile ./logs/gunicorn_access.log --error-logfile ./logs/gunicorn_error.log
 # (Ensure ./logs directory exists and Gunicorn has write permissions)
@@ -41,6 +41,69 @@ const TypingIndicator = () => {
     );
 };
 
+// Query results arrive next to the messages as columnar JSON: one array per column in `data`,
+// typed by `columns[i].type`. Rows are rendered in pages, so large results stay responsive.
+const RESULT_PAGE_ROWS = 200;
+const NUMERIC_TYPES = new Set(['integer', 'float', 'decimal']);
+
+// Integer columns named like keys, codes or calendar parts (modl_cd, customerId, year, ...) are shown without thousands separators.
+const IDENTIFIER_NAME = /(^|_)(id|sk|cd|code|key|no|num|number|year|yr|qtr|quarter|month|mnth|week|day|pincode|zip)$/i;
+const IDENTIFIER_CAMEL_NAME = /[a-z](Id|ID|Code|Key|No|Year)$/;
+
+const isMeasure = (column) =>
+    column.type === 'float' || column.type === 'decimal' ||
+    (column.type === 'integer' && !IDENTIFIER_NAME.test(column.name) && !IDENTIFIER_CAMEL_NAME.test(column.name));
+
+const formatCell = (value, column) => {
+    if (value === null || value === undefined) return '';
+    if (isMeasure(column)) return Number(value).toLocaleString();
+    if (column.type === 'list' || column.type === 'struct') return JSON.stringify(value);
+    return String(value);
+};
+
+const ResultTable = ({ result }) => {
+    const [visibleRows, setVisibleRows] = useState(RESULT_PAGE_ROWS);
+    const rowCount = Math.min(visibleRows, result.row_count);
+    const rows = [];
+    for (let i = 0; i < rowCount; i++) {
+        rows.push(
+            <tr key={i}>
+                {result.columns.map((column, c) => (
+                    <td key={c} className={NUMERIC_TYPES.has(column.type) ? 'numeric' : undefined}>
+                        {formatCell(result.data[c][i], column)}
+                    </td>
+                ))}
+            </tr>
+        );
+    }
+
+    return (
+        <div className="result-table">
+            <div className="result-table-scroll">
+                <table>
+                    <thead>
+                        <tr>
+                            {result.columns.map((column) => (
+                                <th key={column.name} className={NUMERIC_TYPES.has(column.type) ? 'numeric' : undefined}>{column.name}</th>
+                            ))}
+                        </tr>
+                    </thead>
+                    <tbody>{rows}</tbody>
+                </table>
+            </div>
+            <div className="result-table-footer">
+                <span>
+                    {rowCount.toLocaleString()} of {result.total_rows.toLocaleString()} rows
+                    {result.truncated && ` (the first ${result.row_count.toLocaleString()} were returned)`}
+                </span>
+                {rowCount < result.row_count && (
+                    <button type="button" onClick={() => setVisibleRows(visibleRows + RESULT_PAGE_ROWS)}>Show more</button>
+                )}
+            </div>
+        </div>
+    );
+};
+
 // ✅ Suggested Questions Array
 const suggestedQuestions = [
   { heading: 'Top Consumed Parts', question: 'Provide the list of Top 20 consumed part under Running Repair from 01-01-2025 to 01-06-2025 (Use Part Number as the Unique Key and the Output should be Part Number, Part Descp & Count in decending order.' },
@@ -83,7 +146,8 @@ const ChatInterface = ({ username, sessionId }) => {
             const requestBody = {
                 user_id: username,
                 session_id: sessionId, 
-                message: { message: messageToSend, role: 'user' }
+                message: { message: messageToSend, role: 'user' },
+                result_format: 'json'
             };
             
             console.log('Sending request to /api/chat:', requestBody);
@@ -102,12 +166,16 @@ const ChatInterface = ({ username, sessionId }) => {
             console.log('Response from /api/chat:', data);
 
             if (data.messages && data.messages.length > 0) {
-                const botReplies = data.messages.map((msg, index) => ({
-                    id: Date.now() + index + 1,
-                    text: msg.content,
-                    sender: 'bot',
-                    timestamp: new Date()
-                }));
+                // Each query result is shown under the SQL message that produced it.
+                const results = new Map((data.results || []).map((result) => [result.id, result]));
+                const botReplies = data.messages.map((msg, index) => {
+                    const result = results.get(msg.result_id);
+                    results.delete(msg.result_id);
+                    return { id: Date.now() + index + 1, text: msg.content, result, sender: 'bot', timestamp: new Date() };
+                });
+                [...results.values()].forEach((result, index) => {
+                    botReplies.push({ id: Date.now() + data.messages.length + index + 1, text: '', result, sender: 'bot', timestamp: new Date() });
+                });
                 setMessages((prev) => [...prev, ...botReplies]);
             } else if (data.error) {
                 throw new Error(data.error);
@@ -137,6 +205,7 @@ const ChatInterface = ({ username, sessionId }) => {
                             <div className="message-bubble">
                                 <div className="message-text">
                                     <ReactMarkdown remarkPlugins={[remarkGfm]}>{msg.text}</ReactMarkdown>
+                                    {msg.result && <ResultTable result={msg.result} />}
                                 </div>
                                 <span className="message-timestamp">{formatTimestamp(msg.timestamp)}</span>
                             </div>
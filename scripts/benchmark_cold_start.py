@@ -0,0 +1,130 @@
+"""
+Benchmarks the cold start of the backend: each run starts a fresh Python process with
+STARTUP_PROFILE=1 and reads its startup report (see backend/startup_profile.py).
+
+    python scripts/benchmark_cold_start.py                      # 5 runs of `import backend.app`
+    python scripts/benchmark_cold_start.py --target imports     # module imports only, no agent build
+    python scripts/benchmark_cold_start.py --output cold_start.json
+    python scripts/benchmark_cold_start.py --compare cold_start.json
+
+Targets:
+    app      imports backend/app.py, which builds the default dataset's agent (this
+             needs access to BigQuery and Dataplex) and sets up the ADK runner.
+    imports  imports the agent and backend modules without creating the app, which
+             isolates import time from network calls.
+
+The process wall time includes interpreter startup. Per phase and per package times
+are medians over the runs. --output writes the summary as JSON, so it can be tracked
+over time, and --compare prints the change against such a file.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_TARGETS = {
+    "app": "import backend.app",
+    "imports": (
+        "from backend.startup_profile import STARTUP_PROFILER\n"
+        "import data_agent.agent, data_agent.llm, data_agent.custom_tools, data_agent.registry\n"
+        "import backend.jobs, backend.admission, backend.utils\n"
+        "STARTUP_PROFILER.mark('imports')\n"
+        "STARTUP_PROFILER.finish()\n"
+    ),
+}
+
+
+def _run_once(target: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report_path = os.path.join(tmp_dir, "startup_profile.json")
+        env = dict(os.environ, STARTUP_PROFILE="1", STARTUP_PROFILE_OUTPUT=report_path)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (ROOT, env.get("PYTHONPATH")) if p)
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", _TARGETS[target]], cwd=ROOT, env=env,
+                                   capture_output=True, text=True)
+        wall_seconds = time.perf_counter() - start
+        if completed.returncode != 0 or not os.path.exists(report_path):
+            sys.stderr.write(completed.stderr[-4000:])
+            raise SystemExit(f"The {target} run failed (exit code {completed.returncode}).")
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+    report["wall_seconds"] = wall_seconds
+    return report
+
+
+def _median(values) -> float:
+    return round(statistics.median(values), 3) if values else 0.0
+
+
+def summarize(reports: list[dict], target: str) -> dict:
+    """Medians of the wall time, the profiled time, the phases and the import time per package."""
+    phases = sorted({name for r in reports for name in r["phases"]})
+    packages = {name for r in reports for name in r["import_seconds_by_package"]}
+    by_package = {name: _median([r["import_seconds_by_package"].get(name, 0.0) for r in reports]) for name in packages}
+    return {
+        "target": target,
+        "runs": len(reports),
+        "python": sys.version.split()[0],
+        "wall_seconds": _median([r["wall_seconds"] for r in reports]),
+        "wall_seconds_min": round(min(r["wall_seconds"] for r in reports), 3),
+        "profiled_seconds": _median([r["total_seconds"] for r in reports]),
+        "modules_imported": reports[-1]["modules_imported"],
+        "phases": {name: _median([r["phases"].get(name, 0.0) for r in reports]) for name in phases},
+        "import_seconds_by_package": dict(sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:15]),
+        "slowest_modules": reports[-1]["slowest_modules"][:10],
+    }
+
+
+def _print_summary(summary: dict, baseline: dict | None) -> None:
+    def line(label, value, base_value=None):
+        delta = ""
+        if base_value is not None:
+            delta = f"  ({value - base_value:+.3f}s vs baseline)"
+        print(f"  {label:<40}{value:>8.3f}s{delta}")
+
+    base = baseline or {}
+    print(f"Cold start of '{summary['target']}', median of {summary['runs']} runs "
+          f"({summary['modules_imported']} modules imported):")
+    line("process wall time", summary["wall_seconds"], base.get("wall_seconds"))
+    line("profiled (from first import)", summary["profiled_seconds"], base.get("profiled_seconds"))
+    print("Phases:")
+    for name, seconds in summary["phases"].items():
+        line(name, seconds, base.get("phases", {}).get(name))
+    print("Import time by package (self time):")
+    for name, seconds in summary["import_seconds_by_package"].items():
+        line(name, seconds, base.get("import_seconds_by_package", {}).get(name))
+    print("Slowest modules (last run, self time):")
+    for module in summary["slowest_modules"]:
+        line(module["module"], module["self_seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=sorted(_TARGETS), default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the summary as JSON to this file.")
+    parser.add_argument("--compare", help="A summary written by --output to compare against.")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    reports = [_run_once(args.target) for _ in range(args.runs)]
+    summary = summarize(reports, args.target)
+    _print_summary(summary, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmarks the data profile pipeline: the row-by-row Python path against the Arrow path.
+
+Each mode runs in a fresh subprocess on the same synthetic profiles table, and the
+script reports the pipeline time (rows in -> prompt JSON out, split into the conversion
+to Python records and the JSON serialization), then, in a separate untimed run, the
+peak Python heap (tracemalloc), the peak Arrow memory pool and the peak RSS.
+
+    python scripts/benchmark_profiles.py                 # 20,000 profile rows
+    python scripts/benchmark_profiles.py --rows 200000 --repeat 5
+
+Modes:
+    legacy  dict(row.items()) per row, recursive _convert_decimals, list-comprehension
+            filter and json.dumps with a `default` hook (the previous implementation).
+    arrow   vectorized casts and filter on the Arrow table, column-wise conversion to
+            records (table_to_records) and the prompt serializer (_canonical_json, which
+            uses orjson when it is installed).
+    cache   the arrow mode reading a memory-mapped Arrow IPC cache file instead.
+"""
+import argparse
+import datetime
+import decimal
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pyarrow as pa
+
+_TOP_N_TYPE = pa.list_(pa.struct([
+    ("value", pa.string()),
+    ("count", pa.int64()),
+    ("percent", pa.decimal128(38, 9)),
+]))
+
+
+def _synthetic_profiles(num_rows: int) -> pa.Table:
+    """A profiles table shaped like the query in fetch_bigquery_data_profiles_arrow()."""
+    rng = random.Random(42)
+    dec = lambda x: decimal.Decimal(f"{x:.6f}")
+    top_n = [
+        [{"value": f"value_{rng.randrange(1000)}", "count": rng.randrange(10 ** 6), "percent": dec(rng.random() * 100)}
+         for _ in range(rng.randrange(1, 11))]
+        for _ in range(num_rows)
+    ]
+    return pa.table({
+        "source_table_id": pa.array([f"project.dataset.table_{i % 50}" for i in range(num_rows)]),
+        "column_name": pa.array([f"column_{i}" for i in range(num_rows)]),
+        "percent_null": pa.array([dec(rng.random() * 100) for _ in range(num_rows)], pa.decimal128(38, 9)),
+        "percent_unique": pa.array([dec(rng.random() * 100) for _ in range(num_rows)], pa.decimal128(38, 9)),
+        "min_string_length": pa.array([rng.randrange(10) for _ in range(num_rows)], pa.int64()),
+        "max_string_length": pa.array([rng.randrange(10, 100) for _ in range(num_rows)], pa.int64()),
+        "min_value": pa.array([str(rng.randrange(100)) for _ in range(num_rows)]),
+        "max_value": pa.array([str(rng.randrange(100, 10 ** 6)) for _ in range(num_rows)]),
+        "profiled_at": pa.array([datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)] * num_rows, pa.timestamp("us", tz="UTC")),
+        "top_n": pa.array(top_n, _TOP_N_TYPE),
+    })
+
+
+def _json_serial_default(obj):
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def _legacy_convert(rows: list[dict]) -> list[dict]:
+    def convert_decimals(obj):
+        if isinstance(obj, list):
+            return [convert_decimals(i) for i in obj]
+        if isinstance(obj, dict):
+            return {k: convert_decimals(v) for k, v in obj.items()}
+        if isinstance(obj, decimal.Decimal):
+            return float(obj)
+        return obj
+
+    cleaned = convert_decimals([dict(row.items()) for row in rows])
+    return [p for p in cleaned if not (isinstance(p.get("percent_null"), (float, int)) and p.get("percent_null") > 90)]
+
+
+def _legacy_serialize(profiles: list[dict]) -> str:
+    return json.dumps(profiles, indent=2, default=_json_serial_default)
+
+
+def _run_once(mode: str, input_path: str, inputs, cache_path: str) -> tuple[float, float, int]:
+    """Runs the pipeline once; returns (convert seconds, serialize seconds, output bytes)."""
+    from data_agent.arrow_utils import read_arrow_cache, to_json_ready, filter_sparse_profiles, table_to_records
+    from data_agent.instructions import _canonical_json
+
+    start = time.perf_counter()
+    if mode == "legacy":
+        profiles = _legacy_convert(inputs)
+    elif mode == "arrow":
+        source = pa.ipc.open_file(pa.memory_map(input_path, "r")).read_all()
+        profiles = table_to_records(filter_sparse_profiles(to_json_ready(source), 90))
+    else:
+        profiles = table_to_records(read_arrow_cache(cache_path))
+    converted = time.perf_counter()
+    output = _legacy_serialize(profiles) if mode == "legacy" else _canonical_json(profiles)
+    return converted - start, time.perf_counter() - converted, len(output)
+
+
+def _run_mode(mode: str, input_path: str, repeat: int) -> dict:
+    """Runs one mode in this process and returns its measurements."""
+    from data_agent.arrow_utils import write_arrow_cache, to_json_ready, filter_sparse_profiles
+
+    source = pa.ipc.open_file(pa.memory_map(input_path, "r")).read_all()
+    inputs, cache_path = None, input_path + ".cache.arrow"
+    if mode == "legacy":
+        # BigQuery Row objects behave like the dicts built here (one Python object per value).
+        inputs = source.to_pylist()
+    elif mode == "cache":
+        write_arrow_cache(filter_sparse_profiles(to_json_ready(source), 90), cache_path)
+    del source
+
+    # Timed runs first, without tracemalloc (it slows allocation-heavy code down several times).
+    runs = [_run_once(mode, input_path, inputs, cache_path) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r[0] + r[1])
+
+    pool = pa.default_memory_pool()
+    baseline_pool = pool.bytes_allocated()
+    tracemalloc.start()
+    _run_once(mode, input_path, inputs, cache_path)
+    _, peak_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "convert_seconds": round(best[0], 4),
+        "serialize_seconds": round(best[1], 4),
+        "best_seconds": round(best[0] + best[1], 4),
+        "mean_seconds": round(sum(r[0] + r[1] for r in runs) / len(runs), 4),
+        "peak_python_heap_mib": round(peak_python / 1024 ** 2, 1),
+        "peak_arrow_pool_mib": round(max(0, pool.max_memory() - baseline_pool) / 1024 ** 2, 1),
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "output_bytes": best[2],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="Number of synthetic profile rows.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode; the best and mean times are reported.")
+    parser.add_argument("--modes", default="legacy,arrow,cache")
+    parser.add_argument("--_child", help=argparse.SUPPRESS)
+    parser.add_argument("--_input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        print(json.dumps(_run_mode(args._child, args._input, args.repeat)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "profiles.arrow")
+        table = _synthetic_profiles(args.rows)
+        with pa.OSFile(input_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        print(f"Profiles: {args.rows:,} rows, {table.nbytes / 1024 ** 2:.1f} MiB in Arrow form.\n")
+
+        results = []
+        for mode in args.modes.split(","):
+            completed = subprocess.run(
+                [sys.executable, __file__, "--_child", mode, "--_input", input_path, "--repeat", str(args.repeat)],
+                capture_output=True, text=True, check=True,
+            )
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    header = (f"{'mode':<8}{'convert s':>11}{'serialize s':>13}{'best s':>10}{'mean s':>10}"
+              f"{'py heap MiB':>14}{'arrow MiB':>12}{'RSS MiB':>10}{'JSON bytes':>14}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['mode']:<8}{r['convert_seconds']:>11}{r['serialize_seconds']:>13}{r['best_seconds']:>10}{r['mean_seconds']:>10}{r['peak_python_heap_mib']:>14}"
+              f"{r['peak_arrow_pool_mib']:>12}{r['peak_rss_mib']:>10}{r['output_bytes']:>14,}")
+
+
+if __name__ == "__main__":
+    main()
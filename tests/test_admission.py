@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from backend.admission import (
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    AdmissionCancelled,
+    AdmissionController,
+    AdmissionRejected,
+)
+
+
+def _controller(tmp_path, **kwargs):
+    kwargs.setdefault("max_concurrent", 1)
+    return AdmissionController(slot_dir=str(tmp_path), **kwargs)
+
+
+def _wait_for_queue(controller, depth):
+    deadline = time.monotonic() + 5
+    while controller.stats()["queue_depth"] != depth:
+        assert time.monotonic() < deadline, "queue did not reach the expected depth"
+        time.sleep(0.01)
+
+
+def _enqueue(controller, user_id, priority, admitted, errors=None, **kwargs):
+    def run():
+        try:
+            ticket = controller.acquire(user_id, priority, **kwargs)
+        except Exception as e:
+            errors.append(e)
+            return
+        admitted.append(user_id)
+        controller.release(ticket)
+
+    depth = controller.stats()["queue_depth"]
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_for_queue(controller, depth + 1)
+    return thread
+
+
+def test_priority_then_round_robin_across_users(tmp_path):
+    controller = _controller(tmp_path)
+    holder = controller.acquire("holder")
+    admitted = []
+    threads = [
+        _enqueue(controller, "alice", PRIORITY_NORMAL, admitted),
+        _enqueue(controller, "alice", PRIORITY_NORMAL, admitted),
+        _enqueue(controller, "bob", PRIORITY_NORMAL, admitted),
+        _enqueue(controller, "carol", PRIORITY_HIGH, admitted),
+    ]
+    controller.release(holder)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert admitted == ["carol", "alice", "bob", "alice"]
+    stats = controller.stats()
+    assert (stats["admitted"], stats["admitted_high_priority"], stats["running"]) == (5, 1, 0)
+
+
+def test_priority_for_short_messages_and_clarification_replies(tmp_path):
+    controller = _controller(tmp_path)
+    assert controller.priority_for("s1", "yes") == PRIORITY_HIGH
+    long_message = "Show the monthly net revenue by zone and model for the last two financial years " * 2
+    assert controller.priority_for("s1", long_message) == PRIORITY_NORMAL
+    controller.note_turn_result("s1", clarification_asked=True)
+    assert controller.priority_for("s1", long_message) == PRIORITY_HIGH
+    controller.note_turn_result("s1", clarification_asked=False)
+    assert controller.priority_for("s1", long_message) == PRIORITY_NORMAL
+
+
+def test_full_queue_is_rejected_with_retry_after(tmp_path):
+    controller = _controller(tmp_path, max_queued_per_user=1)
+    holder = controller.acquire("holder")
+    admitted, errors = [], []
+    thread = _enqueue(controller, "alice", PRIORITY_NORMAL, admitted)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("alice")
+    assert rejected.value.retry_after >= 1
+    assert controller.stats()["rejected_queue_full"] == 1
+    controller.release(holder)
+    thread.join(timeout=5)
+    assert admitted == ["alice"] and not errors
+
+
+def test_wait_longer_than_the_limit_is_rejected(tmp_path):
+    controller = _controller(tmp_path, max_wait_seconds=0.2)
+    holder = controller.acquire("holder")
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("alice")
+    assert controller.stats()["rejected_timeout"] == 1
+    assert controller.stats()["queue_depth"] == 0
+    controller.release(holder)
+
+
+def test_cancelled_turn_leaves_the_queue(tmp_path):
+    controller = _controller(tmp_path)
+    holder = controller.acquire("holder")
+    cancel_event = threading.Event()
+    admitted, errors = [], []
+    thread = _enqueue(controller, "alice", PRIORITY_NORMAL, admitted, errors, cancel_event=cancel_event)
+    cancel_event.set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert [type(e) for e in errors] == [AdmissionCancelled] and admitted == []
+    assert controller.stats()["queue_depth"] == 0 and controller.stats()["cancelled_waiting"] == 1
+    controller.release(holder)
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from data_agent import budget
+from data_agent.budget import BudgetExceededError, BudgetGovernor
+from data_agent.turn_context import TurnContext
+
+HOUR = 60 * 60
+
+
+class _Clock:
+    def __init__(self, now=10 * HOUR):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(budget, "time", SimpleNamespace(time=clock.time))
+    monkeypatch.setattr(budget, "asyncio", SimpleNamespace(sleep=clock.sleep))
+    monkeypatch.setattr(budget, "start_periodic_task", lambda *args, **kwargs: False)
+    return clock
+
+
+def _governor(tmp_path, *rules):
+    return BudgetGovernor(db_url=f"sqlite:///{tmp_path / 'usage.db'}", rules=list(rules), enabled=True)
+
+
+def _rule(action, limit=100, scope="user", metric="tokens", window_seconds=HOUR):
+    return {"scope": scope, "metric": metric, "window_seconds": window_seconds, "limit": limit, "action": action}
+
+
+def _turn(user_id="alice", session_id="s1"):
+    return TurnContext(user_id, session_id, "ds")
+
+
+def test_soft_limit_degrades_then_reject_rule_stops_the_turn(tmp_path, clock):
+    governor = _governor(tmp_path, _rule("reject"))
+    turn = _turn()
+    governor.record_turn_usage(turn, input_tokens=50, output_tokens=30)
+    assert asyncio.run(governor.admit(turn)).action == "allow" and not turn.degraded
+
+    governor.record_turn_usage(turn, output_tokens=15)
+    assert asyncio.run(governor.admit(turn)).action == "degrade"
+    assert turn.degraded and turn.max_bytes_billed == budget.BUDGET_DEGRADED_MAX_BYTES_BILLED
+
+    governor.record_turn_usage(turn, input_tokens=5)
+    with pytest.raises(BudgetExceededError) as exceeded:
+        governor.enforce(turn)
+    assert exceeded.value.retry_after == HOUR + 1
+    with pytest.raises(BudgetExceededError):
+        asyncio.run(governor.admit(_turn(session_id="s2")))
+    # Other users have their own counters.
+    assert asyncio.run(governor.admit(_turn(user_id="bob"))).action == "allow"
+    assert governor.stats()["decisions"] == {"allow": 2, "degrade": 1, "queue": 0, "reject": 1}
+
+
+def test_usage_is_counted_per_window(tmp_path, clock):
+    governor = _governor(tmp_path, _rule("reject", window_seconds=60), _rule("reject", scope="session", metric="bytes_billed", window_seconds=0))
+    governor.record("alice", "s1", input_tokens=40, bytes_billed=1000)
+    clock.now += 45
+    governor.record("alice", "s1", input_tokens=20, bytes_billed=500)
+    minute, lifetime = governor.usage("alice", "s1")
+    assert (minute["used"], minute["remaining"], minute["resets_in_seconds"]) == (60, 40, 16)
+    assert (lifetime["used"], lifetime["resets_in_seconds"]) == (1500, None)
+
+    clock.now += 60  # The next minute starts from zero; the session's lifetime counter does not.
+    minute, lifetime = governor.usage("alice", "s1")
+    assert (minute["used"], lifetime["used"]) == (0, 1500)
+    assert [entry["scope"] for entry in governor.usage("alice")] == ["user"]
+
+
+def test_prune_deletes_ended_windows_only(tmp_path, clock):
+    governor = _governor(tmp_path, _rule("reject", window_seconds=60))
+    governor.record("alice", "s1", input_tokens=10)
+    clock.now += 2 * HOUR
+    governor.prune()
+    with governor.engine.connect() as conn:
+        rows = conn.execute(governor._counters.select()).fetchall()
+    # The lifetime session counter stays; the user's daily window has not ended yet.
+    assert sorted((row.scope, row.window_seconds) for row in rows) == [("global", 24 * HOUR), ("session", 0), ("user", 24 * HOUR)]
+
+
+def test_queue_rule_waits_for_the_window_to_reset(tmp_path, clock, monkeypatch):
+    governor = _governor(tmp_path, _rule("queue", limit=10, scope="global", window_seconds=20))
+    clock.now = 10 * HOUR + 15
+    governor.record("alice", "s1", input_tokens=10)
+    start = clock.now
+    assert asyncio.run(governor.admit(_turn())).action == "allow"
+    assert clock.now - start == 6  # Slept until the next 20 s window started.
+    assert governor.stats()["decisions"]["queue"] == 1
+
+    governor.record("alice", "s1", input_tokens=10)
+    monkeypatch.setattr(budget, "BUDGET_QUEUE_MAX_WAIT_SECONDS", 5)
+    with pytest.raises(BudgetExceededError) as exceeded:
+        asyncio.run(governor.admit(_turn()))
+    assert exceeded.value.retry_after == 20 and exceeded.value.rule["action"] == "queue"
+
+
+def test_disabled_governor_only_meters_the_turn(tmp_path, clock):
+    governor = BudgetGovernor(db_url=f"sqlite:///{tmp_path / 'usage.db'}", rules=[_rule("reject", limit=1)], enabled=False)
+    turn = _turn()
+    governor.record_turn_usage(turn, input_tokens=5, bytes_billed=7)
+    assert asyncio.run(governor.admit(turn)).action == "allow"
+    governor.enforce(turn)
+    assert turn.usage()["input_tokens"] == 5 and governor.usage("alice", "s1")[0]["used"] == 0
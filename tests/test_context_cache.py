@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from data_agent import context_cache, llm
+from data_agent.context_cache import ContextCacheManager, LocalContextCacheClient, LocalGenerativeModelClient
+
+SYSTEM_INSTRUCTION = "You are a data agent. " * 400
+
+
+@pytest.fixture
+def local_model(tmp_path, monkeypatch):
+    caches = LocalContextCacheClient()
+    manager = ContextCacheManager(client=caches, cache_dir=str(tmp_path))
+    monkeypatch.setattr(manager, "ensure_maintenance", lambda: None)
+    monkeypatch.setattr(context_cache, "CONTEXT_CACHE_MIN_TOKENS", 1000)
+    monkeypatch.setattr(llm, "CONTEXT_CACHE", manager)
+    monkeypatch.setattr(llm, "CONTEXT_CACHE_ENABLED", True)
+    client = LocalGenerativeModelClient(caches, reply="There were 42 orders.")
+    model = llm.DataAgentGemini(model="gemini-local").use_api_client(client)
+    return model, manager, caches, client
+
+
+def _request():
+    return LlmRequest(
+        model="gemini-local",
+        contents=[types.Content(role="user", parts=[types.Part(text="How many orders?")])],
+        config=types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION),
+    )
+
+
+def _run(model, request):
+    async def collect():
+        return [r async for r in model._generate_cached(request, stream=False, turn=None)]
+    return asyncio.run(collect())
+
+
+def test_cached_call_references_the_handle_and_restores_the_request(local_model):
+    model, manager, caches, client = local_model
+    request = _request()
+
+    responses = _run(model, request)
+
+    assert responses[0].content.parts[0].text == "There were 42 orders."
+    assert len(client.calls) == 1
+    assert client.calls[0]["cached_content"] in caches.caches.entries
+    assert client.calls[0]["system_instruction"] is None
+    assert request.config.cached_content is None
+    assert request.config.system_instruction == SYSTEM_INSTRUCTION
+    stats = manager.stats()
+    assert stats["cached_requests"] == 1 and stats["fallbacks"] == 0
+    assert stats["cached_input_tokens"] > stats["uncached_input_tokens"]
+
+
+def test_expired_handle_is_retried_inline_and_recreated(local_model):
+    model, manager, caches, client = local_model
+    _run(model, _request())
+    expired_name = client.calls[0]["cached_content"]
+    # The handle expires on the server while this worker still believes it is live.
+    caches.caches.entries[expired_name]["expire_time"] = 0
+
+    request = _request()
+    responses = _run(model, request)
+
+    assert responses[0].content.parts[0].text == "There were 42 orders."
+    assert [c["cached_content"] for c in client.calls[1:]] == [expired_name, None]
+    assert client.calls[2]["system_instruction"] == SYSTEM_INSTRUCTION
+    assert request.config.cached_content is None
+    assert request.config.system_instruction == SYSTEM_INSTRUCTION
+    stats = manager.stats()
+    assert stats["fallbacks"] == 1 and stats["uncached_requests"] == 1
+    assert expired_name not in {h["name"] for h in manager._read_shared().values()}
+
+    # The next call creates a new handle instead of reusing the rejected one.
+    _run(model, _request())
+    assert client.calls[3]["cached_content"] not in (None, expired_name)
+    assert manager.stats()["creates"] == 2
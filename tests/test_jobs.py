@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+import sqlalchemy
+
+from backend import jobs
+from backend.jobs import (
+    STATUS_CANCELLED,
+    STATUS_FAILED,
+    STATUS_SUCCEEDED,
+    STATUS_TIMED_OUT,
+    ChatJobManager,
+    JobRejected,
+)
+from data_agent.turn_context import TurnContext
+
+
+@pytest.fixture
+def db_url(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "start_periodic_task", lambda *args, **kwargs: False)
+    return f"sqlite:///{tmp_path / 'jobs.db'}"
+
+
+def _submit(manager, run_turn, user_id="alice"):
+    turn = TurnContext(user_id, "s1", "ds")
+    return manager.submit(user_id, "s1", "ds", turn, run_turn), turn
+
+
+async def _answer(turn, on_started):
+    on_started()
+    return {"messages": ["done"]}
+
+
+async def _hang(turn, on_started):
+    on_started()
+    await asyncio.sleep(60)
+
+
+def _wait_until_finished(manager, job_id, user_id="alice"):
+    deadline = time.monotonic() + 5
+    while (job := manager.get(job_id, user_id))["status"] in jobs.ACTIVE_STATUSES:
+        assert time.monotonic() < deadline, "the job did not finish"
+        time.sleep(0.02)
+    return job
+
+
+def _wait_until_running(manager, job_id):
+    deadline = time.monotonic() + 5
+    while manager.get(job_id, "alice")["status"] != jobs.STATUS_RUNNING:
+        assert time.monotonic() < deadline, "the job did not start"
+        time.sleep(0.02)
+
+
+def test_job_result_is_stored(db_url):
+    manager = ChatJobManager(db_url)
+    job_id, _ = _submit(manager, _answer)
+    job = _wait_until_finished(manager, job_id)
+    assert job["status"] == STATUS_SUCCEEDED and job["result"] == {"messages": ["done"]}
+    assert job["started_at"] <= job["finished_at"]
+    assert manager.get(job_id, "bob") is None  # Jobs are only visible to their owner.
+    assert manager.stats()[STATUS_SUCCEEDED] == 1
+
+
+def test_cancel_stops_the_turn(db_url):
+    manager = ChatJobManager(db_url)
+    job_id, turn = _submit(manager, _hang)
+    _wait_until_running(manager, job_id)
+    assert manager.cancel(job_id, "bob") is None
+    assert manager.cancel(job_id, "alice")["cancel_requested"]
+    job = _wait_until_finished(manager, job_id)
+    assert job["status"] == STATUS_CANCELLED and turn.cancel_reason == STATUS_CANCELLED
+
+
+def test_cancel_requested_through_another_worker(db_url):
+    manager, other_worker = ChatJobManager(db_url), ChatJobManager(db_url)
+    job_id, _ = _submit(manager, _hang)
+    _wait_until_running(manager, job_id)
+    other_worker.cancel(job_id, "alice")
+    assert manager.get(job_id, "alice")["status"] == jobs.STATUS_RUNNING
+    manager.watch()
+    assert _wait_until_finished(manager, job_id)["status"] == STATUS_CANCELLED
+
+
+def test_watch_times_out_long_jobs(db_url):
+    manager = ChatJobManager(db_url, timeout_seconds=0.05)
+    job_id, turn = _submit(manager, _hang)
+    _wait_until_running(manager, job_id)
+    time.sleep(0.1)
+    manager.watch()
+    assert _wait_until_finished(manager, job_id)["status"] == STATUS_TIMED_OUT
+    assert turn.cancel_reason == STATUS_TIMED_OUT and manager.stats()[STATUS_TIMED_OUT] == 1
+
+
+def test_submissions_over_the_limit_are_rejected(db_url):
+    manager = ChatJobManager(db_url, max_active=1)
+    job_id, _ = _submit(manager, _hang)
+    with pytest.raises(JobRejected) as rejected:
+        _submit(manager, _answer)
+    assert rejected.value.retry_after > 0 and manager.stats()["rejected"] == 1
+    manager.cancel(job_id, "alice")
+    _wait_until_finished(manager, job_id)
+
+
+def test_prune_deletes_expired_jobs_and_fails_lost_ones(db_url):
+    manager = ChatJobManager(db_url, timeout_seconds=10)
+    finished_id, _ = _submit(manager, _answer)
+    _wait_until_finished(manager, finished_id)
+    old = time.time() - jobs.JOB_RETENTION_SECONDS - 60
+    c = manager._jobs.c
+    with manager.engine.begin() as conn:
+        conn.execute(manager._jobs.update().where(c.job_id == finished_id).values(finished_at=old))
+        conn.execute(manager._jobs.insert().values(job_id="lost", user_id="alice", session_id="s1", dataset_id="ds",
+                                                   status=jobs.STATUS_RUNNING, cancel_requested=False, created_at=old))
+    manager.prune()
+    assert manager.get(finished_id, "alice") is None
+    assert manager.get("lost", "alice")["status"] == STATUS_FAILED
+    with manager.engine.connect() as conn:
+        assert conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(manager._jobs)).scalar() == 1
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from data_agent import custom_tools
+from data_agent.join_graph import JoinEdge, JoinGraph
+
+
+def _graph():
+    graph = JoinGraph({"project_id": "p", "dataset_name": "ds"})
+    graph.load_metadata([])
+    return graph
+
+
+def test_edge_read_from_its_right_table_is_reversed():
+    edge = JoinEdge("facts", "dim", join_keys=[("k", "k")], join_type="left", cardinality="many-to-one")
+    assert edge.walked_from("FACTS") == ("LEFT", "MANY_TO_ONE")
+    assert edge.walked_from("dim") == ("RIGHT", "ONE_TO_MANY")
+    assert JoinEdge("a", "b", cardinality="MANY_TO_MANY").walked_from("b") == ("INNER", "MANY_TO_MANY")
+
+
+def test_left_join_walked_backwards_becomes_right_join():
+    result = _graph().find_path(["stg2_sv_type_catg_master", "ddp_service_cmm_kpis"])
+    (join,) = result["joins"]
+    assert (join["from"], join["to"]) == ("stg2_sv_type_catg_master", "ddp_service_cmm_kpis")
+    assert (join["join_type"], join["cardinality"]) == ("RIGHT", "ONE_TO_MANY")
+    assert result["fan_traps"] == []
+
+
+def test_two_fact_tables_through_a_dimension_are_a_fan_trap():
+    result = _graph().find_path(["EBRD_base", "stg_mis_stock_hist"])
+    assert result["tables"] == ["EBRD_base", "ddp_dim_srv_mst_model_master", "stg_mis_stock_hist"]
+    assert result["fan_traps"] == [{"table": "ddp_dim_srv_mst_model_master", "tables": ["EBRD_base", "stg_mis_stock_hist"]}]
+
+
+def test_find_join_path_renders_direction_and_warning(monkeypatch):
+    monkeypatch.setattr(custom_tools, "active_dataset", lambda: SimpleNamespace(join_graph=_graph()))
+    text = custom_tools.find_join_path("stg2_sv_type_catg_master, ddp_service_cmm_kpis")
+    assert "(RIGHT JOIN; ONE_TO_MANY; approved: Service Category)" in text
+    assert "Warning" not in text
+    text = custom_tools.find_join_path("EBRD_base, stg_mis_stock_hist")
+    assert "Warning: `EBRD_base`, `stg_mis_stock_hist` each have many rows per row of `ddp_dim_srv_mst_model_master`" in text
@@ -0,0 +1,120 @@
+import pytest
+
+from data_agent.partition_pruning import PruningAnalyzer, _matching_paren
+from data_agent.sql_parsing import tokenize_sql
+
+DATASET = {"project_id": "p", "dataset_name": "ds"}
+DAY_START = "TIMESTAMP(CAST({} AS DATE))"
+NEXT_DAY_START = "TIMESTAMP(DATE_ADD(CAST({} AS DATE), INTERVAL 1 DAY))"
+JAN_1, JAN_31 = "'2024-01-01'", "'2024-01-31'"
+
+
+def _date_rewrite(sql, column_type="TIMESTAMP"):
+    """Runs `_date_rewrite` on the wrapper around `bill_date` and returns the edited query, or None."""
+    tokens = tokenize_sql(sql)
+    column = next(i for i, t in enumerate(tokens) if t[1].lower() == "bill_date")
+    start = column - 2 if tokens[column - 1][1] == "." else column
+    close_index = _matching_paren(tokens, start - 1)
+    column_text = sql[tokens[start][2]:tokens[column][2] + len(tokens[column][1])]
+    edit = PruningAnalyzer._date_rewrite(sql, tokens, {"column": "BILL_DATE", "column_type": column_type},
+                                         (start - 2, close_index), (start, column), column_text)
+    return None if edit is None else sql[:edit[0]] + edit[2] + sql[edit[1]:]
+
+
+def _analyzer():
+    analyzer = PruningAnalyzer(DATASET, mode="rewrite")
+    analyzer.load_metadata([{
+        "table_name": "bills",
+        "aspects": {"p.global.schema": {"fields": [{"name": "BILL_DATE"}, {"name": "amt"}]}},
+        "storage": {"partitioning": {"type": "DAY", "column": "BILL_DATE", "column_type": "TIMESTAMP"}},
+    }])
+    return analyzer
+
+
+# --- _date_rewrite ---
+
+def test_between_becomes_half_open_range():
+    assert _date_rewrite("WHERE DATE(bill_date) BETWEEN '2024-01-01' AND '2024-01-31' AND amt > 0") == (
+        f"WHERE (bill_date >= {DAY_START.format(JAN_1)} "
+        f"AND bill_date < {NEXT_DAY_START.format(JAN_31)}) AND amt > 0")
+
+
+def test_equality_becomes_one_day_range():
+    assert _date_rewrite("WHERE DATE(bill_date) = CURRENT_DATE()") == (
+        f"WHERE (bill_date >= {DAY_START.format('CURRENT_DATE()')} "
+        f"AND bill_date < {NEXT_DAY_START.format('CURRENT_DATE()')})")
+
+
+@pytest.mark.parametrize("op, expected", [
+    ("<", "bill_date < " + DAY_START),
+    ("<=", "bill_date < " + NEXT_DAY_START),
+    (">", "bill_date >= " + NEXT_DAY_START),
+    (">=", "bill_date >= " + DAY_START),
+])
+def test_inequalities(op, expected):
+    assert _date_rewrite(f"WHERE DATE(bill_date) {op} '2024-01-01'") == "WHERE " + expected.format(JAN_1)
+
+
+@pytest.mark.parametrize("op, expected", [
+    ("<", "bill_date >= " + NEXT_DAY_START),
+    ("<=", "bill_date >= " + DAY_START),
+    (">", "bill_date < " + DAY_START),
+    (">=", "bill_date < " + NEXT_DAY_START),
+])
+def test_mirrored_inequalities(op, expected):
+    assert _date_rewrite(f"WHERE '2024-01-01' {op} DATE(bill_date) AND amt > 0") == (
+        "WHERE " + expected.format(JAN_1) + " AND amt > 0")
+
+
+def test_mirrored_operand_with_function_call():
+    bound = "DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)"
+    assert _date_rewrite(f"WHERE amt > 0 AND {bound} <= DATE(bill_date)") == (
+        f"WHERE amt > 0 AND bill_date >= {DAY_START.format(bound)}")
+
+
+def test_aliased_column_and_cast():
+    assert _date_rewrite("WHERE DATE(b.bill_date) >= '2024-01-01'") == (
+        "WHERE b.bill_date >= " + DAY_START.format(JAN_1))
+    assert _date_rewrite("WHERE CAST(`b`.bill_date AS DATE) < '2024-01-01'", column_type="DATETIME") == (
+        "WHERE `b`.bill_date < DATETIME(CAST('2024-01-01' AS DATE))")
+
+
+def test_date_partition_column_drops_the_wrapper():
+    assert _date_rewrite("WHERE '2024-01-01' <= DATE(bill_date)", column_type="DATE") == "WHERE '2024-01-01' <= bill_date"
+
+
+@pytest.mark.parametrize("sql", [
+    "WHERE DATE(bill_date) >= (SELECT MAX(d) FROM t)",
+    "WHERE DATE(bill_date) BETWEEN (SELECT MIN(d) FROM t) AND '2024-01-31'",
+    "WHERE (SELECT MAX(d) FROM t) <= DATE(bill_date)",
+])
+def test_subquery_operands_are_not_rewritten(sql):
+    assert _date_rewrite(sql) is None
+
+
+@pytest.mark.parametrize("sql", [
+    "WHERE DATE(bill_date, 'Asia/Kolkata') >= '2024-01-01'",
+    "WHERE DATE(bill_date) != '2024-01-01'",
+    "WHERE CAST(bill_date AS STRING) >= '2024'",
+])
+def test_unhandled_forms_are_not_rewritten(sql):
+    assert _date_rewrite(sql) is None
+
+
+# --- analyze ---
+
+def test_analyze_rewrites_mirrored_comparison():
+    result = _analyzer().analyze("SELECT SUM(amt) FROM `p.ds.bills` WHERE '2024-01-01' <= DATE(BILL_DATE)")
+    assert result["issues"] == [] and result["unfiltered_tables"] == []
+    assert result["sql"] == f"SELECT SUM(amt) FROM `p.ds.bills` WHERE BILL_DATE >= {DAY_START.format(JAN_1)}"
+
+
+def test_analyze_mirrored_non_rewritable_is_non_prunable():
+    result = _analyzer().analyze("SELECT SUM(amt) FROM `p.ds.bills` WHERE 2024 = EXTRACT(YEAR FROM BILL_DATE)")
+    assert [issue["kind"] for issue in result["issues"]] == ["non_prunable"]
+
+
+def test_analyze_flags_missing_filter():
+    result = _analyzer().analyze("SELECT SUM(amt) FROM `p.ds.bills` WHERE amt > 0")
+    assert [issue["kind"] for issue in result["issues"]] == ["missing_filter"]
+    assert result["unfiltered_tables"] == ["bills"]
@@ -0,0 +1,95 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from data_agent import agent, registry
+from data_agent.registry import AgentRegistry, UnknownDatasetError
+
+
+def _context(prompt):
+    return {"prompt": prompt, "table_metadata": [], "data_profiles": [], "samples": []}
+
+
+@pytest.fixture
+def sources(monkeypatch, tmp_path):
+    """Fakes the catalog: fingerprints and fetches are read from (and recorded in) a dict."""
+    state = {"fingerprints": {"metadata": "m1", "profiles": "p1"}, "builds": [], "fetched": [], "tasks": []}
+    monkeypatch.setattr(registry, "DATASET_PROFILES", {d: {"project_id": "p", "dataset_name": d} for d in ("a", "b", "c")})
+    monkeypatch.setattr(registry, "PROMPT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(registry, "METADATA_REFRESH_INTERVAL_SECONDS", 60)
+    monkeypatch.setattr(registry, "fetch_metadata_fingerprints", lambda dataset: dict(state["fingerprints"]))
+    monkeypatch.setattr(registry, "build_dataset_instructions",
+                        lambda dataset_id, dataset, **kw: state["builds"].append(dataset_id) or _context(f"prompt {dataset_id}"))
+    monkeypatch.setattr(registry, "fetch_table_entry_metadata", lambda dataset: state["fetched"].append("metadata") or [])
+    monkeypatch.setattr(registry, "fetch_bigquery_data_profiles", lambda dataset, **kw: state["fetched"].append("profiles") or [])
+    monkeypatch.setattr(registry, "fetch_sample_data_for_tables", lambda **kw: [])
+    monkeypatch.setattr(registry, "render_instructions", lambda dataset, *args: f"prompt {state['fingerprints']}")
+    monkeypatch.setattr(registry, "start_periodic_task", lambda name, *args, **kw: state["tasks"].append(name))
+    monkeypatch.setattr(agent, "create_agent", lambda instruction: SimpleNamespace(instruction=instruction))
+    return state
+
+
+def test_least_recently_used_entry_is_evicted(sources, monkeypatch):
+    monkeypatch.setattr(registry.DatasetResources, "estimate_size", lambda self: 100)
+    reg = AgentRegistry(max_memory_bytes=250)
+    a = reg.get("a")
+    reg.get("b")
+    assert reg.get("a") is a  # A hit makes "b" the least recently used entry.
+    c = reg.get("c")
+    assert [e.dataset_id for e in reg.resident()] == ["a", "c"]
+    assert reg.get("c") is c and sources["builds"] == ["a", "b", "c"]
+    stats = reg.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["resident_bytes"]) == (2, 3, 1, 200)
+    with pytest.raises(UnknownDatasetError):
+        reg.get("missing")
+
+
+def test_evicted_entry_stops_its_harvester(sources, monkeypatch):
+    monkeypatch.setattr(registry.DatasetResources, "estimate_size", lambda self: 100)
+    reg = AgentRegistry(max_memory_bytes=150)
+    a = reg.get("a")
+    reg.get("b")
+    assert a.value_index._stopped.is_set()
+    assert not reg.get("b").value_index._stopped.is_set()
+
+
+def test_refresh_refetches_only_the_changed_section(sources):
+    reg = AgentRegistry()
+    entry = reg.get("a")
+    first_version = entry.prompt_version
+    assert reg.refresh("a") is False and sources["fetched"] == []
+
+    sources["fingerprints"]["metadata"] = "m2"
+    assert reg.refresh("a") is True
+    assert sources["fetched"] == ["metadata"]
+    assert entry.prompt_version != first_version and entry.agent.instruction == entry.instructions
+    assert entry.fingerprints == {"metadata": "m2", "profiles": "p1"} and entry.refresh_count == 1
+    assert reg.refresh("b") is False  # Not resident.
+
+
+def test_other_workers_load_the_prompt_cache(sources, tmp_path):
+    AgentRegistry().get("a")
+    sources["fingerprints"]["profiles"] = "p2"
+    first_worker = AgentRegistry()
+    first_worker.get("a")
+    assert sources["builds"] == ["a", "a"]
+    # Only the cache of the current fingerprints is kept.
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("a-") and name.endswith(".json")]) == 1
+
+    second_worker = AgentRegistry()
+    assert second_worker.get("a").instructions == first_worker.get("a").instructions
+    assert sources["builds"] == ["a", "a"]
+
+
+def test_refresher_starts_from_request_paths_only(sources, monkeypatch):
+    reg = AgentRegistry()
+    reg.get("a")
+    assert sources["tasks"] == []
+    monkeypatch.setattr(registry, "REGISTRY", reg)
+    token = registry.ACTIVE_DATASET_ID.set("a")
+    try:
+        assert registry.active_dataset().dataset_id == "a"
+    finally:
+        registry.ACTIVE_DATASET_ID.reset(token)
+    assert sources["tasks"] == ["metadata-refresh"]
@@ -0,0 +1,66 @@
+import base64
+import datetime
+import decimal
+
+import pyarrow as pa
+
+from data_agent import result_channel
+from data_agent.arrow_utils import to_json_ready
+from data_agent.result_channel import QueryResult, _without_nan, encode_results
+
+NAN = float("nan")
+
+
+def _table():
+    return pa.table({
+        "zone": pa.array(["North", "South", None]),
+        "sales": pa.array([decimal.Decimal("1.50"), None, decimal.Decimal("3")], pa.decimal128(10, 2)),
+        "day": pa.array([datetime.date(2024, 1, 1)] * 3),
+        "ratio": pa.array([0.5, NAN, None]),
+        "blob": pa.array([b"\xff\x00", None, b"ok"]),
+    })
+
+
+def test_json_encoding_is_columnar_and_typed():
+    payload = QueryResult("SELECT 1", _table(), total_rows=3, job_id="job1").encode("json")
+    assert payload["format"] == "json" and (payload["row_count"], payload["total_rows"], payload["truncated"]) == (3, 3, False)
+    assert [c["type"] for c in payload["columns"]] == ["string", "decimal", "date", "float", "binary"]
+    zone, sales, day, ratio, blob = payload["data"]
+    assert zone == ["North", "South", None] and sales == [1.5, None, 3.0] and day == ["2024-01-01"] * 3
+    assert ratio == [0.5, None, None]
+    # Bytes that are not valid UTF-8 are sent as base64 instead of nulling the column.
+    assert blob == [base64.b64encode(b"\xff\x00").decode(), None, base64.b64encode(b"ok").decode()]
+
+
+def test_arrow_encoding_keeps_the_types():
+    payload = QueryResult("SELECT 1", _table(), total_rows=3).encode("arrow")
+    table = pa.ipc.open_stream(base64.b64decode(payload["arrow_ipc"])).read_all()
+    assert table.schema.equals(_table().schema) and "data" not in payload
+
+
+def test_result_is_capped_and_flagged(monkeypatch):
+    monkeypatch.setattr(result_channel, "RESULT_MAX_ROWS", 2)
+    result = QueryResult("SELECT 1", _table(), total_rows=500)
+    assert result.table.num_rows == 2 and result.truncated
+    assert "returned 500 rows and 5 columns. The first 2 rows are below." in result.preview()
+    (payload,) = encode_results([result], "xml")  # Unknown formats fall back to RESULT_FORMAT.
+    assert payload["format"] == result_channel.RESULT_FORMAT and payload["row_count"] == 2
+
+
+def test_nan_is_replaced_inside_lists_and_structs():
+    table = pa.table({
+        "values": pa.array([[1.0, NAN], None, [NAN]]),
+        "point": pa.array([{"x": NAN, "label": "a"}, None, {"x": 2.0, "label": None}]),
+        "plain": pa.array([1, 2, 3]),
+    })
+    cleaned = _without_nan(table)
+    assert cleaned.column("values").to_pylist() == [[1.0, None], None, [None]]
+    assert cleaned.column("point").to_pylist() == [{"x": None, "label": "a"}, None, {"x": 2.0, "label": None}]
+    assert cleaned.column("plain").to_pylist() == [1, 2, 3]
+    # A slice of a list column keeps its rows.
+    assert _without_nan(table.slice(1)).column("values").to_pylist() == [None, [None]]
+
+
+def test_nested_bytes_are_base64_encoded():
+    table = pa.table({"parts": pa.array([[b"\xff", None], None])})
+    assert to_json_ready(table).column("parts").to_pylist() == [["/w==", None], None]
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+from google.genai import types
+
+from data_agent.routing import TIER_FAST, TIER_PRO, ModelRouter, classify_question, escalation_reason, question_for_routing
+
+
+def _text(role, text):
+    return types.Content(role=role, parts=[types.Part(text=text)])
+
+
+def _call(sql):
+    return types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name="execute_bigquery_query", args={"sql_query": sql}))])
+
+
+def _response(content):
+    return SimpleNamespace(content=content)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Thanks!", (TIER_FAST, "smalltalk")),
+    ("Which tables do you have?", (TIER_FAST, "metadata_lookup")),
+    ("Total retail sales in March 2024", (TIER_FAST, "simple_lookup")),
+    ("Compare retail sales by zone year over year", (TIER_PRO, "complex_phrasing")),
+    ("List the columns of sales along with their owners", (TIER_PRO, "complex_phrasing")),
+    (" ".join(["sales"] * 25), (TIER_PRO, "long_question")),
+    ("   ", (TIER_PRO, "no_question")),
+])
+def test_classify_question(question, expected):
+    assert classify_question(question) == expected
+
+
+def test_clarification_reply_is_routed_with_the_original_question():
+    contents = [_text("user", "Show sales by zone"), _text("model", "For which month?"), _text("user", "March")]
+    assert question_for_routing(contents) == ("Show sales by zone\nMarch", True)
+    # A model answer that is not a question is not a clarification.
+    contents[1] = _text("model", "Here are the sales.")
+    assert question_for_routing(contents) == ("March", False)
+
+
+def test_escalation_reason():
+    assert escalation_reason([_response(_call("SELECT * FROM a"))]) is None
+    assert escalation_reason([_response(_call("SELECT * FROM a JOIN b ON a.k = b.k"))]) == "multi_table_sql"
+    assert escalation_reason([_response(_text("model", "Sales were 10."))]) is None
+    assert escalation_reason([_response(None), _response(types.Content(role="model", parts=[]))]) == "empty_response"
+
+
+def test_turn_keeps_its_tier_after_a_fallback():
+    router = ModelRouter(enabled=True, fast_model="fast", pro_model="pro")
+    turn = SimpleNamespace(routing={})
+    request = SimpleNamespace(model=None, contents=[_text("user", "Total sales in March")])
+    decision = router.route(request, turn)
+    assert (decision.tier, decision.model) == (TIER_FAST, "fast")
+    router.record_fallback(turn, decision, "multi_table_sql")
+    assert router.route(request, turn).model == "pro"
+    stats = router.stats()
+    assert stats["decisions"] == {"fast:simple_lookup": 1} and stats["fallback_rate"] == 1.0
+    assert not ModelRouter(enabled=True, fast_model="pro", pro_model="pro").enabled
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy
+
+from backend import sessions
+from backend.sessions import KIND_EPHEMERAL, KIND_INTERACTIVE, SessionLifecycleManager
+
+HOUR = 60 * 60
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(sessions, "time", SimpleNamespace(time=lambda: clock.now, sleep=lambda seconds: None))
+    monkeypatch.setattr(sessions, "start_periodic_task", lambda *args, **kwargs: False)
+    monkeypatch.setattr(sessions, "SESSION_GC_LOCK_DIR", str(tmp_path / "locks"))
+    return clock
+
+
+@pytest.fixture
+def manager(tmp_path, clock):
+    db_url = f"sqlite:///{tmp_path / 'sessions.db'}"
+    # The ADK session service creates these tables in production.
+    sessions._adk_metadata.create_all(sqlalchemy.create_engine(db_url))
+    return SessionLifecycleManager(db_url, "app", ttl_seconds={KIND_INTERACTIVE: 24 * HOUR, KIND_EPHEMERAL: HOUR}, batch_size=2)
+
+
+def _create(manager, user_id, session_id, kind=None, events=2):
+    with manager.engine.begin() as conn:
+        conn.execute(sessions._adk_sessions.insert().values(app_name="app", user_id=user_id, id=session_id))
+        for i in range(events):
+            conn.execute(sessions._adk_events.insert().values(id=f"{session_id}-{i}", app_name="app", user_id=user_id, session_id=session_id))
+    if kind:
+        manager.register(user_id, session_id, kind)
+
+
+def _session_ids(manager):
+    with manager.engine.connect() as conn:
+        return sorted(conn.execute(sqlalchemy.select(sessions._adk_sessions.c.id)).scalars())
+
+
+def _event_count(manager):
+    with manager.engine.connect() as conn:
+        return conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(sessions._adk_events)).scalar()
+
+
+def test_expired_sessions_are_deleted_by_kind_in_batches(manager, clock):
+    for i in range(3):
+        _create(manager, "alice", f"tmp{i}", KIND_EPHEMERAL)
+    _create(manager, "alice", "chat", KIND_INTERACTIVE)
+    clock.now += 2 * HOUR
+    assert manager.collect() == {KIND_INTERACTIVE: 0, KIND_EPHEMERAL: 3}
+    assert _session_ids(manager) == ["chat"] and _event_count(manager) == 2
+
+    clock.now += 23 * HOUR
+    assert manager.collect() == {KIND_INTERACTIVE: 1, KIND_EPHEMERAL: 0}
+    stats = manager.stats()
+    assert (stats["gc_runs"], stats["deleted_expired"], stats["sessions"], stats["events"]) == (2, 4, 0, 0)
+
+
+def test_used_session_is_kept(manager, clock):
+    _create(manager, "alice", "chat", KIND_INTERACTIVE)
+    clock.now += 20 * HOUR
+    manager.touch("alice", "chat")
+    clock.now += 20 * HOUR
+    assert manager.collect()[KIND_INTERACTIVE] == 0
+    assert _session_ids(manager) == ["chat"]
+
+
+def test_untracked_sessions_are_adopted_with_a_full_ttl(manager, clock):
+    _create(manager, "alice", "legacy")
+    manager.collect()
+    assert manager.stats()["last_gc"]["adopted"] == 1
+    clock.now += 25 * HOUR
+    assert manager.collect()[KIND_INTERACTIVE] == 1 and _session_ids(manager) == []
+
+
+def test_end_deletes_the_session_now(manager):
+    _create(manager, "alice", "chat", KIND_INTERACTIVE)
+    _create(manager, "bob", "other", KIND_INTERACTIVE)
+    assert manager.end("alice", "chat")
+    assert not manager.end("alice", "chat")
+    assert _session_ids(manager) == ["other"] and _event_count(manager) == 2
+    assert manager.stats()["deleted_on_logout"] == 1
+
+
+def test_in_memory_sessions_are_deleted_through_the_service(clock):
+    deleted = []
+    service = SimpleNamespace(delete_session=lambda **kwargs: deleted.append(kwargs["session_id"]))
+    manager = SessionLifecycleManager()
+    manager.configure(service, None, "app")
+    assert manager.collect() == {} and manager.end("alice", "chat") and deleted == ["chat"]
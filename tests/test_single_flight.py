@@ -0,0 +1,109 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from data_agent.single_flight import QueryCoalescer, _is_transient
+
+
+class _Job:
+    def __init__(self, job_id, rows, error=None, release=None):
+        self.job_id = job_id
+        self.rows = rows
+        self.error = error
+        self.release = release
+        self.total_bytes_billed = 100
+
+    def result(self, **kwargs):
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        return self.rows
+
+
+class _Client:
+    """A BigQuery client fake. `errors` are raised by the jobs created first, in order."""
+
+    def __init__(self, errors=(), release=None):
+        self.project = "p"
+        self.errors = list(errors)
+        self.release = release
+        self.jobs: dict[str, _Job] = {}
+        self.started = threading.Event()
+
+    def query(self, sql_query, job_config=None, job_id=None, location=None):
+        if job_id in self.jobs:
+            raise api_exceptions.Conflict(f"Already Exists: Job {job_id}")
+        job = self.jobs[job_id] = _Job(job_id, [len(self.jobs)], self.errors.pop(0) if self.errors else None, self.release)
+        self.started.set()
+        return job
+
+    def get_job(self, job_id, location=None):
+        return self.jobs[job_id]
+
+
+def _bad_request(reason):
+    return api_exceptions.BadRequest("failed", errors=[{"reason": reason}])
+
+
+def test_flight_key_normalizes_the_sql_and_keeps_job_settings():
+    key = QueryCoalescer.flight_key("select zone from t -- zones\n ;", "p")
+    assert QueryCoalescer.flight_key("SELECT  zone\nFROM t", "p") == key
+    assert QueryCoalescer.flight_key("SELECT zone FROM T", "p") != key  # Identifiers keep their case.
+    assert QueryCoalescer.flight_key("SELECT zone FROM t", "other") != key
+    assert QueryCoalescer.flight_key("SELECT zone FROM t", "p", SimpleNamespace(maximum_bytes_billed=10)) != key
+
+
+@pytest.mark.parametrize("error, transient", [
+    (_bad_request("invalidQuery"), False),
+    (api_exceptions.Forbidden("denied", errors=[{"reason": "accessDenied"}]), False),
+    (api_exceptions.Forbidden("slow down", errors=[{"reason": "rateLimitExceeded"}]), True),
+    (_bad_request("jobBackendError"), True),
+    (api_exceptions.InternalServerError("boom"), True),
+    (ConnectionError("reset"), True),
+])
+def test_error_classification(error, transient):
+    assert _is_transient(error) is transient
+
+
+def test_concurrent_callers_share_one_job():
+    release = threading.Event()
+    client, coalescer = _Client(release=release), QueryCoalescer(enabled=True)
+    results = []
+    leader = threading.Thread(target=lambda: results.append(coalescer.run(client, "SELECT 1")))
+    leader.start()
+    client.started.wait(timeout=5)
+    follower = threading.Thread(target=lambda: results.append(coalescer.run(client, "select 1;")))
+    follower.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join(timeout=5)
+    follower.join(timeout=5)
+    assert sorted(r.role for r in results) == ["follower", "leader"]
+    assert results[0].value is results[1].value and len(client.jobs) == 1
+    stats = coalescer.stats()
+    assert (stats["leaders"], stats["followers"], stats["bytes_billed_saved"], stats["in_flight"]) == (1, 1, 100, 0)
+
+
+def test_job_of_another_worker_is_attached():
+    client = _Client()
+    QueryCoalescer(enabled=True).run(client, "SELECT 1")
+    # A second worker (its own coalescer) in the same window gets a 409 and reuses the job.
+    result = QueryCoalescer(enabled=True).run(client, "SELECT 1")
+    assert result.role == "attached" and len(client.jobs) == 1
+
+
+def test_transient_failure_is_retried_with_a_new_job_id():
+    client = _Client(errors=[_bad_request("backendError")])
+    result = QueryCoalescer(enabled=True).run(client, "SELECT 1")
+    assert result.role == "leader" and [job_id[-2:] for job_id in client.jobs] == ["_0", "_1"]
+
+
+def test_deterministic_failure_is_not_retried():
+    client = _Client(errors=[_bad_request("invalidQuery")])
+    with pytest.raises(api_exceptions.BadRequest):
+        QueryCoalescer(enabled=True).run(client, "SELECT 1")
+    assert len(client.jobs) == 1
@@ -0,0 +1,150 @@
+from data_agent.sql_parsing import (
+    normalize_sql,
+    paren_scopes,
+    parse_join_conditions,
+    parse_qualified_columns,
+    parse_table_references,
+    tokenize_sql,
+)
+from data_agent.sql_validator import SchemaValidator
+
+DATASET = {"project_id": "p", "dataset_name": "ds"}
+
+
+def _table(name, columns, relationships=None):
+    aspects = {"p.global.schema": {"fields": [{"name": c} for c in columns]}}
+    if relationships:
+        aspects["p.global.join-relationship"] = {"relationships": relationships}
+    return {"table_name": name, "aspects": aspects}
+
+
+def _validator():
+    validator = SchemaValidator(DATASET)
+    validator.load_metadata([
+        _table("sales", ["amt", "modl_cd", "dealer_cd"], relationships=[{
+            "related-table-id": "p.ds.dim",
+            "join-keys": [{"local-column": "modl_cd", "related-column": "modl_cd"}],
+        }]),
+        _table("dim", ["modl_cd", "modl_desc"]),
+        {"table_name": "raw_feed", "aspects": {}},
+    ])
+    return validator
+
+
+# --- Tokenizer ---
+
+def test_tokenize_sql_kinds_and_positions():
+    tokens = tokenize_sql("SELECT `a`.b, 'x''' FROM t -- c\nWHERE n >= 1.5")
+    assert [(k, t) for k, t, _ in tokens] == [
+        ("ident", "SELECT"), ("quoted", "`a`"), ("punct", "."), ("ident", "b"), ("punct", ","),
+        ("string", "'x'"), ("string", "''"), ("ident", "FROM"), ("ident", "t"), ("ident", "WHERE"),
+        ("ident", "n"), ("op", ">="), ("number", "1.5"),
+    ]
+    assert tokens[1][2] == 7
+
+
+def test_tokenize_sql_drops_comments_and_keeps_strings_verbatim():
+    tokens = tokenize_sql("/* FROM x */ SELECT '-- not a comment' # trailing")
+    assert [t for _, t, _ in tokens] == ["SELECT", "'-- not a comment'"]
+
+
+def test_normalize_sql_uppercases_keywords_only():
+    assert normalize_sql("select  a\n from `p.d.t` where b = 'x' ;") == "SELECT a FROM `p.d.t` WHERE b = 'x'"
+
+
+def test_parse_table_references_aliases_ctes_and_extract():
+    tokens = tokenize_sql(
+        "WITH c AS (SELECT 1) SELECT EXTRACT(YEAR FROM s.d) FROM `p.ds.sales` AS s, c "
+        "JOIN p.ds.dim d ON s.modl_cd = d.modl_cd")
+    refs = parse_table_references(tokens)
+    assert [(t["path"], t["alias"]) for t in refs["tables"]] == [("p.ds.sales", "s"), ("c", None), ("p.ds.dim", "d")]
+    assert refs["cte_names"] == {"c"}
+
+
+def test_parse_qualified_columns_and_join_conditions():
+    tokens = tokenize_sql("SELECT s.amt FROM t s JOIN u d ON s.a = d.b AND s.c = d.e WHERE x = 1")
+    assert [(q, c) for q, c, _ in parse_qualified_columns(tokens)] == [("s", "amt"), ("s", "a"), ("d", "b"), ("s", "c"), ("d", "e")]
+    (on_index, pairs), = parse_join_conditions(tokens)
+    assert tokens[on_index][1] == "ON"
+    assert pairs == [("s", "a", "d", "b"), ("s", "c", "d", "e")]
+
+
+def test_paren_scopes():
+    tokens = tokenize_sql("SELECT a FROM (SELECT b FROM t) x")
+    scope_of, parents = paren_scopes(tokens)
+    open_index = [t for _, t, _ in tokens].index("(")
+    assert scope_of[0] == -1
+    assert scope_of[open_index] == -1 and scope_of[open_index + 1] == open_index
+    assert scope_of[-1] == -1
+    assert parents == {open_index: -1}
+
+
+# --- Validator ---
+
+def test_valid_query_passes():
+    result = _validator().validate(
+        "SELECT s.amt, d.modl_desc FROM `p.ds.sales` s JOIN `p.ds.dim` d ON s.modl_cd = d.modl_cd")
+    assert result == {"errors": [], "warnings": []}
+
+
+def test_unknown_column_and_table_are_errors():
+    result = _validator().validate("SELECT s.amount FROM `p.ds.sales` s JOIN `p.ds.dims` d ON s.modl_cd = d.modl_cd")
+    assert any("Column `amount` does not exist in table `sales`" in e and "amt" in e for e in result["errors"])
+    assert any("Table `p.ds.dims` does not exist" in e for e in result["errors"])
+
+
+def test_unqualified_table_is_an_error_but_cte_is_not():
+    assert _validator().validate("SELECT 1 FROM sales")["errors"]
+    assert _validator().validate("WITH sales AS (SELECT 1 AS x) SELECT sales.x FROM sales")["errors"] == []
+
+
+def test_table_without_schema_aspect_is_not_checked():
+    result = _validator().validate(
+        "SELECT r.anything, s.amt FROM `p.ds.raw_feed` r JOIN `p.ds.sales` s ON r.k = s.modl_cd")
+    assert result["errors"] == []
+    result = _validator().validate("SELECT r.anything FROM `p.ds.raw_feeds` r")
+    assert any("Table `p.ds.raw_feeds` does not exist" in e and "raw_feed" in e for e in result["errors"])
+
+
+def test_alias_reused_in_subquery_is_scoped():
+    result = _validator().validate(
+        "SELECT t.amt FROM `p.ds.sales` t WHERE t.modl_cd IN (SELECT t.modl_cd FROM `p.ds.dim` t WHERE t.modl_desc = 'x')")
+    assert result["errors"] == []
+
+
+def test_alias_reused_in_cte_is_scoped():
+    result = _validator().validate(
+        "WITH m AS (SELECT t.modl_desc FROM `p.ds.dim` t) SELECT t.amt FROM `p.ds.sales` t")
+    assert result["errors"] == []
+
+
+def test_correlated_subquery_sees_outer_alias():
+    result = _validator().validate(
+        "SELECT s.amt FROM `p.ds.sales` s WHERE EXISTS (SELECT 1 FROM `p.ds.dim` d WHERE d.modl_cd = s.modl_cd)")
+    assert result["errors"] == []
+    result = _validator().validate(
+        "SELECT s.amt FROM `p.ds.sales` s WHERE EXISTS (SELECT 1 FROM `p.ds.dim` d WHERE d.modl_cd = s.model)")
+    assert any("Column `model` does not exist in table `sales`" in e for e in result["errors"])
+
+
+def test_alias_bound_twice_at_one_level_only_warns():
+    result = _validator().validate(
+        "SELECT t.modl_desc FROM `p.ds.dim` t UNION ALL SELECT t.amt FROM `p.ds.sales` t")
+    assert result["errors"] == []
+    result = _validator().validate(
+        "SELECT t.nope FROM `p.ds.dim` t UNION ALL SELECT t.amt FROM `p.ds.sales` t")
+    assert result["errors"] == []
+    assert any("`t.nope`" in w for w in result["warnings"])
+
+
+def test_join_on_undeclared_keys_warns():
+    result = _validator().validate(
+        "SELECT s.amt FROM `p.ds.sales` s JOIN `p.ds.dim` d ON s.dealer_cd = d.modl_cd")
+    assert result["errors"] == []
+    assert any("does not match the declared join keys" in w for w in result["warnings"])
+
+
+def test_other_datasets_and_pseudo_columns_are_not_checked():
+    result = _validator().validate(
+        "SELECT o.anything, s._PARTITIONTIME FROM `p.other.sales` o JOIN `p.ds.sales` s ON o.k = s.modl_cd")
+    assert result["errors"] == []
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from data_agent.value_index import ValueIndex, _harvest_query, _recent_partitions_filter
+
+DATASET = {"project_id": "p", "dataset_name": "ds"}
+
+
+def _profile(column, values, percent_unique=1.0, table="p.ds.sales"):
+    return {"source_table_id": table, "column_name": column, "percent_unique": percent_unique,
+            "top_n": [{"value": v, "count": c} for v, c in values]}
+
+
+def _schema(table, fields):
+    return {"table_name": table, "aspects": {"p.global.schema": {"fields": fields}}}
+
+
+def _index(table_metadata=None):
+    index = ValueIndex("test", DATASET)
+    index.load_profiles([
+        _profile("zone", [("North Star", 50), ("North East", 20), ("South", 10)]),
+        _profile("modl_cd", [("XUV700", 5)]),
+        _profile("addr", [("x", 1)]),
+        _profile("addr.city", [("Pune", 3)]),
+        _profile("tags", [("a", 1)]),
+        _profile("vin", [("V1", 1)], percent_unique=90.0),
+    ], table_metadata)
+    return index
+
+
+def test_lookup_exact_is_case_and_whitespace_insensitive():
+    (match,) = _index().lookup("ZONE", "  north   star ")
+    assert (match["value"], match["match_type"], match["count"]) == ("North Star", "exact", 50)
+
+
+def test_lookup_prefix_then_fuzzy():
+    assert [m["value"] for m in _index().lookup("zone", "north")] == ["North Star", "North East"]
+    matches = _index().lookup("zone", "Soth", table_name="p.ds.sales")
+    assert [(m["value"], m["match_type"]) for m in matches] == [("South", "fuzzy")]
+    assert _index().lookup("zone", "North", table_name="other") == []
+
+
+def test_high_cardinality_columns_are_not_indexed():
+    assert "sales.vin" not in _index().known_columns()
+
+
+def test_harvest_candidates_are_top_level_scalar_columns():
+    index = _index([_schema("sales", [
+        {"name": "zone", "dataType": "STRING", "mode": "NULLABLE"},
+        {"name": "modl_cd", "dataType": "INT64"},
+        {"name": "addr", "dataType": "RECORD", "fields": [{"name": "city", "dataType": "STRING"}]},
+        {"name": "tags", "dataType": "STRING", "mode": "REPEATED"},
+    ])])
+    assert index._harvest_candidates == {"sales": ["zone", "modl_cd"]}
+    # Without a schema aspect only nested profile names can be ruled out.
+    assert _index()._harvest_candidates == {"sales": ["zone", "modl_cd", "addr", "tags"]}
+
+
+def test_harvest_query():
+    query = _harvest_query("p.ds.sales", ["zone", "modl_cd"], "`d` >= DATE_SUB(CURRENT_DATE(), INTERVAL 90 DAY)")
+    assert ("SELECT 'zone' AS column_name, CAST(`zone` AS STRING) AS value FROM `p.ds.sales` "
+            "WHERE `d` >= DATE_SUB(CURRENT_DATE(), INTERVAL 90 DAY)") in query
+    assert "SELECT 'modl_cd' AS column_name, CAST(`modl_cd` AS STRING) AS value" in query
+    assert "UNION ALL" in query and "<= @max_values" in query
+    assert "FROM `p.ds.sales` WHERE" not in _harvest_query("p.ds.sales", ["zone"])
+
+
+def test_recent_partitions_filter():
+    def table(field, field_type="DATE", time=True):
+        schema = [SimpleNamespace(name="d", field_type=field_type)]
+        return SimpleNamespace(time_partitioning=SimpleNamespace(field=field) if time else None, schema=schema)
+
+    assert _recent_partitions_filter(table("d"), days=7) == "`d` >= DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)"
+    assert _recent_partitions_filter(table("d", "DATETIME"), days=7) == "`d` >= DATETIME_SUB(CURRENT_DATETIME(), INTERVAL 7 DAY)"
+    assert _recent_partitions_filter(table(None), days=7) == "`_PARTITIONTIME` >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)"
+    assert _recent_partitions_filter(table("d", time=False)) is None